@@ -0,0 +1,209 @@
+# Computer opponent driving a paddle, paddle_2 by default
+#
+# Every frame the opponent looks along the predicted path of each puck (see
+# predict.py) at a spread of times ahead, and works out for all of them at
+# once where the paddle would have to be to hit the puck towards the other
+# goal. The earliest of these intercepts that the paddle can reach in time,
+# from a legal location, is the one it goes for: it winds up behind the
+# intercept and then strikes through it. With nothing to reach it guards
+# its goal.
+#
+# The opponent only picks where the paddle should be at the end of the
+# frame. The game moves it there like it moves the mouse's paddle, through
+# Simulation.step_paddles(), so the paddle hits the puck the same way.
+#
+# Difficulty levels look at more intercepts and move the paddle faster.
+# Thinking has to fit in a budget: when a frame takes longer, the opponent
+# looks at fewer intercepts from then on, and at more again once there's
+# time to spare. Without a budget the opponent always looks at all of its
+# intercepts, and plays the same way every run.
+
+import time
+
+import numpy as np
+
+import physics
+from predict import Predictor
+from vector import Vector
+
+# Level -> (intercepts looked at per puck, top paddle speed in mm/s)
+levels = {
+    'easy': (8, 1500),
+    'medium': (32, 3000),
+    'hard': (128, 5000),
+}
+
+# Seconds of thinking a frame can take
+budget = .001
+
+# Seconds ahead intercepts are looked for
+look_ahead = 1.5
+
+# Distance in millimeters the paddle winds up behind an intercept before
+# striking through it at top speed
+windup = 150
+
+# Distance in millimeters in front of its goal the paddle guards from
+guard_x = 150
+
+class Opponent:
+
+    def __init__(self, sim, level='medium', paddle=None, dt=1/physics.clock_freq,
+                 budget=budget):
+
+        if level not in levels:
+            raise ValueError("unknown level %r, expected one of %s"
+                             % (level, ", ".join(levels)))
+
+        self.sim = sim
+        self.paddle = sim.paddle_2 if paddle is None else paddle
+        (self.max_candidates, self.max_speed) = levels[level]
+        self.candidates = self.max_candidates
+        self.budget = budget
+
+        # Bounces off circles follow Puck.move for a single puck only
+        self.predictor = Predictor(sim, dt=dt if len(sim.pucks) == 1 else None)
+
+        table = sim.table
+        radius = self.paddle.radius
+        if self.paddle.left:
+            self.aim = (table.x_len + table.border_width, table.y_len / 2)
+            self.guard_x = guard_x
+            # x range Paddle.invalid_loc() allows
+            self.x_range = (radius, min(table.x_len - radius,
+                            (table.x_len + table.mid_line_width) / 2 - radius))
+        else:
+            self.aim = (-table.border_width, table.y_len / 2)
+            self.guard_x = table.x_len - guard_x
+            self.x_range = (max(radius, (table.x_len - table.mid_line_width) / 2
+                            + radius), table.x_len - radius)
+        self.y_range = (radius, table.y_len - radius)
+
+        # Segments of the last path looked at, and the same as an array
+        self.segments = None
+        self.segment_array = None
+        # Times ahead the intercepts are looked at
+        self.times = ()
+
+        # Seconds the last frame's thinking took, and frames over budget
+        self.think_time = 0
+        self.overruns = 0
+
+    # Where the paddle should be frame_time seconds from now
+    def target(self, frame_time):
+
+        start = time.perf_counter()
+
+        location = self.paddle.location
+        best = None
+        for puck in self.sim.pucks:
+            if puck in self.sim.scored:
+                continue
+            intercept = self.intercept(puck)
+            if intercept is not None and (best is None or intercept[0] < best[0]):
+                best = intercept
+
+        reach = self.max_speed * frame_time
+        if best is None:
+            goal = self.guard()
+        else:
+            (t, c_x, c_y, u_x, u_y) = best
+            strike_time = windup / self.max_speed
+            # Where the paddle should be at the end of the frame: on its way
+            # to the wind up point, or along the strike, arriving at the
+            # intercept with the puck
+            back = windup if t > strike_time + frame_time \
+                   else self.max_speed * (t - frame_time)
+            goal = Vector(c_x - back * u_x, c_y - back * u_y)
+
+        move = goal - location
+        distance = move.mag()
+        if distance > reach:
+            goal = location + (reach / distance) * move
+
+        if self.invalid(goal):
+            goal = location.copy()
+
+        self.think_time = time.perf_counter() - start
+        if self.budget is not None:
+            if self.think_time > self.budget:
+                self.overruns += 1
+                self.candidates = max(4, self.candidates // 2)
+            elif self.think_time < self.budget / 4:
+                self.candidates = min(self.max_candidates, 2 * self.candidates)
+
+        return goal
+
+    # Earliest intercept of the puck the paddle can make, as (time, paddle
+    # location at contact, direction of the strike), or None
+    def intercept(self, puck):
+
+        path = self.predictor.predict(puck)
+        if path.segments is not self.segments:
+            self.segments = path.segments
+            self.segment_array = np.array([(s.time, s.x, s.y, s.v_x, s.v_y)
+                                           for s in path.segments])
+        seg = self.segment_array
+
+        if len(self.times) != self.candidates:
+            n = self.candidates
+            self.times = np.linspace(look_ahead / n, look_ahead, n)
+        t = self.times[self.times <= path.end - path.start]
+        if len(t) == 0:
+            return None
+
+        # Puck locations at the times
+        times = path.start + t
+        i = np.searchsorted(seg[:, 0], times, side='right') - 1
+        elapsed = times - seg[i, 0]
+        p_x = seg[i, 1] + seg[i, 3] * elapsed
+        p_y = seg[i, 2] + seg[i, 4] * elapsed
+
+        # Strike directions, towards the middle of the other goal
+        u_x = self.aim[0] - p_x
+        u_y = self.aim[1] - p_y
+        length = np.hypot(u_x, u_y)
+        length[length == 0] = 1
+        u_x /= length
+        u_y /= length
+
+        # Paddle locations touching the puck, and winding up
+        touch = self.paddle.radius + puck.radius
+        c_x = p_x - touch * u_x
+        c_y = p_y - touch * u_y
+        s_x = c_x - windup * u_x
+        s_y = c_y - windup * u_y
+
+        location = self.paddle.location
+        ok = self.valid(c_x, c_y) & self.valid(s_x, s_y) \
+             & (np.hypot(s_x - location.x, s_y - location.y)
+                <= self.max_speed * (t - windup / self.max_speed))
+
+        k = np.flatnonzero(ok)
+        if len(k) == 0:
+            return None
+        k = k[0]
+        return (t[k], c_x[k], c_y[k], u_x[k], u_y[k])
+
+    # Where to wait in front of the goal, across from where the puck will
+    # come in
+    def guard(self):
+
+        table = self.sim.table
+        y = table.y_len / 2
+        crossings = [self.predictor.predict(puck).crossing_x(self.guard_x)
+                     for puck in self.sim.pucks if puck not in self.sim.scored]
+        crossings = [crossing for crossing in crossings if crossing is not None]
+        if crossings:
+            y = min(crossings, key=lambda crossing: crossing[0])[1].y
+        y = min(max(y, table.goal_y_low), table.goal_y_high)
+        return Vector(self.guard_x, y)
+
+    # Locations of the arrays that Paddle.invalid_loc() allows
+    def valid(self, x, y):
+        return (x >= self.x_range[0]) & (x <= self.x_range[1]) \
+               & (y >= self.y_range[0]) & (y <= self.y_range[1])
+
+    def invalid(self, location):
+        return physics.invalid_paddle_loc(location, self.paddle.radius, self.paddle.left,
+                                          self.sim.table)
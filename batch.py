@@ -0,0 +1,334 @@
+# Batched simulator stepping many independent tables in lockstep
+#
+# Every table has its own puck, paddles and ghost flags but they all share
+# the static walls and corner circles of one collidables list. Positions and
+# velocities are kept in NumPy arrays and the coll_time() logic of
+# collidables.py is evaluated for all tables at once, including the bounces
+# that happen inside one clock cycle.
+#
+# A puck gliding in a straight line hits the same object at the same time
+# until something about its table changes, so every table keeps the time
+# of its next collision. Tables whose next collision is beyond the clock
+# cycle just glide, without working out collision times again. A table
+# whose puck, paddles or ghost flags were changed between steps, e.g. by
+# env.py, has its collision times worked out afresh.
+
+import numpy as np
+
+import collidables
+import physics
+from coll_table import CollisionTable
+
+# Seconds of slack on the next collision time of a gliding table, for the
+# rounding of gliding there step by step rather than in one go
+free_margin = 1e-6
+
+# Collision times of pucks against a group of walls facing the same way
+#
+# p and v_p are the puck positions and velocities along the wall normal, q
+# and v_q along the walls, all (n, 1). facing is -1 for walls hit while
+# moving towards +p and 1 for walls hit while moving towards -p. wall_off is
+# where the puck center is when it touches each wall and gate_off is where
+# the center is once the puck has gone past it: finite walls stop colliding
+# once the edge of the puck is past them, infinite ones once its center is.
+# low and high bound the span of each wall along q.
+# Returns an (n, walls) array which is inf where there is no collision
+def wall_times(p, q, v_p, v_q, inv_v_p, facing, wall_off, gate_off, low, high):
+
+    with np.errstate(invalid='ignore'):
+        times = (wall_off - p) * inv_v_p
+        coll_q = q + times * v_q
+
+    if facing < 0:
+        valid = (v_p > 0) & (p <= gate_off)
+    else:
+        valid = (v_p < 0) & (p >= gate_off)
+    valid &= (coll_q >= low) & (coll_q <= high)
+
+    return np.where(valid, times, np.inf)
+
+# Collision times of pucks against circles, see Circle.coll_time()
+#
+# x, y, v_x and v_y are the puck locations and velocities, all (n, 1).
+# c_x and c_y are the circle centers, (circles,) for circles shared by every
+# table or (n, circles) for circles that differ per table. r_sum_sq is the
+# square of the circle radii plus the puck radius.
+# Returns an (n, circles) array which is inf where there is no collision
+def circle_times(x, y, v_x, v_y, c_x, c_y, r_sum_sq):
+
+    d_x = c_x - x
+    d_y = c_y - y
+    speed_sq = v_x * v_x + v_y * v_y
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_speed = 1 / np.sqrt(speed_sq)
+        # Distance travelled to the point of minimum distance
+        dot = d_x * v_x + d_y * v_y
+        # Closest distance between the circle centers along the path, squared
+        cross = d_x * v_y - d_y * v_x
+        disc = r_sum_sq - cross * cross / speed_sq
+        times = (dot * inv_speed - np.sqrt(disc)) * inv_speed
+
+    valid = (dot >= 0) & (disc > 0) & (speed_sq > 0) \
+            & ((d_x != 0) | (d_y != 0))
+
+    return np.where(valid, times, np.inf)
+
+# Velocities of pucks after hitting circles, see Circle.collide_velocity()
+#
+# All arrays have one row per colliding puck
+def circle_velocities(location, velocity, centers, circ_velocity, coll_const,
+                      max_velocity):
+
+    normal = centers - location
+    normal = normal / np.hypot(normal[:, 0], normal[:, 1])[:, None]
+
+    circ_proj = np.sum(circ_velocity * normal, axis=1)[:, None] * normal
+    puck_proj = np.sum(velocity * normal, axis=1)[:, None] * normal
+
+    new_vel = velocity + (1 + coll_const)[:, None] * (circ_proj - puck_proj)
+
+    speed = np.hypot(new_vel[:, 0], new_vel[:, 1])
+    too_fast = speed > max_velocity
+    new_vel[too_fast] *= (max_velocity / speed[too_fast])[:, None]
+
+    return new_vel
+
+# N tables stepped together
+class Batch:
+
+    # Build n copies of the table made of the given collidable objects.
+    # Every table starts with the puck at its base location and velocity.
+    # Paddles become per table paddles, other circles and walls are shared
+    # by all tables
+    def __init__(self, n, objects, puck):
+
+        self.n = n
+        self.radius = float(puck.radius)
+        self.max_velocity = puck.max_velocity
+        self.base_location = np.array([puck.base_location.x, puck.base_location.y],
+                                      dtype=float)
+        self.base_velocity = np.array([puck.base_velocity.x, puck.base_velocity.y],
+                                      dtype=float)
+
+        table = CollisionTable(objects)
+
+        paddles = []
+        for (obj, index) in table.dynamic:
+            if not isinstance(obj, physics.Paddle):
+                raise TypeError("Can't batch collidable " + type(obj).__name__)
+            paddles.append(obj)
+
+        # Per group: (axis, facing, wall_off, gate_off, low, high), see
+        # wall_times()
+        self.walls = []
+        # Axis of the velocity flipped by each wall
+        axes = []
+        for ((axis, facing), group) in table.walls.items():
+            if not group:
+                continue
+            (pos, low, high, gate, index) = np.array(group, dtype=float).T
+            self.walls.append((axis, facing,
+                               (pos + facing * self.radius)[None, :],
+                               (pos + facing * gate * self.radius)[None, :],
+                               low[None, :], high[None, :]))
+            axes.extend([axis] * len(group))
+        self.wall_axis = np.array(axes, dtype=int)
+
+        circles = table.circles
+        self.circ_x = np.array([c[0] for c in circles], dtype=float)
+        self.circ_y = np.array([c[1] for c in circles], dtype=float)
+        self.circ_r_sq = np.array([(c[2] + self.radius) ** 2 for c in circles],
+                                  dtype=float)
+
+        # Per table paddles, in the order of the pad_* arrays
+        self.paddles = paddles
+        self.pad_r_sq = np.array([(p.radius + self.radius) ** 2 for p in paddles],
+                                 dtype=float)
+        self.pad_coll_const = np.array([p.coll_const for p in paddles], dtype=float)
+        self.pad_location = np.tile(
+            np.array([[p.location.x, p.location.y] for p in paddles],
+                     dtype=float).reshape(-1, 2), (n, 1, 1))
+        self.pad_velocity = np.tile(
+            np.array([[p.velocity.x, p.velocity.y] for p in paddles],
+                     dtype=float).reshape(-1, 2), (n, 1, 1))
+
+        # Column offsets of each object group in the collision time table
+        self.circ_start = len(self.wall_axis)
+        self.pad_start = self.circ_start + len(circles)
+        self.n_objects = self.pad_start + len(paddles)
+
+        # Objects each table pretends don't exist, see Puck.move()
+        self.ghost = np.zeros((n, self.n_objects), dtype=bool)
+        self.ghost[:, self.pad_start:] = [p.ghost for p in paddles]
+
+        # Fraction of velocity pucks retain when hitting walls and corners
+        self.wall_coll_const = np.full(n, collidables.wall_coll_const)
+
+        self.location = np.tile(self.base_location, (n, 1))
+        self.velocity = np.tile(self.base_velocity, (n, 1))
+
+        # Seconds from the end of the last step until each puck hits
+        # something, and the state of the tables it holds for
+        self.free_time = np.zeros(n)
+        self.seen = None
+
+    # Collision times of the pucks of the given tables against every object
+    def coll_times(self, rows):
+
+        loc = self.location[rows]
+        vel = self.velocity[rows]
+        x = loc[:, 0:1]
+        y = loc[:, 1:2]
+        v_x = vel[:, 0:1]
+        v_y = vel[:, 1:2]
+        with np.errstate(divide='ignore'):
+            inv_v = 1 / vel
+        inv_v_x = inv_v[:, 0:1]
+        inv_v_y = inv_v[:, 1:2]
+
+        times = []
+        for (axis, facing, wall_off, gate_off, low, high) in self.walls:
+            if axis == 0:
+                times.append(wall_times(x, y, v_x, v_y, inv_v_x, facing,
+                                        wall_off, gate_off, low, high))
+            else:
+                times.append(wall_times(y, x, v_y, v_x, inv_v_y, facing,
+                                        wall_off, gate_off, low, high))
+        times.append(circle_times(x, y, v_x, v_y, self.circ_x, self.circ_y,
+                                  self.circ_r_sq))
+        pads = self.pad_location[rows]
+        times.append(circle_times(x, y, v_x, v_y, pads[..., 0], pads[..., 1],
+                                  self.pad_r_sq))
+
+        times = np.concatenate(times, axis=1)
+        times[self.ghost[rows]] = np.inf
+        return times
+
+    # Update the pucks of the given tables after hitting objects
+    def collide(self, rows, objs):
+
+        vel = self.velocity
+
+        wall = objs < self.circ_start
+        if wall.any():
+            w_rows = rows[wall]
+            axis = self.wall_axis[objs[wall]]
+            vel[w_rows, axis] *= -self.wall_coll_const[w_rows]
+
+        circ = (objs >= self.circ_start) & (objs < self.pad_start)
+        if circ.any():
+            c_rows = rows[circ]
+            c_objs = objs[circ] - self.circ_start
+            centers = np.stack([self.circ_x[c_objs], self.circ_y[c_objs]], axis=1)
+            vel[c_rows] = circle_velocities(
+                self.location[c_rows], vel[c_rows], centers,
+                np.zeros((len(c_rows), 2)), self.wall_coll_const[c_rows],
+                self.max_velocity)
+
+        pad = objs >= self.pad_start
+        if pad.any():
+            p_rows = rows[pad]
+            p_objs = objs[pad] - self.pad_start
+            vel[p_rows] = circle_velocities(
+                self.location[p_rows], vel[p_rows],
+                self.pad_location[p_rows, p_objs],
+                self.pad_velocity[p_rows, p_objs], self.pad_coll_const[p_objs],
+                self.max_velocity)
+
+    # Tables whose pucks, paddles or ghost flags changed since the last step
+    # Ghosting more objects can only put off collisions, so only flags that
+    # were cleared count. The arrays are searched flat, as reducing their
+    # short rows one at a time is many times slower
+    def changed(self):
+
+        changed = np.zeros(self.n, dtype=bool)
+        if self.seen is None:
+            changed[:] = True
+            return changed
+        for (now, seen) in zip(self.state(), self.seen):
+            if now.dtype == bool:
+                flat = np.flatnonzero(seen > now)
+            else:
+                flat = np.flatnonzero(now != seen)
+            changed[flat // (now.size // self.n)] = True
+        return changed
+
+    # The arrays changed() compares
+    def state(self):
+        return (self.location, self.velocity, self.pad_location, self.ghost)
+
+    # Update every table by one clock cycle, see Puck.move()
+    def step(self):
+
+        cycle = 1/physics.clock_freq
+        time_left = np.full(self.n, cycle)
+
+        # Tables that won't hit anything this cycle glide through it, the
+        # others moving by nothing, as multiplying beats picking rows out
+        free = (self.free_time > cycle + free_margin) & ~self.changed()
+        self.location += (cycle * free)[:, None] * self.velocity
+        self.free_time -= cycle
+        # Tables that haven't finished their clock cycle
+        rows = np.flatnonzero(~free)
+        self.free_time[rows] = 0
+
+        self.bounce(rows, time_left)
+        if self.seen is None:
+            self.seen = tuple(array.copy() for array in self.state())
+        else:
+            for (now, seen) in zip(self.state(), self.seen):
+                np.copyto(seen, now)
+
+    # Move the pucks of the given tables for their time_left, bouncing
+    def bounce(self, rows, time_left):
+
+        for i in range(physics.max_bounces):
+
+            if rows.size == 0:
+                return
+
+            times = self.coll_times(rows)
+            objs = np.argmin(times, axis=1)
+            coll_time = times[np.arange(rows.size), objs]
+
+            # Weird paddle movement happened
+            # Pretend that the object doesn't exist
+            behind = coll_time < 0
+            self.ghost[rows[behind], objs[behind]] = True
+
+            hit = (coll_time <= time_left[rows]) & ~behind
+            glide = ~hit & ~behind
+
+            # Like Puck.move, bounce velocities are worked out from where the
+            # puck was at the start of the sub-step
+            velocity = self.velocity[rows]
+            self.collide(rows[hit], objs[hit])
+
+            dt = np.where(hit, coll_time, time_left[rows])
+            dt[behind] = 0
+            self.location[rows] += dt[:, None] * velocity
+            time_left[rows] -= dt
+            time_left[rows[glide]] = 0
+            self.free_time[rows[glide]] = coll_time[glide] - dt[glide]
+
+            rows = rows[time_left[rows] > 0]
+
+        # Out of bounces, glide for the rest of the cycle
+        self.location[rows] += time_left[rows, None] * self.velocity[rows]
+
+    # Has a goal just been scored on each table?
+    # Returns an array of 0 if no goal, -1 if left goal, 1 if right goal
+    def goals(self, table):
+
+        x = self.location[:, 0]
+        return np.where(x > table.x_len + table.border_width, -1,
+                        np.where(x < -table.border_width, 1, 0))
+
+    # Put the pucks of the tables selected by mask back to their base state
+    def reset(self, mask=None):
+
+        if mask is None:
+            mask = slice(None)
+        self.location[mask] = self.base_location
+        self.velocity[mask] = self.base_velocity
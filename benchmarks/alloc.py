@@ -0,0 +1,105 @@
+# Memory allocated by Puck.move, before and after the in place vector path
+#
+# "before" is the original move loop: a list of coll_time() calls per
+# sub-step and a new Vector for every operation. "after" is Puck.move on a
+# CollisionTable.
+#
+# Run from the repository root:
+#   python -m benchmarks.alloc [cycles]
+
+import sys
+import tracemalloc
+
+import physics
+import util
+import vector
+from vector import Vector
+
+# Puck.move as it was before vectors were updated in place
+def legacy_move(puck, collidables):
+
+    time_left = 1/physics.clock_freq
+
+    while time_left > 0:
+
+        coll_times = [obj.coll_time(puck) for obj in collidables]
+        min_pos = util.min_pos(coll_times)
+
+        if min_pos is None or coll_times[min_pos] > time_left:
+            new_loc = puck.location + (time_left * puck.velocity)
+            new_vel = puck.velocity
+            time_left = 0
+        else:
+            coll_time = coll_times[min_pos]
+            if coll_time < 0:
+                collidables[min_pos].ghost = True
+                continue
+            new_loc = puck.location + (coll_time * puck.velocity)
+            new_vel = collidables[min_pos].collide_velocity(puck, new_loc)
+            time_left = time_left - coll_time
+
+        puck.location = new_loc
+        puck.velocity = new_vel
+
+# Vectors created while running moves, counted by wrapping Vector.__init__
+class Vector_Counter:
+
+    def __init__(self):
+        self.count = 0
+        self.init = Vector.__init__
+
+    def __enter__(self):
+        counter = self
+        init = self.init
+        def counting_init(self, x, y):
+            counter.count += 1
+            init(self, x, y)
+        Vector.__init__ = counting_init
+        return self
+
+    def __exit__(self, *args):
+        Vector.__init__ = self.init
+
+# (peak bytes above the steady state, vectors created) per move
+def measure(move, cycles):
+
+    sim = physics.Simulation()
+    sim.puck.velocity = Vector(4200, 2600)
+    collidables = sim.coll_table if move is None else sim.collidables
+
+    def run():
+        if move is None:
+            sim.puck.move(collidables)
+        else:
+            move(sim.puck, collidables)
+
+    # Warm up scratch space and caches
+    for i in range(10):
+        run()
+
+    peak = 0
+    tracemalloc.start()
+    for i in range(cycles):
+        (current, ignored) = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    with Vector_Counter() as counter:
+        for i in range(cycles):
+            run()
+
+    return (peak, counter.count / cycles)
+
+def main():
+
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    print("Vector size: %d bytes" % sys.getsizeof(Vector(0, 0)))
+    for (name, move) in [("before", legacy_move), ("after", None)]:
+        (peak, vectors) = measure(move, cycles)
+        print("%-7s peak %5d bytes/move, %5.2f vectors/move" % (name, peak, vectors))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Cross-check the batched simulator against Puck.move and time both
+#
+# In the timings a puck that scores is served again, from the middle with
+# its serve, so every table keeps playing rather than gliding off the table
+# for the rest of the run.
+#
+# Run from the repository root:
+#   python -m benchmarks.batch [tables] [cycles]
+
+import math
+import random
+import sys
+import time
+
+import numpy as np
+
+import physics
+from batch import Batch
+from vector import Vector
+
+# Random serves: any angle, up to 8 m/s
+def serves(n, seed=0):
+    rand = random.Random(seed)
+    result = []
+    for i in range(n):
+        speed = rand.uniform(500, 8000)
+        ang = rand.uniform(-math.pi, math.pi)
+        result.append((speed * math.cos(ang), speed * math.sin(ang)))
+    return result
+
+# Largest distance between the batched pucks and Puck.move run on the same
+# serves, over the first few tables
+def max_error(velocities, cycles, checked=100):
+
+    sim = physics.Simulation()
+    tables = Batch(checked, sim.collidables, sim.puck)
+    tables.velocity[:] = velocities[:checked]
+
+    for cycle in range(cycles):
+        tables.step()
+
+    error = 0
+    for (i, (v_x, v_y)) in enumerate(velocities[:checked]):
+        sim = physics.Simulation()
+        sim.puck.velocity = Vector(v_x, v_y)
+        for cycle in range(cycles):
+            sim.puck.move(sim.collidables)
+        (x, y) = tables.location[i]
+        error = max(error, math.hypot(x - sim.puck.location.x,
+                                      y - sim.puck.location.y))
+    return error
+
+def main():
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 120
+
+    velocities = np.array(serves(n))
+
+    print("max error after %d cycles: %.3g mm" % (cycles, max_error(velocities, cycles)))
+
+    # Scalar reference
+    scalar_tables = 200
+    start = time.perf_counter()
+    for (v_x, v_y) in velocities[:scalar_tables]:
+        sim = physics.Simulation()
+        sim.puck.velocity = Vector(v_x, v_y)
+        for cycle in range(cycles):
+            sim.puck.move(sim.collidables)
+            if sim.puck.goal(sim.table):
+                sim.puck.reset()
+                sim.puck.velocity = Vector(v_x, v_y)
+    scalar_rate = scalar_tables * cycles / (time.perf_counter() - start)
+
+    sim = physics.Simulation()
+    tables = Batch(n, sim.collidables, sim.puck)
+    tables.velocity[:] = velocities
+    start = time.perf_counter()
+    for cycle in range(cycles):
+        tables.step()
+        scored = tables.goals(sim.table) != 0
+        if scored.any():
+            tables.reset(scored)
+            tables.velocity[scored] = velocities[scored]
+    batch_rate = n * cycles / (time.perf_counter() - start)
+
+    print("Puck.move: %12.0f table-steps/s" % scalar_rate)
+    print("Batch:     %12.0f table-steps/s (n=%d)" % (batch_rate, n))
+    print("speedup:   %12.1fx" % (batch_rate / scalar_rate))
+
+if __name__ == "__main__":
+    main()
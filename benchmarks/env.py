@@ -0,0 +1,94 @@
+# Check VecEnv against Env and time both, in environment steps per second
+#
+# The agent mirrors the guard on its own side, so the puck is hit back and
+# forth rather than gliding. The check runs each table of a VecEnv next to
+# an Env served the same way, until its first episode ends. Like Batch and
+# Puck.move, they agree to rounding, so a table can part ways with its Env
+# where the puck grazes a paddle and rounding decides whether it's hit.
+#
+# Run from the repository root:
+#   python -m benchmarks.env [seconds]
+
+import sys
+import time
+
+import numpy as np
+
+import env
+import physics
+from vector import Vector
+
+# Targets for the agents' paddles, guarding the right goal
+def agent_actions(obs, table):
+    puck = obs[:, 0:2].astype(float)
+    paddle = obs[:, 4:6].astype(float)
+    # Mirror the table, guard, and mirror back
+    mirror = np.array([table.x_len, 0])
+    flip = np.array([-1, 1])
+    targets = env.guard(mirror + flip * puck, mirror + flip * paddle, table,
+                        physics.Simulation(table).paddle_1.radius)
+    return mirror + flip * targets
+
+# Tables that followed their Env through the first episode, and the steps
+# the others parted at
+def check(k=50, steps=600):
+
+    vec = env.VecEnv(k, seed=1)
+    obs = vec.reset()
+    singles = []
+    for i in range(k):
+        single = env.Env()
+        single.reset()
+        single.sim.puck.velocity = Vector(*vec.batch.velocity[i])
+        singles.append(single)
+
+    live = np.ones(k, dtype=bool)
+    parted = {}
+    for step in range(steps):
+        actions = agent_actions(obs, vec.table)
+        (obs, reward, terminated, truncated, info) = vec.step(actions)
+        final = info.get('final_observation', obs)
+        for i in np.flatnonzero(live):
+            (single_obs, single_reward, single_term, single_trunc, single_info) = \
+                singles[i].step(actions[i])
+            if single_reward != reward[i] or \
+               np.abs(single_obs - final[i]).max() > 1e-3:
+                parted[i] = step
+                live[i] = False
+            elif single_term or single_trunc:
+                live[i] = False
+    return (k - len(parted), sorted(parted.values()))
+
+def throughput(make, k, seconds):
+
+    e = make()
+    obs = e.reset()
+    table = e.table if k else e.sim.table
+    rng = np.random.default_rng(0)
+    actions = rng.uniform([1600, 100], [2900, 900], (256, max(k, 1), 2))
+    if not k:
+        actions = actions[:, 0]
+
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for action in actions:
+            e.step(action)
+        steps += len(actions)
+    return steps * max(k, 1) / (time.perf_counter() - start)
+
+def main():
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+
+    (matched, parted) = check()
+    print("%d tables followed Env through an episode, %d parted at steps %s"
+          % (matched, len(parted), parted))
+    print("%-12s %14s" % ("", "env-steps/s"))
+    print("%-12s %14.0f" % ("Env", throughput(env.Env, 0, seconds)))
+    for k in [1, 64, 1024]:
+        print("%-12s %14.0f" % ("VecEnv(%d)" % k,
+              throughput(lambda: env.VecEnv(k, seed=0), k, seconds)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Check the event driven simulation against the predictor and time it
+#
+# With the paddles ghosted, Events and Predictor(sim, dt=None) bounce the
+# puck off the same objects at the same points, so for random serves they
+# should score the same goals at the same times, and put the puck in the
+# same place when nobody scores. Times are for two seconds of play per
+# serve: Events, a predicted path, and stepping the simulation in clock
+# cycles.
+#
+# Run from the repository root:
+#   python -m benchmarks.events [serves]
+
+import math
+import random
+import sys
+import time
+
+import events
+import physics
+import predict
+from vector import Vector
+
+# Seconds of play per serve
+seconds = 2.0
+
+def serve(sim, rng):
+    sim.reset()
+    for paddle in [sim.paddle_1, sim.paddle_2]:
+        paddle.ghost = True
+    angle = rng.uniform(0, 2 * math.pi)
+    speed = rng.uniform(1000, 6000)
+    sim.puck.velocity = Vector(speed * math.cos(angle), speed * math.sin(angle))
+
+# Serves Events and the predictor agree on, and the first that they don't
+def check(serves):
+
+    rng = random.Random(0)
+    sim = physics.Simulation()
+    predictor = predict.Predictor(sim, horizon=seconds, dt=None)
+    (agreed, parted) = (0, None)
+
+    for i in range(serves):
+        serve(sim, rng)
+        path = predictor.predict(sim.puck)
+        predictor.invalidate()
+        ev = events.Events(sim)
+        goal = ev.advance_to(seconds)
+
+        if path.end <= seconds:
+            same = goal == path.goal() and math.isclose(ev.time, path.end, abs_tol=1e-9)
+        else:
+            expected = path.at(seconds)
+            same = not goal and (sim.puck.location - expected).mag() < 1e-6
+        if same:
+            agreed += 1
+        elif parted is None:
+            parted = i
+        if goal:
+            # A goal counts once until the puck is served
+            same = not ev.advance_to(seconds) and not ev.fast_forward()
+            agreed -= not same
+    return (agreed, parted)
+
+def main():
+
+    serves = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    (agreed, parted) = check(serves)
+    print("%d/%d serves agree with the predictor%s" % (agreed, serves,
+          "" if parted is None else ", first parting at serve %d" % parted))
+
+    rng = random.Random(1)
+    sim = physics.Simulation()
+    predictor = predict.Predictor(sim, horizon=seconds, dt=None)
+    times = {}
+
+    start = time.perf_counter()
+    for i in range(serves):
+        serve(sim, rng)
+        events.Events(sim).advance_to(seconds)
+    times['events'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(serves):
+        serve(sim, rng)
+        predictor.invalidate()
+        predictor.predict(sim.puck)
+    times['predict'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(serves):
+        serve(sim, rng)
+        for step in range(round(seconds * physics.clock_freq)):
+            if sim.step():
+                break
+    times['stepped'] = time.perf_counter() - start
+
+    print("%g s of play per serve, ms per serve:" % seconds)
+    for (name, t) in times.items():
+        print("  %-8s %8.3f" % (name, 1e3 * t / serves))
+
+if __name__ == "__main__":
+    main()
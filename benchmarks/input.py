@@ -0,0 +1,111 @@
+# Cost of paddle input per frame and the paddle speeds it gives, against the
+# input rate
+#
+# A paddle is swept back and forth across its half of the table at a known
+# speed, sampled at each rate, with the puck in its way. Two ways of feeding
+# the samples to the physics are compared:
+#
+#   per event   Paddle.start_move() for every sample, each as if it took a
+#               whole clock cycle, then the physics steps of the frame
+#   path        the samples of a frame handed to a Paddle_Path as arrays,
+#               as the game does with the shared memory ring, and cut into
+#               the physics steps, see paddle_input.py
+#
+# Run from the repository root:
+#   python -m benchmarks.input [seconds]
+
+import sys
+import time
+
+import numpy as np
+
+import physics
+from paddle_input import Paddle_Path
+from vector import Vector
+
+fps = 60
+# Speed the paddle is swept at in mm/s, and the points it's swept between
+speed = 2000
+ends = (Vector(2200, 200), Vector(2200, 800))
+
+# Where the sweep puts the paddle t seconds in
+def sweep(t):
+    length = (ends[1] - ends[0]).mag()
+    along = (speed * t) % (2 * length)
+    along = min(along, 2 * length - along)
+    return ends[0] + (along / length) * (ends[1] - ends[0])
+
+def new_sim():
+    sim = physics.Simulation()
+    sim.paddle_1.location = ends[0].copy()
+    sim.paddle_1.new_location = ends[0].copy()
+    return sim
+
+# Put the puck back in the way of the paddle when it's been knocked off
+def reset_puck(sim):
+    puck = sim.puck
+    if sim.scored or puck.location.x < 1600 or puck.velocity.mag() > 100:
+        sim.scored = []
+        puck.location = Vector(2350, 500)
+        puck.velocity = Vector(0, 0)
+
+# Returns (microseconds per frame, microseconds of them handling the input,
+# fastest paddle speed in mm/s)
+def run(rate, seconds, coalesce):
+
+    sim = new_sim()
+    paddle = sim.paddle_1
+    dt = 1/physics.clock_freq
+    frame = 1/fps
+    steps = round(frame / dt)
+    path = Paddle_Path()
+    top = 0
+    elapsed = 0
+    handling = 0
+
+    for i in range(round(seconds * fps)):
+
+        # Samples that came in since the last frame, as (location, timestamp)
+        samples = [(sweep(k / rate), k * 10**9 // rate)
+                   for k in range(-(-i * rate // fps), -(-(i + 1) * rate // fps))]
+        reset_puck(sim)
+        if coalesce:
+            # The fields of Shm_Ring.backlog_array()
+            x = np.array([location.x for (location, timestamp) in samples])
+            y = np.array([location.y for (location, timestamp) in samples])
+            stamps = np.array([timestamp for (location, timestamp) in samples])
+
+        start = time.perf_counter()
+        if coalesce:
+            path.extend(x, y, stamps)
+            moves = path.steps(paddle.location.copy(), steps, dt)
+            handling += time.perf_counter() - start
+            for (location, points) in moves:
+                sim.step_paddles({paddle: location}, dt, {paddle: points})
+                top = max(top, paddle.velocity.mag())
+        else:
+            for (location, timestamp) in samples:
+                paddle.start_move(location, sim.table, sim.puck)
+                top = max(top, paddle.velocity.mag())
+                paddle.end_move(sim.table, sim.puck)
+            for k in range(steps):
+                sim.step()
+        elapsed += time.perf_counter() - start
+
+    frames = round(seconds * fps)
+    return (1e6 * elapsed / frames, 1e6 * handling / frames, top)
+
+def main():
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print("paddle swept at %d mm/s, %d frames/s, %d physics steps/s"
+          % (speed, fps, physics.clock_freq))
+    for rate in [60, 125, 500, 1000, 4000, 8000]:
+        (event_cost, handling, event_top) = run(rate, seconds, False)
+        (path_cost, handling, path_top) = run(rate, seconds, True)
+        print("%5d Hz   per event %7.1f us/frame, top speed %5.0f mm/s   "
+              "path %6.1f us/frame, %5.1f of them input, top speed %5.0f mm/s"
+              % (rate, event_cost, event_top, path_cost, handling, path_top))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# Cross-check of the collision kernels against the reference physics, and
+# the speed of Puck.move on every backend
+#
+# The kernels in kernels.py are checked as plain Python, and compiled too
+# when Numba is installed:
+#
+#   first collision  random pucks, paddles moving and ghosted, against
+#                    coll_time() of every collidable
+#   move             one clock cycle of Puck.move from random states,
+#                    against Puck.move over the plain list of collidables,
+#                    the kernel run through Puck.move_packed() so the
+#                    packing and the ghost flags are checked as well
+#
+# tests/test_kernels.py runs the same checks under pytest.
+#
+# Times and locations have to agree to rounding. The exit status is 1 if
+# they don't. A puck resting against a moving paddle is hit again after
+# about 1e-17 s, where rounding decides between another bounce and ghosting
+# the paddle; moves that split there are counted apart, not as mismatches.
+#
+# Run from the repository root:
+#   python -m benchmarks.kernels [cases]
+
+import math
+import random
+import sys
+import time
+
+import kernels
+import physics
+from vector import Vector
+
+# Relative and absolute tolerance on times, locations and velocities
+tolerance = 1e-9
+
+def close(a, b):
+    return abs(a - b) <= tolerance * max(1, abs(a), abs(b))
+
+# Collision times in s below which the puck is taken to be in contact
+contact_time = 1e-12
+
+# A table with the paddles somewhere random, moving or ghosted, and a puck
+# anywhere the game can put it, heading anywhere
+def random_sim(rng):
+
+    sim = physics.Simulation()
+    table = sim.table
+    for paddle in [sim.paddle_1, sim.paddle_2]:
+        paddle.location = Vector(rng.uniform(0, table.x_len), rng.uniform(0, table.y_len))
+        paddle.velocity = Vector(rng.uniform(-3000, 3000), rng.uniform(-3000, 3000))
+        paddle.ghost = rng.random() < .2
+
+    puck = sim.puck
+    if rng.random() < .2:
+        # In a goal mouth
+        puck.location = Vector(rng.choice([-80, table.x_len + 80]),
+                               rng.uniform(table.goal_y_low, table.goal_y_high))
+    else:
+        puck.location = Vector(rng.uniform(50, table.x_len - 50),
+                               rng.uniform(50, table.y_len - 50))
+    speed = rng.choice([0, rng.uniform(0, 10000)])
+    angle = rng.uniform(0, 2 * math.pi)
+    puck.velocity = Vector(speed * math.cos(angle), speed * math.sin(angle))
+    return sim
+
+# Errors of kernels.first_collision() against the reference
+def check_first_collision(rng, cases):
+
+    failures = 0
+    for i in range(cases):
+        sim = random_sim(rng)
+        puck = sim.puck
+        (ref_time, ref_obj) = physics.first_collision(puck, sim.collidables, None)
+
+        packed = sim.coll_table.packed()
+        packed.load()
+        (time_, kind, row) = kernels.first_collision(
+            packed.walls, packed.circle_rows, packed.skip,
+            puck.location.x, puck.location.y, puck.velocity.x, puck.velocity.y,
+            puck.radius)
+
+        if ref_obj is None:
+            ok = row < 0
+        elif row < 0:
+            ok = False
+        else:
+            # Near ties may go either way
+            ok = close(time_, ref_time)
+        if not ok:
+            failures += 1
+            if failures <= 5:
+                print("first collision mismatch: reference %r %s, kernel %r row %d"
+                      % (ref_time, type(ref_obj).__name__, time_, row))
+    return failures
+
+# Errors of Puck.move through the kernel against the reference
+def check_move(rng, cases, move):
+
+    failures = 0
+    contacts = 0
+    worst = 0
+    for i in range(cases):
+        seed = rng.random()
+        (ref, kernel) = (random_sim(random.Random(seed)), random_sim(random.Random(seed)))
+
+        # Collision times the reference move sees
+        times = []
+        def coll_times(obj):
+            query = obj.coll_time
+            def coll_time(puck):
+                result = query(puck)
+                times.append(result)
+                return result
+            return coll_time
+        for obj in ref.collidables:
+            obj.coll_time = coll_times(obj)
+
+        # A list of collidables never goes through the kernels
+        ref.puck.move(ref.collidables)
+        physics.compiled_move = move
+        kernel.puck.move(kernel.coll_table)
+        physics.compiled_move = None
+
+        pairs = [(ref.puck.location.x, kernel.puck.location.x),
+                 (ref.puck.location.y, kernel.puck.location.y),
+                 (ref.puck.velocity.x, kernel.puck.velocity.x),
+                 (ref.puck.velocity.y, kernel.puck.velocity.y)]
+        ghosts_match = all(a.ghost == b.ghost for (a, b) in
+                           zip(ref.collidables, kernel.collidables)
+                           if isinstance(a, physics.Circle))
+        if not all(close(a, b) for (a, b) in pairs) or not ghosts_match \
+                or ref.puck.bounces != kernel.puck.bounces:
+            if any(t is not None and abs(t) < contact_time for t in times):
+                contacts += 1
+                continue
+            failures += 1
+            if failures <= 5:
+                print("move mismatch: reference %s, kernel %s, bounces %d %d"
+                      % (pairs, ghosts_match, ref.puck.bounces, kernel.puck.bounces))
+        else:
+            worst = max([worst] + [abs(a - b) for (a, b) in pairs])
+    return (failures, contacts, worst)
+
+# Microseconds per Puck.move of a scenario, on the backend selected
+def time_move(location, velocity, repeats=20000):
+
+    sim = physics.Simulation()
+    puck = sim.puck
+    table = sim.coll_table
+    circles = [obj for obj in sim.collidables if isinstance(obj, physics.Circle)]
+
+    start = time.perf_counter()
+    for i in range(repeats):
+        puck.location.set(*location)
+        puck.velocity.set(*velocity)
+        for circle in circles:
+            circle.ghost = False
+        puck.move(table)
+    return 1e6 * (time.perf_counter() - start) / repeats
+
+def main():
+
+    cases = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(1)
+
+    # The kernels as plain Python
+    backends = [("kernels in Python", kernels.move)]
+    failures = check_first_collision(rng, cases)
+    print("first collision, %d cases: %d mismatches" % (cases, failures))
+
+    if physics.select_backend('numba') == 'numba':
+        backends.append(("kernels compiled", kernels.move))
+        compiled_failures = check_first_collision(rng, cases)
+        print("first collision compiled, %d cases: %d mismatches"
+              % (cases, compiled_failures))
+        failures += compiled_failures
+    else:
+        print("Numba isn't installed, the compiled kernels aren't checked")
+    physics.select_backend('python')
+
+    for (name, move) in backends:
+        (move_failures, contacts, worst) = check_move(rng, cases, move)
+        print("move, %s, %d cases: %d mismatches, %d split at a contact, "
+              "largest difference %.3g" % (name, cases, move_failures, contacts, worst))
+        failures += move_failures
+
+    print()
+    scenarios = [("open glide", (1500, 500), (3000, 1000)),
+                 ("corner pinball", (3010, 400), (2330, -8690))]
+    for (name, move) in [("python", None)] + backends:
+        physics.compiled_move = move
+        print("%-18s " % name + "  ".join("%s %6.2f us" % (scenario, time_move(*args))
+                                          for (scenario, *args) in scenarios))
+    physics.select_backend('python')
+
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Loading a large arena: compiling its layout against reading it back from
+# the cache, and building a Simulation on it
+#
+# The arena is the standard table with a field of pins and short walls, as
+# in a tournament arena. Each load starts with an empty in-memory cache, so
+# "cached" is a read of the file layout.py saved.
+#
+# Run from the repository root:
+#   python -m benchmarks.layout [obstacles]
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+import layout
+import physics
+
+def arena(n):
+    obstacles = []
+    for i in range(n):
+        (x, y) = (300 + (i * 37) % 2400, 100 + (i * 61) % 800)
+        if i % 4:
+            obstacles.append({'circle': [x, y, 5]})
+        else:
+            obstacles.append({'wall': 'horz_up', 'at': y, 'span': [x, x + 20]})
+    return {'obstacles': obstacles}
+
+# Milliseconds per call of f, best of repeats
+def best(f, repeats=5):
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return 1e3 * min(times)
+
+def main():
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    with tempfile.TemporaryDirectory() as directory:
+        layout.cache_dir = directory
+        path = os.path.join(directory, 'arena.json')
+        with open(path, 'w') as f:
+            json.dump(arena(n), f)
+
+        def parse_compile():
+            with open(path) as f:
+                layout.compile_layout(json.load(f))
+
+        def cached():
+            layout.loaded.clear()
+            layout.load(path)
+
+        compiled = layout.load(path)
+        size = os.path.getsize(os.path.join(directory, compiled.key + '.bin'))
+
+        print("%d obstacles, %d bytes compiled" % (n, size))
+        print("parse and compile     %8.2f ms" % best(parse_compile))
+        print("load from the cache   %8.2f ms" % best(cached))
+        print("Simulation on it      %8.2f ms" % best(
+            lambda: physics.Simulation(physics.Table(compiled))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Rendering frames headless with raster.py, into memory and into a
+# memory-mapped raw file
+#
+# The states are recorded from a simulation first, with the puck served
+# hard and the paddles chasing it, so only rendering is timed.
+#
+# Run from the repository root:
+#   python -m benchmarks.raster [frames]
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import physics
+import raster
+from vector import Vector
+
+def record(sim, rast, n):
+    locations = np.empty((n, len(rast.circles), 2))
+    sim.puck.velocity = Vector(4000, 1500)
+    for i in range(n):
+        puck = sim.puck.location
+        if sim.step_paddles({sim.paddle_1: Vector(puck.x - 150, puck.y),
+                             sim.paddle_2: Vector(puck.x + 150, puck.y)}):
+            sim.serve()
+            sim.puck.velocity = Vector(4000, 1500)
+        locations[i] = rast.locations()
+    return locations
+
+def main():
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+    batch = 256
+    sim = physics.Simulation()
+    print("%6s %9s %12s %12s %12s" % ("scale", "size", "memory", "raw file", "MB/s"))
+
+    for scale in [raster.scale / 2, raster.scale, 2 * raster.scale]:
+        rast = raster.Raster(sim, scale)
+        locations = record(sim, rast, n)
+
+        out = np.empty((batch, rast.height, rast.width, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        for i in range(0, n, batch):
+            rast.render(locations[i:i + batch], out[:len(locations[i:i + batch])])
+        memory = n / (time.perf_counter() - start)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'frames.raw')
+            start = time.perf_counter()
+            frames = raster.Frame_File(path, rast.width, rast.height, scale=scale)
+            for i in range(0, n, batch):
+                frames.append(rast, locations[i:i + batch])
+            frames.close()
+            raw = n / (time.perf_counter() - start)
+
+            # Spot check what was written against a frame drawn alone
+            (clip, index) = raster.open_frames(path)
+            check = np.empty((1,) + clip.shape[1:], dtype=np.uint8)
+            rast.render(locations[n // 2][None], check)
+            assert index['frames'] == n and (clip[n // 2] == check[0]).all()
+            del clip
+
+        print("%6.3f %9s %9.0f/s %9.0f/s %12.0f"
+              % (scale, "%dx%d" % (rast.width, rast.height), memory, raw,
+                 raw * frames.frame_size / 1e6))
+
+if __name__ == "__main__":
+    main()
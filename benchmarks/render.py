@@ -0,0 +1,99 @@
+# Time spent drawing a frame, before and after the cached background and
+# dirty rectangles
+#
+# "before" redraws the whole arena every frame and flips the whole screen.
+# "after" is Game.draw with pygame.display.update on the changed rectangles.
+# Both draw the same frames, which are checked to come out the same.
+#
+# Run from the repository root, without a window:
+#   SDL_VIDEODRIVER=dummy python -m benchmarks.render [frames]
+
+import sys
+import time
+
+import pygame
+
+import game
+from vector import Vector
+
+# Game.draw and Arena.draw as they were before the background was cached
+def legacy_draw(sim):
+
+    arena = sim.arena
+    screen = arena.screen
+    screen.fill((0, 0, 0))
+
+    borders = pygame.Rect(0, 0, game.mm_to_pix(arena.screen_x),
+                          game.mm_to_pix(arena.screen_y))
+    pygame.draw.rect(screen, arena.border_color, borders)
+    pygame.draw.rect(screen, arena.space_color,
+                     pygame.Rect(game.mm_to_pix(arena.border_width),
+                                 game.mm_to_pix(arena.border_width),
+                                 game.mm_to_pix(arena.x_len),
+                                 game.mm_to_pix(arena.y_len)))
+    pygame.draw.rect(screen, arena.space_color,
+                     pygame.Rect(game.mm_to_pix(arena.border_width + arena.x_len),
+                                 game.mm_to_pix(arena.border_width + arena.goal_y_low),
+                                 game.mm_to_pix(arena.border_width),
+                                 game.mm_to_pix(arena.goal_width)))
+    pygame.draw.rect(screen, arena.space_color,
+                     pygame.Rect(game.mm_to_pix(0),
+                                 game.mm_to_pix(arena.border_width + arena.goal_y_low),
+                                 game.mm_to_pix(arena.border_width),
+                                 game.mm_to_pix(arena.goal_width)))
+    pygame.draw.rect(screen, (0, 0, 0),
+                     pygame.Rect(game.mm_to_pix(arena.border_width
+                                 + (arena.x_len - arena.mid_line_width)/2),
+                                 game.mm_to_pix(arena.border_width),
+                                 game.mm_to_pix(arena.mid_line_width),
+                                 game.mm_to_pix(arena.y_len)))
+
+    # Scores and triangles
+    arena.score_rects = []
+    arena.draw_scores(sim.score)
+
+    for (circle, color) in sim.circles:
+        game.draw_circle(circle, color, arena)
+
+    pygame.display.flip()
+
+def after_draw(sim):
+    pygame.display.update(sim.draw())
+
+# Seconds per frame drawing frames of a puck bouncing around the table,
+# and the screen after the last one
+def measure(draw, frames):
+
+    sim = game.Game()
+    sim.puck.velocity = Vector(4200, 2600)
+
+    elapsed = 0
+    for i in range(frames):
+        sim.save_state()
+        sim.step()
+        if sim.scored:
+            sim.serve()
+        if i % 100 == 99:
+            sim.score = (sim.score[0] + 1, sim.score[1])
+        start = time.perf_counter()
+        draw(sim)
+        elapsed += time.perf_counter() - start
+
+    return (elapsed / frames, pygame.image.tobytes(sim.arena.screen, 'RGB'))
+
+def main():
+
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    results = {}
+    for (name, draw) in [("before", legacy_draw), ("after", after_draw)]:
+        (per_frame, pixels) = measure(draw, frames)
+        results[name] = pixels
+        print("%-7s %8.1f us/frame, %5.1f%% of a %d Hz frame"
+              % (name, 1e6 * per_frame, 100 * per_frame * game.clock_freq,
+                 game.clock_freq))
+
+    print("same pixels:", results["before"] == results["after"])
+
+if __name__ == "__main__":
+    main()
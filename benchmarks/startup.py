@@ -0,0 +1,115 @@
+# Time from starting the game to its first frame on screen
+#
+# Every run is a new interpreter, as pygame keeps the fonts it has scanned
+# for the life of the process, with a font cache directory of its own. A
+# run reports:
+#
+#   import   import game, which imports pygame
+#   init     pygame and Game(): window, fonts, arena and physics
+#   frame    drawing the first frame and putting it on screen
+#   after    what the fast start does once the frame is up
+#
+# "legacy" is the game as it was before the fast start, checked out from
+# git into a temporary directory: pygame.init(), the score font looked up
+# with pygame.font.SysFont(), the score glyphs rendered before the first
+# frame and everything game.py uses imported up front. By default that's
+# the commit before the one that added this file. "cold" is the game now
+# with an empty font cache, and "fast" with a cache a run before it wrote.
+#
+# Run from the repository root, without a window:
+#   SDL_VIDEODRIVER=dummy python -m benchmarks.startup [runs] [legacy revision]
+
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Start the game of the source tree in directory tree and print the times
+def child(tree):
+
+    sys.path.insert(0, tree)
+    start = time.perf_counter()
+    import pygame
+    import game
+    times = {'import': time.perf_counter() - start}
+
+    start = time.perf_counter()
+    sim = game.Game()
+    times['init'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pygame.display.update(sim.draw())
+    times['frame'] = time.perf_counter() - start
+
+    # The legacy game has nothing left to do
+    start = time.perf_counter()
+    if hasattr(sim, 'finish_startup'):
+        sim.finish_startup()
+    times['after'] = time.perf_counter() - start
+
+    print(json.dumps(times))
+
+def run(tree, cache_home):
+    env = dict(os.environ, XDG_CACHE_HOME=cache_home, PYGAME_HIDE_SUPPORT_PROMPT='1')
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', tree],
+                         cwd=tree, env=env, capture_output=True, text=True,
+                         check=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+# Extract the source tree at a git revision into directory
+def checkout(revision, directory):
+    archive = subprocess.run(['git', 'archive', '--format=tar', revision], cwd=root,
+                             capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+
+# The commit before the fast start, the parent of the one adding this file
+def legacy_revision():
+    added = subprocess.run(['git', 'log', '--diff-filter=A', '--format=%H', '--',
+                            'benchmarks/startup.py'], cwd=root, capture_output=True,
+                           text=True, check=True).stdout.split()
+    return added[-1] + '^'
+
+def main():
+
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2])
+        return
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    revision = sys.argv[2] if len(sys.argv) > 2 else legacy_revision()
+    keys = ['import', 'init', 'frame', 'after']
+    results = {'legacy': [], 'cold': [], 'fast': []}
+
+    with tempfile.TemporaryDirectory() as legacy_tree:
+        checkout(revision, legacy_tree)
+        # Once untimed, to compile its bytecode as the tree here already is
+        with tempfile.TemporaryDirectory() as cache:
+            run(legacy_tree, cache)
+        for i in range(runs):
+            # A fresh cache for every run, and for fast one filled by a run
+            # that isn't timed
+            with tempfile.TemporaryDirectory() as legacy_cache, \
+                    tempfile.TemporaryDirectory() as cold_cache, \
+                    tempfile.TemporaryDirectory() as fast_cache:
+                results['legacy'].append(run(legacy_tree, legacy_cache))
+                results['cold'].append(run(root, cold_cache))
+                run(root, fast_cache)
+                results['fast'].append(run(root, fast_cache))
+
+    print("median of %d runs, ms, legacy at %s" % (runs, revision))
+    print("%-8s" % "" + "".join("%9s" % key for key in keys) + "%15s" % "first frame")
+    for (mode, times) in results.items():
+        medians = [1e3 * statistics.median(t[key] for t in times) for key in keys]
+        print("%-8s" % mode + "".join("%9.1f" % m for m in medians)
+              + "%15.1f" % sum(medians[:3]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+# Benchmark suite for the vector math, the collision kernels and whole frames
+#
+# Every case is timed in batches of calls, each batch long enough for the
+# clock to resolve it. Results are ops/s from the median batch, per call
+# percentiles over the batches, and the allocations of one call: vectors
+# created and peak bytes seen by tracemalloc.
+#
+# Run from the repository root:
+#   python -m benchmarks.suite [-o results.json] [-k filter] [--quick]
+#   python -m benchmarks.suite --compare baseline.json [-o results.json]
+#
+# Comparing runs the suite and flags every case that got slower than the
+# baseline by more than the threshold, or allocates more than it did by
+# more than alloc_threshold and the slack. The exit status is 1 if anything
+# regressed.
+
+import argparse
+import json
+import math
+import socket
+import platform
+import sys
+import time
+import tracemalloc
+
+import ai
+import collidables
+import events
+import netplay
+import physics
+import predict
+from benchmarks.alloc import Vector_Counter
+from paddle_input import Paddle_Path
+from vector import Vector
+
+# Seconds a batch of calls should last
+batch_time = .005
+# Fraction of the baseline ops/s a case can lose before it's flagged
+threshold = .10
+# Fraction of the baseline allocations a case can add before it's flagged,
+# on top of some slack for what tracemalloc and random play pick up anyway
+alloc_threshold = .10
+vector_slack = .5
+byte_slack = 256
+
+# name -> setup function, returning the function to call
+cases = {}
+
+def case(name):
+    def register(setup):
+        cases[name] = setup
+        return setup
+    return register
+
+# Vector operations
+
+# Output vector of the *_into operations
+out = Vector(0, 0)
+
+for (name, op) in [
+        ("add", lambda a, b: a + b),
+        ("sub", lambda a, b: a - b),
+        ("eq", lambda a, b: a == b),
+        ("dot", lambda a, b: a * b),
+        ("scale", lambda a, b: a * 1.5),
+        ("rscale", lambda a, b: 1.5 * a),
+        ("div", lambda a, b: a / 1.5),
+        ("mag_sq", lambda a, b: a.mag_sq()),
+        ("mag", lambda a, b: a.mag()),
+        ("ang", lambda a, b: a.ang()),
+        ("normalize", lambda a, b: a.normalize()),
+        ("projection", lambda a, b: a.projection(b)),
+        ("flip", lambda a, b: a.flip(b)),
+        ("copy", lambda a, b: a.copy()),
+        ("set", lambda a, b: a.set(3, 4)),
+        ("iadd_isub", lambda a, b: a.iadd(b).isub(b)),
+        ("iscale", lambda a, b: a.iscale(1)),
+        ("iadd_scaled", lambda a, b: a.iadd_scaled(b, 0)),
+        ("normalize_into", lambda a, b: a.normalize_into(out)),
+        ("projection_into", lambda a, b: a.projection_into(b, out)),
+        ("flip_into", lambda a, b: a.flip_into(b, out))]:
+
+    def setup(op=op):
+        a = Vector(3, 4)
+        b = Vector(-2, 7)
+        return lambda: op(a, b)
+
+    case("vector." + name)(setup)
+
+# coll_time() of every collidable, for a puck heading into it
+
+def puck_at(x, y, v_x, v_y):
+    return physics.Puck(Vector(x, y), Vector(v_x, v_y), 50)
+
+for (obj, puck) in [
+        (collidables.Wall_Vert_Left_Inf(3000), puck_at(1500, 500, 4000, 1000)),
+        (collidables.Wall_Vert_Right_Inf(0), puck_at(1500, 500, -4000, 1000)),
+        (collidables.Wall_Horz_Up_Inf(1000), puck_at(1500, 500, 1000, 4000)),
+        (collidables.Wall_Horz_Down_Inf(0), puck_at(1500, 500, 1000, -4000)),
+        (collidables.Wall_Vert_Left(3000, 0, 1000), puck_at(1500, 500, 4000, 1000)),
+        (collidables.Wall_Vert_Right(0, 0, 1000), puck_at(1500, 500, -4000, 1000)),
+        (collidables.Wall_Horz_Up(0, 3000, 1000), puck_at(1500, 500, 1000, 4000)),
+        (collidables.Wall_Horz_Down(0, 3000, 0), puck_at(1500, 500, 1000, -4000)),
+        (collidables.Circle(Vector(2000, 600), 70), puck_at(1500, 500, 4000, 900))]:
+
+    def setup(obj=obj, puck=puck):
+        return lambda: obj.coll_time(puck)
+
+    case("coll_time." + type(obj).__name__)(setup)
+
+# Puck.move
+
+# Puck put back where the scenario starts before every move
+def move_case(location, velocity, paddle=None, paddle_to=None):
+
+    def setup():
+        sim = physics.Simulation()
+        puck = sim.puck
+        collidables = sim.coll_table
+        circles = [obj for obj in sim.collidables if isinstance(obj, physics.Circle)]
+        if paddle is not None:
+            sim.paddle_1.location = Vector(*paddle)
+            sim.paddle_1.new_location = Vector(*paddle)
+
+        def run():
+            puck.location.set(*location)
+            puck.velocity.set(*velocity)
+            for circle in circles:
+                circle.ghost = False
+            if paddle is None:
+                puck.move(collidables)
+            else:
+                sim.paddle_1.location.set(*paddle)
+                sim.step_paddles({sim.paddle_1: Vector(*paddle_to)})
+        return run
+
+    return setup
+
+# Across open table, nothing to hit
+case("move.open_glide")(move_case((1500, 500), (3000, 1000)))
+# Fast into the corner of a goal mouth, bouncing off the goal walls and the
+# corner circle three times in one move
+case("move.corner_pinball")(move_case((3010, 400), (2330, -8690)))
+# Squeezed between a paddle moving in and the top wall
+case("move.paddle_pinch")(move_case((2000, 55), (0, -2000),
+                                    paddle=(2000, 180), paddle_to=(2000, 150)))
+
+# Whole frames, headless
+
+@case("frame.step")
+def setup():
+    sim = physics.Simulation()
+    sim.puck.velocity = Vector(4200, 2600)
+    state = sim.snapshot()
+    frames = iter(range(1 << 62))
+
+    def run():
+        i = next(frames)
+        if i % 1000 == 0:
+            sim.restore(state)
+        location = Vector(2250 + 400 * math.cos(i / 50), 500 + 300 * math.sin(i / 50))
+        sim.step_paddles({sim.paddle_1: location})
+        if sim.scored:
+            sim.serve()
+    return run
+
+# A step driven by input at 1000 Hz, the samples gathered into a path, see
+# paddle_input.py
+@case("frame.step_path_1000hz")
+def setup():
+    sim = physics.Simulation()
+    sim.puck.velocity = Vector(4200, 2600)
+    state = sim.snapshot()
+    path = Paddle_Path()
+    dt = 1/physics.clock_freq
+    frames = iter(range(1 << 62))
+
+    def run():
+        i = next(frames)
+        if i % 1000 == 0:
+            sim.restore(state)
+        for k in range(8):
+            t = (i + (k + 1) / 8) / 50
+            path.add(Vector(2250 + 400 * math.cos(t), 500 + 300 * math.sin(t)))
+        for (location, points) in path.steps(sim.paddle_1.location.copy(), 1, dt):
+            sim.step_paddles({sim.paddle_1: location}, dt, {sim.paddle_1: points})
+        if sim.scored:
+            sim.serve()
+    return run
+
+@case("frame.step_10_pucks")
+def setup():
+    sim = physics.Simulation(n_pucks=10)
+    for (i, puck) in enumerate(sim.pucks):
+        puck.velocity = Vector(3000 * math.cos(i), 3000 * math.sin(i))
+    state = sim.snapshot()
+    frames = iter(range(1 << 62))
+
+    def run():
+        if next(frames) % 1000 == 0:
+            sim.restore(state)
+        sim.step()
+        if sim.scored:
+            sim.serve()
+    return run
+
+# Trajectory prediction, see predict.py
+
+def predict_setup():
+    sim = physics.Simulation()
+    sim.puck.velocity = Vector(4200, 2600)
+    for paddle in [sim.paddle_1, sim.paddle_2]:
+        paddle.ghost = True
+    return (sim, predict.Predictor(sim))
+
+# Where the puck is in two seconds, the slow way: stepping a copy
+@case("predict.stepped_2s")
+def setup():
+    (sim, predictor) = predict_setup()
+    state = sim.snapshot()
+
+    def run():
+        for i in range(2 * physics.clock_freq):
+            sim.step()
+        sim.restore(state)
+    return run
+
+@case("predict.walk")
+def setup():
+    (sim, predictor) = predict_setup()
+
+    def run():
+        predictor.invalidate()
+        predictor.predict(sim.puck).crossing_x(300)
+    return run
+
+# The same two seconds event driven, see events.py
+@case("predict.events_2s")
+def setup():
+    (sim, predictor) = predict_setup()
+    state = sim.snapshot()
+
+    def run():
+        events.Events(sim).advance_to(2)
+        sim.restore(state)
+    return run
+
+# A step and a query answered from the cache, as in a game loop
+@case("predict.cached")
+def setup():
+    (sim, predictor) = predict_setup()
+    state = sim.snapshot()
+    frames = iter(range(1 << 62))
+
+    def run():
+        if next(frames) % 200 == 0:
+            sim.restore(state)
+        sim.step()
+        predictor.predict(sim.puck).crossing_x(300)
+    return run
+
+# A frame of the computer opponent's thinking, see ai.py, and the step it
+# drives
+
+for level in ai.levels:
+
+    def setup(level=level):
+        sim = physics.Simulation()
+        sim.puck.velocity = Vector(-4200, 2600)
+        opponent = ai.Opponent(sim, level)
+        state = sim.snapshot()
+        frames = iter(range(1 << 62))
+
+        def run():
+            if next(frames) % 200 == 0:
+                sim.restore(state)
+            sim.step_paddles({sim.paddle_2: opponent.target(1/physics.clock_freq)})
+            if sim.scored:
+                sim.serve()
+        return run
+
+    case("ai." + level)(setup)
+
+# Rolling a networked game back 16 frames and simulating them again, see
+# netplay.py
+
+@case("netplay.rollback_16")
+def setup():
+    sim = physics.Simulation()
+    sim.puck.velocity = Vector(4200, 2600)
+    # Rolling back never touches the socket, so it's closed once the session
+    # is built
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        session = netplay.Session(sim, sock, True)
+    for frame in range(netplay.max_rollback):
+        session.local_inputs[frame] = (20000 + 100 * frame, 5000)
+        session.simulate(frame)
+        session.frame += 1
+
+    def run():
+        session.rollback_to = 0
+        session.rollback()
+    return run
+
+# Calls that fit in a batch
+def calibrate(run):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(number):
+            run()
+        if time.perf_counter() - start >= batch_time:
+            return number
+        number *= 2
+
+# Value at fraction of a sorted list
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def measure(setup, repeats):
+
+    run = setup()
+    number = calibrate(run)
+
+    per_call = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        for j in range(number):
+            run()
+        per_call.append((time.perf_counter() - start) / number)
+    per_call.sort()
+
+    # Allocations are counted from a fresh setup, so that cases that play a
+    # game count the same calls of it whatever the timing did
+    calls = 100
+    run = setup()
+    with Vector_Counter() as counter:
+        for i in range(calls):
+            run()
+
+    peak = 0
+    run = setup()
+    tracemalloc.start()
+    for i in range(calls):
+        (current, ignored) = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    median = percentile(per_call, .5)
+    return {
+        'ops_per_sec': 1 / median,
+        'p50_ns': 1e9 * median,
+        'p90_ns': 1e9 * percentile(per_call, .9),
+        'p99_ns': 1e9 * percentile(per_call, .99),
+        'vectors_per_op': counter.count / calls,
+        'peak_bytes_per_op': peak,
+        'calls_per_batch': number,
+        'batches': repeats,
+    }
+
+def run_suite(pattern, repeats):
+
+    results = {}
+    for (name, setup) in cases.items():
+        if pattern and pattern not in name:
+            continue
+        results[name] = measure(setup, repeats)
+        r = results[name]
+        print("%-36s %12.0f ops/s  p50 %9.0f ns  p99 %9.0f ns  %5.2f vectors"
+              % (name, r['ops_per_sec'], r['p50_ns'], r['p99_ns'],
+                 r['vectors_per_op']))
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+# Allocations up by more than alloc_threshold and slack
+def more(new, old, slack):
+    return new > old * (1 + alloc_threshold) + slack
+
+# Cases of current that are slower or allocate more than in baseline
+def compare(baseline, current):
+
+    regressions = []
+    print()
+    print("%-36s %12s %12s %8s" % ("case", "baseline", "current", "change"))
+    for (name, result) in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print("%-36s %12s %12.0f %8s" % (name, "-", result['ops_per_sec'], "new"))
+            continue
+        change = result['ops_per_sec'] / old['ops_per_sec'] - 1
+        flags = []
+        if change < -threshold:
+            flags.append("SLOWER")
+        if more(result['vectors_per_op'], old['vectors_per_op'], vector_slack) \
+                or more(result['peak_bytes_per_op'], old['peak_bytes_per_op'],
+                        byte_slack):
+            flags.append("MORE ALLOCATIONS")
+        print("%-36s %12.0f %12.0f %+7.1f%% %s"
+              % (name, old['ops_per_sec'], result['ops_per_sec'], 100 * change,
+                 " ".join(flags)))
+        if flags:
+            regressions.append(name)
+
+    return regressions
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--out', help="write the results to a JSON file")
+    parser.add_argument('-k', '--filter', help="only run cases containing this")
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help="flag regressions against earlier results")
+    parser.add_argument('--quick', action='store_true',
+                        help="fewer batches, noisier numbers")
+    args = parser.parse_args()
+
+    current = run_suite(args.filter, 5 if args.quick else 30)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current)
+        if regressions:
+            print("\n%d regressions" % len(regressions))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# Matches per second of the tournament runner against the number of workers
+#
+# Every worker gets one shard of whole matches, the same for every run, so
+# perfect scaling multiplies the matches per second by the workers. The
+# matches are those of a tournament between two levels, with their stalls
+# and game time, so the rates are of the points and stalls a real run
+# plays, see tournament.py.
+#
+# Run from the repository root:
+#   python -m benchmarks.tournament [matches_per_worker] [level_a level_b]
+
+import os
+import sys
+import tempfile
+import time
+
+import tournament
+
+def main():
+
+    per_worker = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    levels = tuple(sys.argv[2:4]) if len(sys.argv) > 3 else ('hard', 'medium')
+    cores = os.cpu_count() or 1
+    tournament.shard_size = per_worker
+
+    print("%s against %s, %d matches per worker, %d cores"
+          % (levels + (per_worker, cores)))
+    jobs = 1
+    single = None
+    while jobs <= cores:
+        n = jobs * per_worker
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            report = tournament.run(levels, n, os.path.join(directory, 'matches.jsonl'),
+                                    jobs=jobs).report()
+            rate = n / (time.perf_counter() - start)
+        if single is None:
+            single = rate
+        print("%3d workers %8.3f matches/s, %5.2fx one worker, %3.0f%% efficiency, "
+              "%.1f points and %.1f stalls in %.0f s of game per match"
+              % (jobs, rate, rate / single, 100 * rate / single / jobs,
+                 report['points'] / n, report['stalls'] / n,
+                 3600 * report['game_hours'] / n))
+        jobs *= 2
+
+if __name__ == "__main__":
+    main()
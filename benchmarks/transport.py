@@ -0,0 +1,89 @@
+# Throughput and latency of paddle input through the FIFO and the shared
+# memory ring
+#
+# The frames come from the C writer, which has to be built first:
+#   g++ -O2 -o write_fifo write_fifo.cpp
+#
+# Run from the repository root:
+#   python -m benchmarks.transport [rate_hz] [seconds] [burst]
+#
+# The reader drains everything available, then sleeps for a game cycle. The
+# latency of a frame is from the timestamp the writer put in it to the time
+# the reader unpacked it, both on the monotonic clock.
+
+import os
+import subprocess
+import sys
+import time
+
+import physics
+from paddle_input import Fifo_Reader, FIFO
+from shm_ring import Shm_Ring, RING
+
+writer = "./write_fifo"
+
+# Percentile of a sorted list
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+# (frames read, wall seconds, reader CPU seconds, sorted latencies in us)
+def measure(transport, rate, seconds, burst):
+
+    count = int(rate * seconds)
+    if transport == "fifo":
+        reader = Fifo_Reader(FIFO)
+        read = reader.poll
+        args = [writer]
+    else:
+        reader = Shm_Ring(RING)
+        reader.release(reader.head())
+        read = reader.backlog
+        args = [writer, "--ring"]
+
+    process = subprocess.Popen(args + [str(rate), "0", str(count), str(burst)],
+                               stderr=subprocess.DEVNULL)
+
+    latencies = []
+    frames = 0
+    cpu = 0
+    start = time.perf_counter()
+    while frames < count:
+        cpu_start = time.process_time()
+        samples = read()
+        now = time.monotonic_ns()
+        cpu += time.process_time() - cpu_start
+        frames += len(samples)
+        for sample in samples:
+            latencies.append((now - sample.timestamp) / 1e3)
+        if not samples and process.poll() is not None:
+            # Writer gone and nothing left, frames were dropped
+            break
+        time.sleep(1/physics.clock_freq)
+    wall = time.perf_counter() - start
+
+    process.wait()
+    reader.close()
+    latencies.sort()
+    return (frames, wall, cpu, latencies)
+
+def main():
+
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2
+    burst = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    if not os.path.exists(writer):
+        sys.exit("build the writer first: g++ -O2 -o write_fifo write_fifo.cpp")
+
+    print("%d frames/s for %g s, %d per write" % (rate, seconds, burst))
+    for transport in ("fifo", "ring"):
+        (frames, wall, cpu, latencies) = measure(transport, rate, seconds, burst)
+        print("%-4s %9.0f frames/s, reader %6.3f us/frame, "
+              "latency p50 %7.0f us p99 %7.0f us"
+              % (transport, frames / wall, 1e6 * cpu / max(frames, 1),
+                 percentile(latencies, .5), percentile(latencies, .99)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+# Collidables compiled into flat tables
+#
+# Puck.move() asks every collidable for its coll_time() on every sub-step.
+# A CollisionTable is built once from the same objects: walls are grouped by
+# the axis they block and the way they face, static circles are kept as
+# center/radius rows, and only objects that move (paddles) or that the table
+# doesn't know are still asked through coll_time(). The first collision then
+# comes from one query, without a method call per wall.
+#
+# Small tables are scanned in plain Python, skipping every group the puck is
+# moving away from. Tables with more than vector_min static objects are
+# queried with NumPy array passes, so a custom arena with hundreds or
+# thousands of segments costs about the same per query as a small one.
+
+import math
+
+from collidables import *
+
+# Static objects above which queries are vectorized with NumPy. Below this
+# the fixed cost of a handful of array operations is more than the scan.
+vector_min = 200
+
+# Left facing walls, hit while moving towards +x or +y
+facing_left = -1
+# Right facing walls, hit while moving towards -x or -y
+facing_right = 1
+
+# (axis, facing, gate) of every wall class, where axis is 0 for walls that
+# block x and 1 for walls that block y, and gate is 1 for finite walls,
+# which stop colliding once the edge of the puck is past them, and 0 for
+# infinite walls, which stop colliding once its center is
+wall_kinds = {
+    Wall_Vert_Left: (0, facing_left, 1),
+    Wall_Vert_Right: (0, facing_right, 1),
+    Wall_Vert_Left_Inf: (0, facing_left, 0),
+    Wall_Vert_Right_Inf: (0, facing_right, 0),
+    Wall_Horz_Up: (1, facing_left, 1),
+    Wall_Horz_Down: (1, facing_right, 1),
+    Wall_Horz_Up_Inf: (1, facing_left, 0),
+    Wall_Horz_Down_Inf: (1, facing_right, 0),
+}
+
+# Position of a wall along the axis it blocks and its span along the other
+def wall_row(obj, axis):
+
+    if axis == 0:
+        (pos, low, high) = (obj.x, getattr(obj, 'y_low', None),
+                            getattr(obj, 'y_high', None))
+    else:
+        (pos, low, high) = (obj.y, getattr(obj, 'x_low', None),
+                            getattr(obj, 'x_high', None))
+
+    if low is None:
+        # Infinite wall
+        (low, high) = (-math.inf, math.inf)
+
+    return (pos, low, high)
+
+class CollisionTable:
+
+    # rows are the rows layout.py worked out for the first objects, which
+    # are taken as they are instead of being looked at again
+    def __init__(self, objects, rows=None):
+
+        self.objects = list(objects)
+        if rows is None:
+            rows = []
+
+        # (axis, facing) -> [(position, span low, span high, gate, index)]
+        self.walls = {(0, facing_left): [], (0, facing_right): [],
+                      (1, facing_left): [], (1, facing_right): []}
+        # [(x, y, radius, circle, index)]
+        self.circles = []
+        # [(object, index)] of objects asked through coll_time()
+        self.dynamic = []
+
+        for (index, obj) in enumerate(self.objects):
+            if index < len(rows):
+                row = rows[index]
+                if type(obj) is Circle:
+                    self.circles.append((row[1], row[2], row[3], obj, index))
+                else:
+                    (kind, axis, facing, gate, pos, low, high) = row
+                    self.walls[(int(axis), int(facing))].append(
+                        (pos, low, high, int(gate), index))
+                continue
+            kind = wall_kinds.get(type(obj))
+            if kind is not None:
+                (axis, facing, gate) = kind
+                (pos, low, high) = wall_row(obj, axis)
+                self.walls[(axis, facing)].append((pos, low, high, gate, index))
+            elif type(obj) is Circle:
+                self.circles.append((obj.location.x, obj.location.y,
+                                     obj.radius, obj, index))
+            else:
+                self.dynamic.append((obj, index))
+
+        # Packed for the compiled kernels when first needed, see packed()
+        self.kernel_table = None
+
+        n_static = len(self.circles) + sum(len(g) for g in self.walls.values())
+        self.arrays = None
+        if n_static > vector_min:
+            try:
+                self.arrays = VectorTable(self)
+            except ImportError:
+                # No NumPy, keep scanning in Python
+                pass
+
+    # Time until the puck hits the first object and that object
+    # Every object is checked, whatever the time left in the move
+    # Returns (None, None) if the puck won't hit anything
+    def first_collision(self, puck, time_left=None):
+
+        if self.arrays is not None:
+            (best, best_index) = self.arrays.first_collision(puck)
+        else:
+            (best, best_index) = self.static_collision(puck)
+
+        for (obj, index) in self.dynamic:
+            coll_time = obj.coll_time(puck)
+            if coll_time is not None and (best is None or coll_time < best
+                    or (coll_time == best and index < best_index)):
+                (best, best_index) = (coll_time, index)
+
+        if best is None:
+            return (None, None)
+        return (best, self.objects[best_index])
+
+    # The objects packed into arrays for the kernels in kernels.py, or None
+    # if some object that moves isn't a plain circle, which the kernels
+    # can't ask
+    def packed(self):
+
+        if self.kernel_table is None:
+            self.kernel_table = False
+            if all(isinstance(obj, Circle) and type(obj).coll_time is Circle.coll_time
+                   for (obj, index) in self.dynamic):
+                import numpy as np
+                from kernels import Packed_Table
+                self.kernel_table = Packed_Table(self, np)
+
+        return self.kernel_table or None
+
+    # Nothing to do after an object moved, as objects that move are asked
+    # through coll_time() on every query
+    def update(self, obj):
+        pass
+
+    # First collision with a wall or static circle, scanned in Python
+    # Returns (time, index), with ties going to the earliest object as in
+    # util.min_pos()
+    def static_collision(self, puck):
+
+        best = None
+        best_index = None
+
+        r = puck.radius
+        (x, y) = (puck.location.x, puck.location.y)
+        (v_x, v_y) = (puck.velocity.x, puck.velocity.y)
+
+        for axis in (0, 1):
+
+            if axis == 0:
+                (p, q, v_p, v_q) = (x, y, v_x, v_y)
+            else:
+                (p, q, v_p, v_q) = (y, x, v_y, v_x)
+
+            if v_p > 0:
+                for (pos, low, high, gate, index) in self.walls[(axis, facing_left)]:
+                    if p + gate * r > pos:
+                        continue
+                    coll_time = (pos - (p + r)) / v_p
+                    coll_q = q + coll_time * v_q
+                    if coll_q < low or coll_q > high:
+                        continue
+                    if best is None or coll_time < best \
+                            or (coll_time == best and index < best_index):
+                        (best, best_index) = (coll_time, index)
+
+            elif v_p < 0:
+                for (pos, low, high, gate, index) in self.walls[(axis, facing_right)]:
+                    if p - gate * r < pos:
+                        continue
+                    coll_time = ((p - r) - pos) / -v_p
+                    coll_q = q + coll_time * v_q
+                    if coll_q < low or coll_q > high:
+                        continue
+                    if best is None or coll_time < best \
+                            or (coll_time == best and index < best_index):
+                        (best, best_index) = (coll_time, index)
+
+        speed_sq = v_x * v_x + v_y * v_y
+        if speed_sq == 0:
+            return (best, best_index)
+        speed = math.sqrt(speed_sq)
+
+        for (c_x, c_y, c_r, circle, index) in self.circles:
+
+            if circle.ghost:
+                continue
+
+            d_x = c_x - x
+            d_y = c_y - y
+            dot = d_x * v_x + d_y * v_y
+            if dot < 0 or (d_x == 0 and d_y == 0):
+                continue
+
+            # Closest distance between the circle centers along the path,
+            # compared squared
+            cross = d_x * v_y - d_y * v_x
+            r_sum = c_r + r
+            disc = r_sum * r_sum - cross * cross / speed_sq
+            if disc <= 0:
+                continue
+
+            coll_time = (dot / speed - math.sqrt(disc)) / speed
+            if best is None or coll_time < best \
+                    or (coll_time == best and index < best_index):
+                (best, best_index) = (coll_time, index)
+
+        return (best, best_index)
+
+# The static part of a CollisionTable as NumPy arrays
+#
+# Each wall group is a set of contiguous arrays, and only the groups the puck
+# is moving towards are evaluated. The puck itself stays as Python floats so
+# that every operation is a single array pass.
+class VectorTable:
+
+    def __init__(self, table):
+
+        # Imported here so that small tables never pay for NumPy
+        import numpy as np
+
+        # (axis, facing) -> (position, low, high, gate, index)
+        self.walls = {}
+        for (key, group) in table.walls.items():
+            if group:
+                (pos, low, high, gate, index) = np.array(group, dtype=float).T
+                self.walls[key] = (pos, low, high, gate, index.astype(int))
+
+        rows = table.circles
+        self.circ_x = np.array([c[0] for c in rows], dtype=float)
+        self.circ_y = np.array([c[1] for c in rows], dtype=float)
+        self.circ_r = np.array([c[2] for c in rows], dtype=float)
+        self.circ_objs = [c[3] for c in rows]
+        self.circ_index = np.array([c[4] for c in rows], dtype=int)
+        self.objects_by_index = {c[4]: c[3] for c in rows}
+
+        # Puck radius -> per group (touch position, gate position) and
+        # squared circle radii plus the puck radius
+        self.radius_cache = {}
+
+    # Offsets that depend on the radius of the puck, computed once per radius
+    def offsets(self, r):
+
+        offsets = self.radius_cache.get(r)
+        if offsets is None:
+            walls = {}
+            for ((axis, facing), (pos, low, high, gate, index)) in self.walls.items():
+                walls[(axis, facing)] = (pos + facing * r, pos + facing * gate * r)
+            offsets = (walls, (self.circ_r + r) ** 2)
+            self.radius_cache[r] = offsets
+        return offsets
+
+    # Returns (time, index) of the first collision with a static object
+    def first_collision(self, puck):
+
+        import numpy as np
+
+        r = puck.radius
+        (x, y) = (puck.location.x, puck.location.y)
+        (v_x, v_y) = (puck.velocity.x, puck.velocity.y)
+        (wall_offsets, circ_r_sq) = self.offsets(r)
+
+        times = []
+        indexes = []
+
+        for axis in (0, 1):
+
+            if axis == 0:
+                (p, q, v_p, v_q) = (x, y, v_x, v_y)
+            else:
+                (p, q, v_p, v_q) = (y, x, v_y, v_x)
+
+            if v_p > 0:
+                key = (axis, facing_left)
+            elif v_p < 0:
+                key = (axis, facing_right)
+            else:
+                continue
+            if key not in self.walls:
+                continue
+
+            (pos, low, high, gate, index) = self.walls[key]
+            (touch, gate_pos) = wall_offsets[key]
+
+            coll_times = (touch - p) * (1 / v_p)
+            coll_q = coll_times * v_q
+            coll_q += q
+            if v_p > 0:
+                miss = gate_pos < p
+            else:
+                miss = gate_pos > p
+            miss |= coll_q < low
+            miss |= coll_q > high
+            coll_times[miss] = np.inf
+
+            times.append(coll_times)
+            indexes.append(index)
+
+        speed_sq = v_x * v_x + v_y * v_y
+        if self.circ_objs and speed_sq > 0:
+
+            d_x = self.circ_x - x
+            d_y = self.circ_y - y
+            dot = d_x * v_x
+            dot += d_y * v_y
+            # Closest distance between the circle centers along the path,
+            # compared squared
+            cross = d_x * v_y
+            cross -= d_y * v_x
+            disc = circ_r_sq - cross * cross * (1 / speed_sq)
+
+            miss = dot < 0
+            miss |= disc <= 0
+            miss |= (d_x == 0) & (d_y == 0)
+            disc[miss] = 0
+
+            speed = speed_sq ** .5
+            coll_times = (dot * (1 / speed) - np.sqrt(disc)) * (1 / speed)
+            coll_times[miss] = np.inf
+
+            times.append(coll_times)
+            indexes.append(self.circ_index)
+
+        if not times:
+            return (None, None)
+
+        times = np.concatenate(times)
+        indexes = np.concatenate(indexes)
+
+        while True:
+
+            pos = times.argmin()
+            best = times[pos]
+            if best == np.inf:
+                return (None, None)
+
+            # Ghost flags are only looked at for the circle that would be hit
+            index = indexes[pos]
+            circle = self.objects_by_index.get(index)
+            if circle is not None and circle.ghost:
+                times[pos] = np.inf
+                continue
+
+            # Ties go to the earliest object, as in util.min_pos()
+            return (float(best), int(indexes[times == best].min()))
@@ -12,6 +12,10 @@ import vector
 # Fraction of velocity puck retains in a collision with a wall
 wall_coll_const = .90
 
+# Temporaries for Circle.coll_time() and Circle.collide_velocity()
+scratch = vector.Scratch()
+scratch_diff = vector.Vector(0, 0)
+
 # Returns velocity of object with velocity v after collision with horizontal wall
 # with collision constant coll_const
 def collide_horz(v, coll_const):
@@ -234,9 +238,9 @@ class Circle:
         if self.location == obj2.location:
             return None
 
-        # First find the closest distance that will occur between 
+        # First find the closest distance that will occur between
         # the circle centers
-        v_diff = self.location - obj2.location 
+        v_diff = scratch_diff.set(self.location.x, self.location.y).isub(obj2.location)
 
         # No collision if obj2 is moving away from circle
         if v_diff * obj2.velocity < 0:
@@ -263,15 +267,16 @@ class Circle:
 
     def collide_velocity(self, obj2, coll_point):
 
-        coll_normal = self.location - obj2.location
-        self_v_proj = 1.0 * self.velocity.projection(coll_normal)
-        obj2_v_proj = obj2.velocity.projection(coll_normal)
+        scratch.reset()
+        coll_normal = scratch.get(self.location.x, self.location.y).isub(obj2.location)
+        self_v_proj = self.velocity.projection_into(coll_normal, scratch.get())
+        obj2_v_proj = obj2.velocity.projection_into(coll_normal, scratch.get())
 
-        obj2_impulse = (1 + self.coll_const) * (self_v_proj - obj2_v_proj)
-        new_vel = obj2.velocity + obj2_impulse
+        obj2_impulse = self_v_proj.isub(obj2_v_proj).iscale(1 + self.coll_const)
+        new_vel = obj2.velocity.copy().iadd(obj2_impulse)
 
         if (new_vel.mag() > obj2.max_velocity):
-            new_vel = new_vel.normalize() * obj2.max_velocity 
+            new_vel.normalize_into(new_vel).iscale(obj2.max_velocity)
 
         return new_vel
 
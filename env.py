@@ -0,0 +1,274 @@
+# Reinforcement learning environments over the physics
+#
+# The agent plays the right paddle (Simulation.paddle_1) against the left
+# one, which guard() drives unless the caller passes its targets too. Every
+# step is one clock cycle:
+#
+#   observation  puck, agent paddle and opponent paddle, each as
+#                x, y, v_x, v_y in mm and mm/s, float32[observation_size]
+#   action       where the agent's paddle should be at the end of the step,
+#                (x, y) in mm, as Paddle.start_move() takes it
+#   reward       1 when the agent scores, -1 when it concedes, from
+#                Puck.goal()
+#
+# An episode ends with a goal (terminated) or after max_steps (truncated)
+# and starts with the puck served from the middle at serve_speed.
+#
+# Env is one table through Simulation.step_paddles(). VecEnv is K tables
+# on a Batch, with the paddle moves of Paddle.start_move() and end_move()
+# done on arrays, so a step costs a handful of array operations whatever K
+# is. Its tables reset themselves as their episodes end, and the last
+# observation of an episode is in info['final_observation'].
+#
+#   env = VecEnv(1024, seed=0)
+#   obs = env.reset()
+#   (obs, reward, terminated, truncated, info) = env.step(actions)
+
+import math
+
+import numpy as np
+
+import physics
+from batch import Batch, circle_times, circle_velocities
+from vector import Vector
+
+observation_size = 12
+# Speed of serves in mm/s, within max_serve_angle of either goal
+serve_speed = 3000
+max_serve_angle = math.pi / 3
+# One minute of play
+max_steps = 60 * physics.clock_freq
+# The guard keeps this far from its goal line and moves this fast
+guard_x = 200
+guard_speed = 2000
+
+# Random serve velocities, (n, 2)
+def serves(rng, n, speed=serve_speed):
+    angle = rng.uniform(-max_serve_angle, max_serve_angle, n) \
+            + math.pi * rng.integers(0, 2, n)
+    return speed * np.stack([np.cos(angle), np.sin(angle)], axis=1)
+
+# Where the agent's and the opponent's paddles start an episode: guard_x
+# in front of their goals, across from the middle
+def homes(table):
+    return ((table.x_len - guard_x, table.y_len / 2), (guard_x, table.y_len / 2))
+
+# Scripted opponent for the left paddle: stays at guard_x, following the
+# puck across the goal at up to guard_speed
+# puck and paddle are (n, 2) locations; returns the paddle targets
+def guard(puck, paddle, table, radius, dt=1/physics.clock_freq):
+
+    target = np.empty_like(paddle)
+    target[:, 0] = guard_x
+    target[:, 1] = np.clip(puck[:, 1], radius, table.y_len - radius)
+    move = target - paddle
+    dist = np.hypot(move[:, 0], move[:, 1])
+    with np.errstate(divide='ignore'):
+        scale = np.minimum(1, guard_speed * dt / dist)
+    return paddle + scale[:, None] * move
+
+# One table, see the top of the file
+class Env:
+
+    def __init__(self, table=None, seed=None):
+
+        self.sim = physics.Simulation(table)
+        self.agent = self.sim.paddle_1
+        self.opponent = self.sim.paddle_2
+        (agent_home, opponent_home) = homes(self.sim.table)
+        self.start = {self.agent: Vector(*agent_home),
+                      self.opponent: Vector(*opponent_home)}
+        self.rng = np.random.default_rng(seed)
+        self.steps = 0
+
+    def observation(self):
+        values = []
+        for obj in [self.sim.puck, self.agent, self.opponent]:
+            values += [obj.location.x, obj.location.y, obj.velocity.x, obj.velocity.y]
+        return np.array(values, dtype=np.float32)
+
+    # Start an episode with the paddles at their homes
+    # Returns the first observation
+    def reset(self, seed=None):
+
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.sim.reset()
+        for obj in self.sim.collidables:
+            if isinstance(obj, physics.Circle):
+                obj.ghost = False
+        for paddle in self.start:
+            paddle.velocity = Vector(0, 0)
+        self.sim.place_paddles({paddle: location.copy()
+                                for (paddle, location) in self.start.items()})
+        if any(paddle.ghost for paddle in self.start):
+            raise ValueError("paddles can't start at their homes %s on this table"
+                             % (homes(self.sim.table),))
+        (v_x, v_y) = serves(self.rng, 1)[0]
+        self.sim.puck.velocity = Vector(v_x, v_y)
+        self.steps = 0
+        return self.observation()
+
+    # One clock cycle with the agent's paddle moving to action, and the
+    # opponent's to opponent_action or where guard() takes it
+    def step(self, action, opponent_action=None):
+
+        if opponent_action is None:
+            puck = np.array([[self.sim.puck.location.x, self.sim.puck.location.y]])
+            paddle = np.array([[self.opponent.location.x, self.opponent.location.y]])
+            opponent_action = guard(puck, paddle, self.sim.table,
+                                    self.opponent.radius)[0]
+
+        goals = self.sim.step_paddles({
+            self.agent: Vector(float(action[0]), float(action[1])),
+            self.opponent: Vector(float(opponent_action[0]), float(opponent_action[1]))})
+
+        self.steps += 1
+        reward = float(sum(goals))
+        terminated = bool(goals)
+        truncated = not terminated and self.steps >= max_steps
+        return (self.observation(), reward, terminated, truncated, {})
+
+# K tables stepped together, see the top of the file
+class VecEnv:
+
+    def __init__(self, k, table=None, seed=None):
+
+        self.k = k
+        sim = physics.Simulation(table)
+        self.table = sim.table
+        self.batch = Batch(k, sim.collidables, sim.puck)
+        paddles = self.batch.paddles
+        self.agent = paddles.index(sim.paddle_1)
+        self.opponent = paddles.index(sim.paddle_2)
+        self.left = [paddle.left for paddle in paddles]
+        self.radius = [paddle.radius for paddle in paddles]
+        (agent_home, opponent_home) = homes(self.table)
+        self.start = self.batch.pad_location.copy()
+        self.start[:, self.agent] = agent_home
+        self.start[:, self.opponent] = opponent_home
+        self.rng = np.random.default_rng(seed)
+        self.steps = np.zeros(k, dtype=int)
+        self.dt = 1/physics.clock_freq
+
+    def observations(self):
+        b = self.batch
+        obs = np.empty((self.k, observation_size), dtype=np.float32)
+        obs[:, 0:2] = b.location
+        obs[:, 2:4] = b.velocity
+        for (i, paddle) in enumerate([self.agent, self.opponent]):
+            obs[:, 4 + 4*i:6 + 4*i] = b.pad_location[:, paddle]
+            obs[:, 6 + 4*i:8 + 4*i] = b.pad_velocity[:, paddle]
+        return obs
+
+    # Paddle.invalid_loc() of paddle j at locations, (k, 2)
+    def invalid(self, j, location):
+
+        table = self.table
+        r = self.radius[j]
+        (x, y) = (location[:, 0], location[:, 1])
+        if self.left[j]:
+            over = x + r > (table.x_len + table.mid_line_width)/2
+        else:
+            over = x - r < (table.x_len - table.mid_line_width)/2
+        return over | (x < r) | (x > table.x_len - r) | (y < r) | (y > table.y_len - r)
+
+    # Paddle.start_move() of paddle j to targets on every table
+    def start_move(self, j, targets):
+
+        b = self.batch
+        column = b.pad_start + j
+        location = b.pad_location[:, j]
+        velocity = (targets - location) / self.dt
+        ghost = b.ghost[:, column]
+
+        # The puck is still for this, as in Circle.coll_time()
+        times = circle_times(location[:, 0:1], location[:, 1:2],
+                             velocity[:, 0:1], velocity[:, 1:2],
+                             b.location[:, 0:1], b.location[:, 1:2], b.pad_r_sq[j])[:, 0]
+        hit = ~ghost & (times < self.dt)
+
+        new_location = targets.copy()
+        new_location[hit] = location[hit] + times[hit, None] * velocity[hit]
+        invalid = self.invalid(j, new_location)
+
+        bounce = hit & ~invalid
+        if bounce.any():
+            b.velocity[bounce] = circle_velocities(
+                b.location[bounce], b.velocity[bounce], new_location[bounce],
+                velocity[bounce], np.full(bounce.sum(), b.pad_coll_const[j]),
+                b.max_velocity)
+
+        b.ghost[:, column] = ghost | invalid
+        b.pad_location[:, j] = new_location
+        b.pad_velocity[:, j] = velocity
+
+    # Paddle.end_move() of paddle j to targets on the tables selected by
+    # rows
+    def end_move(self, j, targets, rows=slice(None)):
+
+        b = self.batch
+        b.pad_location[rows, j] = targets
+        offset = targets - b.location[rows]
+        intersecting = offset[:, 0]**2 + offset[:, 1]**2 < b.pad_r_sq[j]
+        b.ghost[rows, b.pad_start + j] = intersecting | self.invalid(j, targets)
+
+    # Start new episodes on the tables selected by rows, an index array
+    def restart(self, rows, paddles):
+
+        b = self.batch
+        b.reset(rows)
+        b.velocity[rows] = serves(self.rng, len(rows))
+        b.ghost[rows, :b.pad_start] = False
+        self.steps[rows] = 0
+        if paddles:
+            b.pad_velocity[rows] = 0
+        for j in [self.agent, self.opponent]:
+            targets = self.start[rows, j] if paddles else b.pad_location[rows, j]
+            self.end_move(j, targets, rows)
+
+    # Start every table over, with the paddles at their homes
+    # Returns the first observations
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.restart(np.arange(self.k), True)
+        if self.batch.ghost[:, self.batch.pad_start:].any():
+            raise ValueError("paddles can't start at their homes %s on this table"
+                             % (homes(self.table),))
+        return self.observations()
+
+    # One clock cycle on every table, with the agents' paddles moving to
+    # actions, (k, 2), and the opponents' to opponent_actions or where guard()
+    # takes them
+    # Tables whose episode ended are served again, leaving their paddles
+    # where they are
+    def step(self, actions, opponent_actions=None):
+
+        b = self.batch
+        actions = np.asarray(actions, dtype=float).reshape(self.k, 2)
+        if opponent_actions is None:
+            opponent_actions = guard(b.location, b.pad_location[:, self.opponent],
+                                     self.table, self.radius[self.opponent], self.dt)
+        else:
+            opponent_actions = np.asarray(opponent_actions, dtype=float).reshape(self.k, 2)
+
+        self.start_move(self.agent, actions)
+        self.start_move(self.opponent, opponent_actions)
+        b.step()
+        self.end_move(self.agent, actions)
+        self.end_move(self.opponent, opponent_actions)
+
+        self.steps += 1
+        reward = b.goals(self.table).astype(np.float32)
+        terminated = reward != 0
+        truncated = ~terminated & (self.steps >= max_steps)
+
+        obs = self.observations()
+        info = {}
+        done = np.flatnonzero(terminated | truncated)
+        if done.size:
+            info['final_observation'] = obs.copy()
+            self.restart(done, False)
+            obs[done] = self.observations()[done]
+        return (obs, reward, terminated, truncated, info)
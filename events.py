@@ -0,0 +1,223 @@
+# Event driven continuous simulation
+#
+# Instead of stepping the puck in clock cycles, the time of the next
+# collision with every object is kept in a priority queue and the puck
+# glides straight from one event to the next. Events are stamped with the
+# versions of the puck and the object they involve. When something changes
+# velocity (the puck after a bounce, a paddle moved by start_move()) only
+# its version is bumped and only its events are recomputed; the old ones go
+# stale and are dropped when they reach the front of the queue.
+#
+# Unlike Puck.move(), bounces are worked out at the point where the puck
+# touches the object, as there are no clock cycles to start from. As in
+# Puck.move(), at most max_bounces collisions are resolved in each clock
+# cycle of 1/clock_freq, counted from time 0, and the puck glides through
+# the rest of a cycle that has more.
+#
+# Predictor(sim, dt=None) bounces the puck the same way, see predict.py,
+# which also finds the goals with Goal_Lines.
+
+import heapq
+import itertools
+import math
+
+import physics
+
+# Stale events kept in the queue before it's rebuilt
+max_stale = 256
+
+# The lines past the goals, treated as one more object the puck can hit
+# Puck.goal() only counts a puck strictly past a line, so the time is until
+# the puck is at the first float past it. Rounding can still leave it on the
+# line, where cross() puts it past.
+class Goal_Lines:
+
+    def __init__(self, table):
+        self.left = -table.border_width
+        self.right = table.x_len + table.border_width
+
+    # Time until the puck is past a goal line, None if it isn't heading for
+    # one or already is past it, see Puck.goal()
+    def coll_time(self, puck):
+        if puck.velocity.x > 0 and puck.location.x <= self.right:
+            return (math.nextafter(self.right, math.inf) - puck.location.x) \
+                   / puck.velocity.x
+        if puck.velocity.x < 0 and puck.location.x >= self.left:
+            return (math.nextafter(self.left, -math.inf) - puck.location.x) \
+                   / puck.velocity.x
+        return None
+
+    # Put a puck that reached a goal line at the first float past it, where
+    # it is an instant later
+    def cross(self, puck):
+        if puck.velocity.x > 0:
+            x = max(puck.location.x, math.nextafter(self.right, math.inf))
+        else:
+            x = min(puck.location.x, math.nextafter(self.left, -math.inf))
+        puck.location.set(x, puck.location.y)
+
+    # Goal the puck is heading for, as Puck.goal() gives it once it's past
+    # the line
+    def goal(self, puck):
+        if puck.velocity.x > 0:
+            # Left scores
+            return -1
+        # Right scores
+        return 1
+
+class Events:
+
+    def __init__(self, sim):
+
+        self.sim = sim
+        self.puck = sim.puck
+        self.goal_lines = Goal_Lines(sim.table)
+        self.objects = list(sim.collidables) + [self.goal_lines]
+
+        # Simulation time the puck location is valid at, in seconds
+        self.time = 0
+
+        # (time, sequence, object, puck version, object version)
+        self.queue = []
+        self.sequence = itertools.count()
+        self.versions = {}
+        self.stale = 0
+
+        self.schedule_puck()
+
+    def version(self, obj):
+        return self.versions.get(id(obj), 0)
+
+    # Queue the next collision between the puck and obj, if any
+    def schedule(self, obj):
+
+        coll_time = obj.coll_time(self.puck)
+        if coll_time is None:
+            return
+
+        if coll_time < 0:
+            # Weird paddle movement happened
+            # Pretend that the paddle doesn't exist
+            obj.ghost = True
+            return
+
+        heapq.heappush(self.queue, (self.time + coll_time, next(self.sequence),
+                                    obj, self.version(self.puck),
+                                    self.version(obj)))
+
+    def schedule_puck(self):
+        for obj in self.objects:
+            self.schedule(obj)
+
+    # Invalidate the events of an object whose velocity, location or ghost
+    # flag changed and queue new ones
+    def changed(self, obj):
+
+        self.versions[id(obj)] = self.version(obj) + 1
+
+        if obj is self.puck:
+            self.stale += len(self.queue)
+            self.schedule_puck()
+        else:
+            self.stale += 1
+            self.schedule(obj)
+
+        if self.stale > max_stale:
+            self.compact()
+
+    # Drop stale events
+    def compact(self):
+        self.queue = [event for event in self.queue if self.current(event)]
+        heapq.heapify(self.queue)
+        self.stale = 0
+
+    def current(self, event):
+        (ev_time, sequence, obj, puck_version, obj_version) = event
+        return puck_version == self.version(self.puck) \
+               and obj_version == self.version(obj)
+
+    # Time of the next event, or None if nothing will ever happen
+    def next_time(self):
+
+        while self.queue and not self.current(self.queue[0]):
+            heapq.heappop(self.queue)
+        if not self.queue:
+            return None
+        return self.queue[0][0]
+
+    # Move the puck in a straight line up to time t
+    def glide(self, t):
+        self.puck.location.iadd_scaled(self.puck.velocity, t - self.time)
+        self.time = t
+
+    # Run the simulation up to time t, or until a goal is scored
+    # A puck that scored glides on without scoring again until serve(), as
+    # in Simulation.step().
+    # Returns the goal as given by Puck.goal()
+    def advance_to(self, t):
+
+        # Collisions resolved in the clock cycle ending at cycle_end
+        bounces = 0
+        cycle_end = self.time
+        while self.puck not in self.sim.scored:
+
+            ev_time = self.next_time()
+            if ev_time is None or ev_time > t:
+                break
+            if ev_time >= cycle_end:
+                bounces = 0
+                cycle_end = (math.floor(ev_time * physics.clock_freq) + 1) \
+                            / physics.clock_freq
+            elif bounces == physics.max_bounces:
+                # No more collisions are resolved this cycle, go on from
+                # where the puck is at its end
+                self.glide(min(t, cycle_end))
+                self.changed(self.puck)
+                continue
+
+            (ev_time, sequence, obj, puck_version, obj_version) = \
+                heapq.heappop(self.queue)
+            self.glide(ev_time)
+            bounces += 1
+
+            if obj is self.goal_lines:
+                obj.cross(self.puck)
+                goal = self.puck.goal(self.sim.table)
+                self.sim.scored.append(self.puck)
+                self.sim.update_score(goal)
+                return goal
+
+            self.puck.velocity = obj.collide_velocity(self.puck, self.puck.location)
+            self.changed(self.puck)
+
+        self.glide(t)
+        return False
+
+    # Jump straight to the next event
+    # Returns the goal as given by Puck.goal()
+    def fast_forward(self):
+
+        ev_time = self.next_time()
+        if ev_time is None:
+            return False
+        return self.advance_to(ev_time)
+
+    # Move a paddle to a location on the table like the mouse does, see
+    # Paddle.start_move() and Paddle.end_move()
+    def move_paddle(self, paddle, location):
+
+        velocity = self.puck.velocity
+        paddle.start_move(location, self.sim.table, self.puck)
+        paddle.end_move(self.sim.table, self.puck)
+
+        self.changed(paddle)
+        if self.puck.velocity is not velocity:
+            # The paddle hit the puck
+            self.changed(self.puck)
+
+    # Put the puck back after a goal, see Simulation.serve()
+    # Returns the winner as given by Simulation.check_win()
+    def serve(self):
+        winner = self.sim.serve()
+        self.changed(self.puck)
+        return winner
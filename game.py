@@ -1,208 +1,139 @@
+import json
+import os
+import selectors
+import time
+
 import pygame
-import util
 from vector import Vector
-from math import pi
-from collidables import *
+from physics import *
+from coll_table import wall_kinds, wall_row
+from paddle_input import Fifo_Reader, FIFO, Paddle_Path
 
-# Source: https://math.stackexchange.com/questions/913350/how-to-find-the-intersection-point-of-two-moving-circles
+# Ring buffers, recording, metrics and netplay are imported where they're
+# used, so a game that doesn't use them doesn't wait for their imports
 
 # Pixels per millimeter
 pix_per_mm = .45
-# Clock frequency in hertz
-clock_freq = 120
-
-class Puck(Circle):
-
-    color = (255, 4, 4)
-
-    def __init__(self, location, velocity, radius):
-        self.base_location = location
-        self.base_velocity = velocity
-        self.location = self.base_location
-        self.velocity = self.base_velocity
-        self.radius = radius
-        self.ghost = False
-        self.max_velocity = 10000
-
-    # Update location by one clock cycle
-    def move(self, collidables):
-
-        # Time left in move 
-        time_left = 1/clock_freq
-
-        while time_left > 0:
-
-            coll_times = [obj.coll_time(self) for obj in collidables]
-            min_pos = util.min_pos(coll_times)
-
-            if min_pos is None or coll_times[min_pos] > time_left:
-
-                # There are no more collisions this cycle 
-                new_loc = self.location + (time_left * self.velocity)
-                new_vel = self.velocity 
-                time_left = 0
-
-            else:
-                # There is a collision
-                coll_time = coll_times[min_pos]
-
-                if coll_time < 0:
-                    # Weird paddle movement happened
-                    # Pretend that the paddle doesn't exist
-                    collidables[min_pos].ghost = True
-                    continue
-
-                else:
-                    new_loc = self.location + (coll_time * self.velocity)
-                    new_vel = collidables[min_pos].collide_velocity(self, new_loc)
-                    time_left = time_left - coll_time 
-
-            self.location = new_loc
-            self.velocity = new_vel
-
-    # Has a goal just been scored?
-    # Returns false if no goal, -1 if left goal, 1  if right goal
-    def goal(self, arena):
-
-        if self.location.x > arena.x_len + arena.border_width:
-            # Left scores
-            return -1 
-        if self.location.x < -arena.border_width:
-            # Right scores
-            return 1 
-        return False
-
-    # Reset position 
-    def reset(self):
-        self.location = self.base_location
-        self.velocity = self.base_velocity
-
-    # Draw on screen
-    def draw(self, arena):
-        pygame.draw.circle(arena.screen, self.color, 
-                           (mm_to_pix(self.location.x + arena.border_width), 
-                            mm_to_pix(self.location.y + arena.border_width)),
-                           mm_to_pix(self.radius))
-
-class Paddle(Circle):
-
-    def __init__(self, location, radius, color, left):
-        self.location = location 
-        self.new_location = Vector(0, 0)
-        self.radius = radius
-        self.color = color
-        self.ghost = False
-        self.velocity = Vector(0, 0)
-        self.coll_const = .8 
-        # Is left paddle
-        self.left = left
-    
-    # Update the location from a mouse position
-    def start_move(self, new_pos, arena, puck):
-        (m_x, m_y) = new_pos
-        self.new_location = Vector(pix_to_mm(m_x), pix_to_mm(m_y)) \
-                            - Vector(arena.border_width, arena.border_width)
-        self.velocity = clock_freq * (self.new_location - self.location) 
-
-        if not self.ghost:
-            # The paddle can't collide with the puck while its ghost, in order
-            # to let the puck move away
-
-            # See if the paddle crashes into the puck
-            puck_coll_time = puck.coll_time(self)
-
-            if puck_coll_time != None and puck_coll_time < 1/clock_freq:
-
-                # The paddle will collide with the puck
-                self.location = self.location + puck_coll_time * self.velocity
-
-                if self.invalid_loc(arena):
-                    self.ghost = True
-                else:
-                    puck.velocity = self.collide_velocity(puck, puck.location)
-
-            else:
-                self.location = self.new_location
-        else:
-            self.location = self.new_location
-
-        if self.invalid_loc(arena):
-            self.ghost = True
-
-    def end_move(self, arena, puck):
-        self.location = self.new_location
-        self.ghost = self.intersecting(puck) or self.invalid_loc(arena)
-
-    # Paddle in a position where it shouldn't hit the puck 
-    def invalid_loc(self, arena):
 
-        # Is the paddle over the center line
-        if self.left:
-            if (self.location.x + self.radius) > (arena.x_len + arena.mid_line_width)/2:
-                return True 
+puck_color = (255, 4, 4)
+
+# Time the game waits after a goal before serving, in seconds
+goal_pause = 30/clock_freq
+# Font of the scores, pygame's own font if the system doesn't have it
+score_font = 'foootlight'
+score_font_size = 40
+# Font files found by name, so that starting doesn't scan the system fonts
+font_cache = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                          os.path.join(os.path.expanduser('~'), '.cache'),
+                          'air-hockey', 'fonts.json')
+
+# Most time the physics catches up on in one frame, so that a stall doesn't
+# leave it further and further behind
+max_lag = .25
+
+# Draw a puck or paddle on screen, at its location unless given another one
+# Returns the rectangle drawn over
+def draw_circle(circle, color, arena, location=None):
+    if location is None:
+        location = circle.location
+    return pygame.draw.circle(arena.screen, color,
+                       (mm_to_pix(location.x + arena.border_width),
+                        mm_to_pix(location.y + arena.border_width)),
+                       mm_to_pix(circle.radius))
+
+# The file of a system font, None for pygame's default font, from
+# font_cache or found by scanning the system fonts and saved there
+# A font missing when it was looked up stays missing until the cache file is
+# deleted; a cached file that has gone is looked up again
+def font_path(name):
+
+    try:
+        with open(font_cache) as f:
+            paths = json.load(f)
+    except (OSError, ValueError):
+        paths = {}
+    if name in paths and (paths[name] is None or os.path.exists(paths[name])):
+        return paths[name]
+
+    paths[name] = pygame.font.match_font(name)
+    # A cache that can't be written to is only slower, as in layout.save()
+    try:
+        os.makedirs(os.path.dirname(font_cache), exist_ok=True)
+        temp = "%s.%d.tmp" % (font_cache, os.getpid())
+        with open(temp, 'w') as f:
+            json.dump(paths, f)
+        os.replace(temp, font_cache)
+    except OSError:
+        pass
+    return paths[name]
+
+# Score digits rendered and rotated once, keyed by (value, rotation, color)
+class Glyph_Cache:
+
+    def __init__(self, font):
+        self.font = font
+        self.surfaces = {}
+        # Lookups served from the cache and rendered anew
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, value, rotation, color):
+
+        key = (value, rotation, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            self.misses += 1
+            text = self.font.render(str(value), True, color)
+            surface = pygame.transform.rotate(text, rotation)
+            self.surfaces[key] = surface
         else:
-            if (self.location.x - self.radius) < (arena.x_len - arena.mid_line_width)/2:
-                return True
-
-        # Paddle over borders
-        if self.location.x < self.radius:
-            return True
-        if self.location.x > arena.x_len - self.radius:
-            return True
-        if self.location.y < self.radius:
-            return True
-        if self.location.y > arena.y_len - self.radius:
-            return True
-
-        return False
-
-    def draw(self, arena):
-        pygame.draw.circle(arena.screen, self.color, 
-                           (mm_to_pix(self.location.x + arena.border_width), 
-                            mm_to_pix(self.location.y + arena.border_width)),
-                           mm_to_pix(self.radius))
+            self.hits += 1
+        return surface
+
+    # Render the given values ahead of time, without counting the lookups
+    def warm(self, values, rotations, color):
+        (hits, misses) = (self.hits, self.misses)
+        for value in values:
+            for rotation in rotations:
+                self.get(value, rotation, color)
+        (self.hits, self.misses) = (hits, misses)
 
 # Represents the surface that the game is played on
-class Arena:
+class Arena(Table):
 
-    border_width = 100 
     border_color = (10, 15, 176)
     space_color = (255,255,255)
+    score_color = (222,222,0)
+    # Scores are written along the short borders, read from either side
+    score_rotations = (90, -90)
 
-    x_len = 3000
-    y_len = 1000
-
-    goal_width = 300
-    goal_y_low = (y_len - goal_width) / 2
-    goal_y_high = (y_len + goal_width) / 2
-
-    screen_x = x_len + 2 * border_width
-    screen_y = y_len + 2 * border_width
-
-    mid_line_width = 50
+    tri_border_offset = 5
 
-    # Middles of each of the borders
-    mid_top_b = border_width/2
-    mid_bot_b = y_len + 1.5 * border_width
-    mid_left_b = border_width/2
-    mid_right_b = x_len + 1.5 * border_width
+    def __init__(self, layout=None):
 
-    tri_width = border_width*.5 
-    tri_height = tri_width*.7
-    tri_border_offset = 5 
+        Table.__init__(self, layout)
 
-    tri_right_right = x_len + border_width + tri_border_offset
-    tri_right_left = tri_right_right - tri_height
-    tri_left_left = border_width - tri_border_offset
-    tri_left_right = tri_left_left + tri_height
+        self.screen_x = self.x_len + 2 * self.border_width
+        self.screen_y = self.y_len + 2 * self.border_width
 
+        # Middles of each of the borders
+        self.mid_top_b = self.border_width/2
+        self.mid_bot_b = self.y_len + 1.5 * self.border_width
+        self.mid_left_b = self.border_width/2
+        self.mid_right_b = self.x_len + 1.5 * self.border_width
 
+        self.tri_width = self.border_width*.5
+        self.tri_height = self.tri_width*.7
 
-    def __init__(self):
+        self.tri_right_right = self.x_len + self.border_width + self.tri_border_offset
+        self.tri_right_left = self.tri_right_right - self.tri_height
+        self.tri_left_left = self.border_width - self.tri_border_offset
+        self.tri_left_right = self.tri_left_left + self.tri_height
 
-        self.screen = pygame.display.set_mode((mm_to_pix(self.screen_x), 
+        self.screen = pygame.display.set_mode((mm_to_pix(self.screen_x),
                                                mm_to_pix(self.screen_y)))
-        self.score_font = pygame.font.SysFont('foootlight', 40)
+        self.score_font = pygame.font.Font(font_path(score_font), score_font_size)
+        self.glyphs = Glyph_Cache(self.score_font)
 
         self.top_right_tri = [(mm_to_pix(a), mm_to_pix(b)) for (a,b) in
                         [(self.tri_right_left, self.mid_top_b),
@@ -221,28 +152,38 @@ class Arena:
                          (self.tri_left_left, self.mid_bot_b + self.tri_width/2),
                          (self.tri_left_left, self.mid_bot_b - self.tri_width/2)]]
 
-    def draw(self, score):
+        # The static part of the arena, drawn once
+        self.background = self.render_background()
+        # Score shown on screen and where it's drawn
+        self.shown_score = None
+        self.score_rects = []
+
+    # Draw everything that never changes on a surface of its own
+    def render_background(self):
+
+        background = pygame.Surface(self.screen.get_size()).convert()
+
         borders = pygame.Rect(0, 0, mm_to_pix(self.screen_x), mm_to_pix(self.screen_y))
-        pygame.draw.rect(self.screen, self.border_color, borders)
+        pygame.draw.rect(background, self.border_color, borders)
 
-        cent_arena = pygame.Rect(mm_to_pix(self.border_width), 
+        cent_arena = pygame.Rect(mm_to_pix(self.border_width),
                                  mm_to_pix(self.border_width),
-                                 mm_to_pix(self.x_len), 
+                                 mm_to_pix(self.x_len),
                                  mm_to_pix(self.y_len))
 
-        pygame.draw.rect(self.screen, self.space_color, cent_arena)
-        
-        goal_right = pygame.Rect(mm_to_pix(self.border_width + self.x_len), 
+        pygame.draw.rect(background, self.space_color, cent_arena)
+
+        goal_right = pygame.Rect(mm_to_pix(self.border_width + self.x_len),
                                  mm_to_pix(self.border_width + self.goal_y_low),
-                                 mm_to_pix(self.border_width), 
+                                 mm_to_pix(self.border_width),
                                  mm_to_pix(self.goal_width))
-        pygame.draw.rect(self.screen, self.space_color, goal_right)
+        pygame.draw.rect(background, self.space_color, goal_right)
 
-        goal_left = pygame.Rect(mm_to_pix(0), 
+        goal_left = pygame.Rect(mm_to_pix(0),
                                  mm_to_pix(self.border_width + self.goal_y_low),
-                                 mm_to_pix(self.border_width), 
+                                 mm_to_pix(self.border_width),
                                  mm_to_pix(self.goal_width))
-        pygame.draw.rect(self.screen, self.space_color, goal_left)
+        pygame.draw.rect(background, self.space_color, goal_left)
 
         # Draw middle line
         mid_line = pygame.Rect(mm_to_pix(self.border_width \
@@ -250,142 +191,142 @@ class Arena:
                                mm_to_pix(self.border_width),
                                mm_to_pix(self.mid_line_width),
                                mm_to_pix(self.y_len))
-        pygame.draw.rect(self.screen, (0,0,0), mid_line)
+        pygame.draw.rect(background, (0,0,0), mid_line)
+
+        self.draw_obstacles(background)
+        self.draw_triangles(background)
+
+        return background
+
+    # Draw the obstacles of the layout, circles as discs and walls as lines
+    def draw_obstacles(self, surface):
+
+        def pix(x, y):
+            return (mm_to_pix(x + self.border_width), mm_to_pix(y + self.border_width))
+
+        for obj in self.layout.obstacles():
+            if isinstance(obj, Circle):
+                pygame.draw.circle(surface, self.border_color,
+                                   pix(obj.location.x, obj.location.y),
+                                   mm_to_pix(obj.radius))
+                continue
+            (axis, facing, gate) = wall_kinds[type(obj)]
+            (pos, low, high) = wall_row(obj, axis)
+            # Infinite walls are drawn across the table
+            (low, high) = (max(low, 0), min(high, self.y_len if axis == 0 else self.x_len))
+            ends = [(pos, low), (pos, high)] if axis == 0 else [(low, pos), (high, pos)]
+            pygame.draw.line(surface, self.border_color, *[pix(*end) for end in ends],
+                             width=max(1, mm_to_pix(self.mid_line_width) // 2))
+
+    def draw_triangles(self, surface):
+        pygame.draw.polygon(surface, self.score_color, self.top_right_tri)
+        pygame.draw.polygon(surface, self.score_color, self.top_left_tri)
+        pygame.draw.polygon(surface, self.score_color, self.bot_right_tri)
+        pygame.draw.polygon(surface, self.score_color, self.bot_left_tri)
+
+    # Draw the whole arena
+    def draw(self, score):
+        self.screen.blit(self.background, (0, 0))
+        self.score_rects = []
+        self.draw_scores(score)
 
-        # Draw scores
-        score_color = (222,222,0)
-        (l_score, r_score) = score
-        r_score_txt = self.score_font.render(str(r_score), True, score_color)
-        l_score_txt = self.score_font.render(str(l_score), True, score_color)
+    # Draw the scores in place of the ones on screen
+    # Returns the rectangles changed on screen
+    def draw_scores(self, score):
 
-        l_score_r = pygame.transform.rotate(l_score_txt, 90)
-        l_score_l = pygame.transform.rotate(l_score_txt, -90)
-        r_score_r = pygame.transform.rotate(r_score_txt, 90)
-        r_score_l = pygame.transform.rotate(r_score_txt, -90)
+        dirty = list(self.score_rects)
+        for rect in self.score_rects:
+            self.screen.blit(self.background, rect, rect)
 
-        self.screen.blit(l_score_r,
+        (l_score, r_score) = score
+        l_score_r = self.glyphs.get(l_score, 90, self.score_color)
+        l_score_l = self.glyphs.get(l_score, -90, self.score_color)
+        r_score_r = self.glyphs.get(r_score, 90, self.score_color)
+        r_score_l = self.glyphs.get(r_score, -90, self.score_color)
+
+        self.score_rects = [
+            self.screen.blit(l_score_r,
                     (mm_to_pix(self.mid_right_b) - l_score_r.get_width()/2,
-                     mm_to_pix(self.mid_top_b) - l_score_r.get_height()/2))
-        self.screen.blit(r_score_r,
+                     mm_to_pix(self.mid_top_b) - l_score_r.get_height()/2)),
+            self.screen.blit(r_score_r,
                     (mm_to_pix(self.mid_right_b) - l_score_r.get_width()/2,
-                     mm_to_pix(self.mid_bot_b) - l_score_r.get_height()/2))
-        self.screen.blit(l_score_l,
+                     mm_to_pix(self.mid_bot_b) - l_score_r.get_height()/2)),
+            self.screen.blit(l_score_l,
                     (mm_to_pix(self.mid_left_b) - l_score_r.get_width()/2,
-                     mm_to_pix(self.mid_top_b) - l_score_r.get_height()/2))
-        self.screen.blit(r_score_l,
+                     mm_to_pix(self.mid_top_b) - l_score_r.get_height()/2)),
+            self.screen.blit(r_score_l,
                     (mm_to_pix(self.mid_left_b) - l_score_r.get_width()/2,
-                     mm_to_pix(self.mid_bot_b) - l_score_r.get_height()/2))
+                     mm_to_pix(self.mid_bot_b) - l_score_r.get_height()/2))]
+
+        # The triangles go over the scores
+        self.draw_triangles(self.screen)
 
-        pygame.draw.polygon(self.screen, score_color, self.top_right_tri)
-        pygame.draw.polygon(self.screen, score_color, self.top_left_tri)
-        pygame.draw.polygon(self.screen, score_color, self.bot_right_tri)
-        pygame.draw.polygon(self.screen, score_color, self.bot_left_tri)
+        self.shown_score = score
+        return dirty + self.score_rects
 
 
-class Game:
+# Pygame front end drawing a Simulation
+class Game(Simulation):
 
-    def __init__(self):
+    def __init__(self, n_pucks=1, layout=None):
 
-        pygame.init()
+        # Only what the game uses, pygame.init() also starts audio and
+        # joysticks
+        pygame.display.init()
+        pygame.font.init()
 
-        self.win_score = 7
-        self.arena = Arena()
-        self.puck = Puck(Vector(self.arena.x_len/2, self.arena.y_len/2), 
-                         Vector(0,0), 50)
-        paddle_color = (196, 0, 0)
-        self.paddle_1 = Paddle(Vector(300, 300), 70, paddle_color, False)
-        self.paddle_2 = Paddle(Vector(200, self.arena.y_len / 2), 70, paddle_color, True)
+        Simulation.__init__(self, Arena(layout), n_pucks)
+        self.arena = self.table
         self.clock = pygame.time.Clock()
-        
-        # (left score, right score)
-        self.score = (0,0)
-
-        # Very small corner circle radius
-        bcirc_r = 10
-
-        # Objects that the puck can collide with
-        self.collidables = [
-                            # Upper right wall
-                            Wall_Vert_Left(self.arena.x_len, 0,
-                                self.arena.goal_y_low),
-                            # Lower right wall
-                            Wall_Vert_Left(self.arena.x_len, 
-                                self.arena.goal_y_high,
-                                self.arena.y_len),
-                            # Right goal top wall
-                            Wall_Horz_Down(self.arena.x_len, 
-                                self.arena.x_len 
-                                + 2*self.puck.radius + self.arena.border_width,
-                                self.arena.goal_y_low),
-                            # Right goal bottom wall
-                            Wall_Horz_Up(self.arena.x_len, 
-                                self.arena.x_len 
-                                + 2*self.puck.radius + self.arena.border_width,
-                                self.arena.goal_y_high),
-                            # Right goal top corner
-                            Circle(Vector(self.arena.x_len + bcirc_r,
-                                          self.arena.goal_y_low - bcirc_r),
-                                   bcirc_r),
-                            # Right goal bottom corner
-                            Circle(Vector(self.arena.x_len + bcirc_r,
-                                          self.arena.goal_y_high + bcirc_r),
-                                   bcirc_r),
-                            # Upper left wall
-                            Wall_Vert_Right(0, 0,
-                                self.arena.goal_y_low),
-                            # Lower left wall
-                            Wall_Vert_Right(0,
-                                self.arena.goal_y_high,
-                                self.arena.y_len),
-                            # Left goal top wall
-                            Wall_Horz_Down(- 2*self.puck.radius - self.arena.border_width,
-                                           0, self.arena.goal_y_low),
-                            # Left goal bottom wall
-                            Wall_Horz_Up(- 2*self.puck.radius - self.arena.border_width,
-                                           0, self.arena.goal_y_high),
-                            # Left goal top corner
-                            Circle(Vector(-bcirc_r,
-                                          self.arena.goal_y_low - bcirc_r),
-                                   bcirc_r),
-                            # Left goal bottom corner
-                            Circle(Vector(-bcirc_r,
-                                          self.arena.goal_y_high + bcirc_r),
-                                   bcirc_r),
-                            # Top wall
-                            Wall_Horz_Down_Inf(0),
-                            # Bottom wall
-                            Wall_Horz_Up_Inf(self.arena.y_len),
-                            self.paddle_1,
-                            self.paddle_2] 
-        # Objects that must be drawn every cycle 
-        self.drawables = [self.puck, self.paddle_1, self.paddle_2]
-
-    def draw(self):
-        self.arena.screen.fill((0, 0, 0))
-        self.arena.draw(self.score)
-
-        for drawable in self.drawables:
-            drawable.draw(self.arena)
-
-    def update_score(self, goal):
-        (left_score, right_score) = self.score
-        if goal < 0:
-            left_score = left_score + 1
-        elif goal > 0:
-            right_score = right_score + 1
-        self.score = (left_score, right_score)
-
-    def check_win(self):
-        (left_score, right_score) = self.score
-        if left_score >= self.win_score:
-            return -1
-        if right_score >= self.win_score:
-            return 1
-        return None
-
-    def reset(self):
-        self.puck.reset()
-        self.score = (0,0) 
+
+        # Everything drawn, with its color
+        self.circles = [(puck, puck_color) for puck in self.pucks] \
+                       + [(paddle, paddle.color)
+                          for paddle in [self.paddle_1, self.paddle_2]]
+        self.save_state()
+
+        # Where the circles were drawn, None if the screen needs redrawing
+        # from scratch
+        self.drawn = None
+
+    # Setup the first frame can do without, done once it's on screen
+    def finish_startup(self):
+        # Every score of a match
+        self.arena.glyphs.warm(range(self.win_score + 1),
+                               self.arena.score_rotations, self.arena.score_color)
+
+    # Remember where everything is before a physics step, see draw()
+    def save_state(self):
+        self.previous = [circle.location.copy() for (circle, color) in self.circles]
+
+    # Draw everything alpha of the way from where it was at the last
+    # save_state() to where it is now
+    #
+    # Only what changed since the last frame is drawn: the background is put
+    # back where the circles were, the scores are redrawn if they changed or
+    # were drawn over, and the circles are drawn in their new places.
+    # Returns the rectangles changed on screen, for pygame.display.update()
+    def draw(self, alpha=1):
+
+        arena = self.arena
+
+        if self.drawn is None:
+            arena.draw(self.score)
+            dirty = [arena.screen.get_rect()]
+        else:
+            for rect in self.drawn:
+                arena.screen.blit(arena.background, rect, rect)
+            dirty = list(self.drawn)
+            if self.score != arena.shown_score or any(
+                    rect.collidelist(arena.score_rects) >= 0 for rect in self.drawn):
+                dirty += arena.draw_scores(self.score)
+
+        self.drawn = []
+        for ((circle, color), previous) in zip(self.circles, self.previous):
+            location = previous + alpha * (circle.location - previous)
+            self.drawn.append(draw_circle(circle, color, arena, location))
+
+        return dirty + self.drawn
 
 def mm_to_pix(mm):
     return int(mm * pix_per_mm)
@@ -393,59 +334,267 @@ def mm_to_pix(mm):
 def pix_to_mm(pix):
     return pix / pix_per_mm
 
-def game_run():
-    
-    game = Game()
+# Location on the table (in millimeters) under a mouse position
+def mouse_to_table(pos, arena):
+    (m_x, m_y) = pos
+    return Vector(pix_to_mm(m_x), pix_to_mm(m_y)) \
+           - Vector(arena.border_width, arena.border_width)
+
+def game_run(n_pucks=1, fifo=None, ring=None, physics_freq=clock_freq,
+             fps=clock_freq, record=None, metrics=None, opponent=None,
+             net=None, layout=None):
+
+    game = Game(n_pucks, layout)
+    paddles = [game.paddle_1, game.paddle_2]
+
+    # Paddle positions coming in from a tracker, see paddle_input.py
+    selector = selectors.DefaultSelector()
+    if fifo:
+        Fifo_Reader(fifo).register(selector)
+    if ring:
+        from shm_ring import Shm_Ring
+        ring = Shm_Ring(ring)
+
+    # Physics runs in fixed steps of dt, as many as fit in the time since
+    # the last frame, and the time left over is carried to the next frame
+    dt = 1/physics_freq
+
+    # Playing someone over UDP, see netplay.py: net is (True, port) to host
+    # a game and (False, (host, port)) to join one
+    session = None
+    mouse_paddle = game.paddle_1
+    if net:
+        import socket
+        from netplay import Session
+        (host, address) = net
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if host:
+            sock.bind(('', address))
+            address = None
+        session = Session(game, sock, host, address, dt, pause=goal_pause)
+        mouse_paddle = session.local
+
+    # The input since the last frame for each paddle the mouse or a tracker
+    # drives
+    paths = {mouse_paddle: Paddle_Path()}
+    lag = 0
+    last = time.perf_counter()
+    # When the events were last read, in nanoseconds
+    events_read = time.perf_counter_ns()
+    # Time left before serving after a goal, None while playing
+    pause = None
+
+    # Moves the paddles and steps the physics, logging everything if the
+    # game is recorded, see replay.py
+    driver = game
+    if record:
+        from replay import Recorder
+        driver = Recorder(game, record, dt)
+
+    # Computer player on paddle_2 at the given level, see ai.py, which needs
+    # NumPy
+    if opponent:
+        from ai import Opponent
+        opponent = Opponent(game, opponent, dt=dt)
+
+    # Timings and counters of every frame, see metrics.py
+    if metrics is None:
+        from metrics import Null_Metrics
+        metrics = Null_Metrics()
 
     game_running = True
+    first_frame = True
 
     while game_running:
 
-        game.paddle_1.velocity = Vector(0,0)
+        metrics.start_frame()
 
+        mouse = []
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 game_running = False
+            elif event.type == pygame.VIDEOEXPOSE:
+                # Window uncovered, draw it all again
+                game.drawn = None
             elif event.type == pygame.MOUSEMOTION:
-                game.paddle_1.start_move(event.pos, game.arena, game.puck) 
+                mouse.append(mouse_to_table(event.pos, game.arena))
+                metrics.count('mouse_events')
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_q:
                     game_running = False
                 if event.key == pygame.K_r:
-                    # Reset game 
-                    game.reset()
-
-        game.puck.move(game.collidables)
-
-        game.paddle_1.end_move(game.arena, game.puck)
+                    # Reset game
+                    driver.reset()
+                    game.save_state()
+        # Mouse events come without a time, so they're given times spread
+        # evenly over the time since the events were last read
+        read = time.perf_counter_ns()
+        for (i, location) in enumerate(mouse):
+            paths[mouse_paddle].add(location, events_read
+                                    + (i + 1) * (read - events_read) // len(mouse))
+        events_read = read
+        metrics.mark('events')
+
+        # Never blocks, only the input that has already arrived is used
+        samples = []
+        for (key, mask) in selector.select(0):
+            samples += key.data.poll()
+        for sample in samples:
+            if sample.paddle < len(paddles):
+                paths.setdefault(paddles[sample.paddle], Paddle_Path()).add(
+                    Vector(sample.x, sample.y), sample.timestamp)
+        if ring:
+            # Every frame written since the last one, as arrays
+            backlog = ring.backlog_array()
+            for (i, paddle) in enumerate(paddles):
+                frames = backlog[backlog['paddle'] == i]
+                if len(frames):
+                    paths.setdefault(paddle, Paddle_Path()).extend(
+                        frames['x'], frames['y'], frames['timestamp'])
+        metrics.mark('input')
+
+        now = time.perf_counter()
+        lag = min(lag + now - last, max_lag)
+        last = now
+        steps = int(lag / dt)
+        lag -= steps * dt
+
+        if opponent:
+            paths.setdefault(game.paddle_2, Paddle_Path()).add(
+                opponent.target(steps * dt))
+        metrics.mark('ai')
+
+        if session:
+            # The session steps the physics, again for the frames it rolls
+            # back, and waits after goals itself. Only where the paddle is at
+            # the end of each step goes over the network.
+            moves = paths[mouse_paddle].steps(mouse_paddle.location.copy(), steps, dt)
+            for (location, path) in moves:
+                game.save_state()
+                goals = session.advance(location)
+                metrics.count('steps')
+                if goals:
+                    print(game.score)
+
+        elif pause is not None:
+            # The pucks wait, the paddles follow the input without hitting
+            # anything
+            driver.place_paddles({paddle: path.take(paddle.location.copy())
+                                  for (paddle, path) in paths.items()})
+            game.save_state()
+
+            pause -= steps * dt
+            if pause <= 0:
+                pause = None
+                winner = driver.serve()
+                game.save_state()
+                if winner:
+                    if winner < 0:
+                        print("Left wins!!!")
+                    elif winner > 0:
+                        print("Right wins!!!")
 
-        game.draw()
-
-        game.clock.tick(clock_freq)
-        pygame.display.flip()
-
-        # Compute goals
-        goal = game.puck.goal(game.arena)
-        if goal:
-            # Goal scored
-            game.update_score(goal)
-            print(game.score)
-
-            winner = game.check_win()
-
-            # Wait and reset puck
-            for i in range(0, 30):
-                game.clock.tick(clock_freq)
-
-            if winner:
-                if winner < 0:
-                    print("Left wins!!!")
-                elif winner > 0: 
-                    print("Right wins!!!")
-                game.reset()
-            else:
-                game.puck.reset()
-
-clock = pygame.time.Clock()
-
-game_run()
+        else:
+            # The path of each paddle since the last frame, cut into the
+            # physics steps. A recorded game logs the paths too, see
+            # replay.py.
+            moves = {paddle: path.steps(paddle.location.copy(), steps, dt)
+                     for (paddle, path) in paths.items()}
+
+            for i in range(steps):
+
+                game.save_state()
+
+                locations = {paddle: move[i][0] for (paddle, move) in moves.items()}
+                goals = driver.step_paddles(locations, dt,
+                    {paddle: move[i][1] for (paddle, move) in moves.items()})
+                metrics.count('steps')
+
+                if goals:
+                    # Goal scored
+                    print(game.score)
+                    pause = goal_pause
+                    lag = 0
+                    break
+
+        metrics.mark('physics')
+
+        # Drawn between the last two physics steps, by the time left over
+        dirty = game.draw(lag / dt if pause is None else 1)
+        metrics.mark('draw')
+        pygame.display.update(dirty)
+        if first_frame:
+            game.finish_startup()
+            first_frame = False
+        metrics.mark('display')
+        game.clock.tick(fps)
+        metrics.mark('tick')
+
+        # After drawing, so the frame's glyph lookups are counted with it
+        metrics.observe(game)
+
+        metrics.end_frame()
+
+    if record:
+        driver.close()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pucks', type=int, default=1,
+                        help="number of pucks on the table")
+    parser.add_argument('--layout', metavar='FILE',
+                        help="play on the table described in a JSON file, "
+                             "see layout.py")
+    parser.add_argument('--fifo', nargs='?', const=FIFO,
+                        help="read paddle positions from a FIFO (default %s)" % FIFO)
+    parser.add_argument('--ring', nargs='?', const=True, metavar='PATH',
+                        help="read paddle positions from a shared memory ring "
+                             "(default the ring shm_ring.py makes)")
+    parser.add_argument('--physics-hz', type=float, default=clock_freq,
+                        help="physics steps per second (default %d)" % clock_freq)
+    parser.add_argument('--fps', type=float, default=clock_freq,
+                        help="frames drawn per second (default %d)" % clock_freq)
+    parser.add_argument('--record', metavar='LOG',
+                        help="record the game, play it back with replay.py")
+    parser.add_argument('--ai', nargs='?', const='medium', metavar='LEVEL',
+                        help="let the computer play the left paddle, easy, "
+                             "medium (the default) or hard")
+    parser.add_argument('--host', type=int, metavar='PORT',
+                        help="host a game for someone to join over UDP")
+    parser.add_argument('--join', metavar='HOST:PORT',
+                        help="join a hosted game, playing the left paddle")
+    parser.add_argument('--metrics', type=int, nargs='?', const=8765,
+                        metavar='PORT',
+                        help="time every frame and serve the numbers over "
+                             "HTTP on localhost (default port 8765)")
+    parser.add_argument('--metrics-out', metavar='FILE',
+                        help="time every frame and save the last frames to a "
+                             "CSV or JSON file on exit")
+    args = parser.parse_args()
+
+    net = None
+    if args.host is not None:
+        net = (True, args.host)
+    elif args.join:
+        (address, port) = args.join.rsplit(':', 1)
+        net = (False, (address, int(port)))
+    if net and (args.record or args.ai):
+        parser.error("--record and --ai don't work with networked games")
+
+    if args.ring is True:
+        from shm_ring import RING
+        args.ring = RING
+
+    metrics = None
+    if args.metrics is not None or args.metrics_out:
+        from metrics import Metrics, serve as serve_metrics
+        metrics = Metrics()
+    if args.metrics is not None:
+        serve_metrics(metrics, args.metrics)
+
+    game_run(args.pucks, args.fifo, args.ring, args.physics_hz, args.fps,
+             args.record, metrics, args.ai, net, args.layout)
+
+    if args.metrics_out:
+        metrics.save(args.metrics_out)
@@ -0,0 +1,144 @@
+# Uniform grid broad phase over the collidables
+#
+# Every bounded object is stored in the square cells its bounding box
+# overlaps. A query only asks the objects in the cells the puck can sweep
+# through in the time left of its move, so the cost of a sub-step depends
+# on how crowded the neighbourhood of the puck is rather than on the size of
+# the arena. Infinite walls and objects the grid doesn't know the shape of
+# are asked on every query.
+#
+# Static objects are indexed once. Objects that move, like paddles, are
+# re-indexed by update(), which only touches the grid when the object has
+# crossed into different cells.
+
+import math
+
+from collidables import *
+
+# Default cell side in millimeters
+cell_size = 200
+# Added around the swept area, so contacts right at the end of the move
+# aren't lost to rounding at a cell edge
+margin = 1
+
+# Bounding box (x low, y low, x high, y high) of an object, or None if it
+# isn't bounded
+def bounds(obj):
+
+    if isinstance(obj, Circle):
+        r = obj.radius
+        return (obj.location.x - r, obj.location.y - r,
+                obj.location.x + r, obj.location.y + r)
+    if isinstance(obj, (Wall_Vert_Left, Wall_Vert_Right)):
+        return (obj.x, obj.y_low, obj.x, obj.y_high)
+    if isinstance(obj, (Wall_Horz_Up, Wall_Horz_Down)):
+        return (obj.x_low, obj.y, obj.x_high, obj.y)
+    return None
+
+class Grid:
+
+    def __init__(self, objects, size=cell_size):
+
+        self.objects = list(objects)
+        self.size = size
+
+        # (column, row) -> indexes of the objects overlapping the cell
+        self.cells = {}
+        # Indexes of the objects asked on every query
+        self.always = []
+        # Index -> (column low, row low, column high, row high)
+        self.ranges = {}
+        # Index of every object, for update()
+        self.indexes = {id(obj): index for (index, obj) in enumerate(self.objects)}
+
+        # Query number each object was last collected in, to skip objects
+        # found in several cells
+        self.stamps = [0] * len(self.objects)
+        self.query = 0
+
+        for (index, obj) in enumerate(self.objects):
+            box = bounds(obj)
+            if box is None:
+                self.always.append(index)
+            else:
+                self.insert(index, self.cell_range(box))
+
+    # Cells overlapped by a bounding box
+    def cell_range(self, box):
+        (x_low, y_low, x_high, y_high) = box
+        return (math.floor(x_low / self.size), math.floor(y_low / self.size),
+                math.floor(x_high / self.size), math.floor(y_high / self.size))
+
+    def insert(self, index, cell_range):
+        (c_low, r_low, c_high, r_high) = cell_range
+        for column in range(c_low, c_high + 1):
+            for row in range(r_low, r_high + 1):
+                self.cells.setdefault((column, row), []).append(index)
+        self.ranges[index] = cell_range
+
+    def remove(self, index):
+        (c_low, r_low, c_high, r_high) = self.ranges.pop(index)
+        for column in range(c_low, c_high + 1):
+            for row in range(r_low, r_high + 1):
+                self.cells[(column, row)].remove(index)
+
+    # Re-index an object after it moved
+    def update(self, obj):
+
+        index = self.indexes[id(obj)]
+        if index not in self.ranges:
+            # Not bounded, asked on every query anyway
+            return
+
+        cell_range = self.cell_range(bounds(obj))
+        if cell_range != self.ranges[index]:
+            self.remove(index)
+            self.insert(index, cell_range)
+
+    # Indexes of the objects the puck could reach within time_left
+    def candidates(self, puck, time_left):
+
+        r = puck.radius + margin
+        (x, y) = (puck.location.x, puck.location.y)
+        end_x = x + puck.velocity.x * time_left
+        end_y = y + puck.velocity.y * time_left
+
+        (c_low, r_low, c_high, r_high) = self.cell_range(
+            (min(x, end_x) - r, min(y, end_y) - r,
+             max(x, end_x) + r, max(y, end_y) + r))
+
+        if (c_high - c_low + 1) * (r_high - r_low + 1) > len(self.objects):
+            # Sweeping more cells than there are objects
+            return range(len(self.objects))
+
+        self.query += 1
+        query = self.query
+        stamps = self.stamps
+        found = list(self.always)
+
+        cells = self.cells
+        for column in range(c_low, c_high + 1):
+            for row in range(r_low, r_high + 1):
+                for index in cells.get((column, row), ()):
+                    if stamps[index] != query:
+                        stamps[index] = query
+                        found.append(index)
+
+        return found
+
+    # Time until the puck hits the first object it can reach within
+    # time_left and that object, see physics.first_collision()
+    def first_collision(self, puck, time_left):
+
+        best = None
+        best_index = None
+
+        for index in self.candidates(puck, time_left):
+            coll_time = self.objects[index].coll_time(puck)
+            if coll_time is not None and (best is None or coll_time < best
+                    or (coll_time == best and index < best_index)):
+                (best, best_index) = (coll_time, index)
+
+        if best is None:
+            return (None, None)
+        return (best, self.objects[best_index])
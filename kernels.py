@@ -0,0 +1,224 @@
+# Collision kernels on plain floats and arrays, for compiling with Numba
+#
+# The same wall and circle math as collidables.py and Puck.move, written
+# without objects: no attribute lookups, no Vector temporaries and no
+# atan2/sin/cos in the circle test, which uses the distance along and across
+# the path instead. The objects of a CollisionTable are packed into two
+# arrays once, and a whole move, bounces and all, is one call.
+#
+#   walls    rows of axis, facing, position, span low, span high, gate,
+#            object index, see coll_table.py
+#   circles  rows of x, y, radius, v_x, v_y, collision constant, ghost,
+#            object index
+#
+# Nothing here needs Numba, the functions run as plain Python too, which is
+# how they're checked against the reference code when Numba isn't installed
+# (see tests/test_kernels.py and benchmarks/kernels.py).
+# physics.select_backend() compiles them.
+#
+# The results agree with the reference to rounding, not bit for bit, so a
+# game recorded or played over the network with one backend has to be
+# played back with the same one.
+
+import math
+
+(WALL_AXIS, WALL_FACING, WALL_POS, WALL_LOW, WALL_HIGH, WALL_GATE,
+ WALL_INDEX) = range(7)
+(CIRC_X, CIRC_Y, CIRC_R, CIRC_V_X, CIRC_V_Y, CIRC_CONST, CIRC_GHOST,
+ CIRC_INDEX) = range(8)
+
+# Time until a puck at (x, y) with velocity (v_x, v_y) and radius r hits
+# the first wall or circle, skipping walls flagged in skip
+# Returns (time, kind, row) with kind 0 for walls and 1 for circles, and
+# row -1 if it won't hit anything. Ties go to the lowest object index.
+def first_collision(walls, circles, skip, x, y, v_x, v_y, r):
+
+    best = math.inf
+    best_index = -1
+    kind = 0
+    row = -1
+
+    for i in range(walls.shape[0]):
+
+        if skip[i]:
+            continue
+
+        if walls[i, WALL_AXIS] == 0:
+            (p, q, v_p, v_q) = (x, y, v_x, v_y)
+        else:
+            (p, q, v_p, v_q) = (y, x, v_y, v_x)
+        pos = walls[i, WALL_POS]
+        gate = walls[i, WALL_GATE]
+
+        if walls[i, WALL_FACING] < 0:
+            # Left facing, hit while moving towards +p
+            if v_p <= 0 or p + gate * r > pos:
+                continue
+            coll_time = (pos - (p + r)) / v_p
+        else:
+            if v_p >= 0 or p - gate * r < pos:
+                continue
+            coll_time = ((p - r) - pos) / -v_p
+
+        coll_q = q + coll_time * v_q
+        if coll_q < walls[i, WALL_LOW] or coll_q > walls[i, WALL_HIGH]:
+            continue
+
+        index = walls[i, WALL_INDEX]
+        if coll_time < best or (coll_time == best and index < best_index):
+            (best, best_index, kind, row) = (coll_time, index, 0, i)
+
+    speed_sq = v_x * v_x + v_y * v_y
+    if speed_sq > 0:
+
+        speed = math.sqrt(speed_sq)
+        for i in range(circles.shape[0]):
+
+            if circles[i, CIRC_GHOST]:
+                continue
+
+            d_x = circles[i, CIRC_X] - x
+            d_y = circles[i, CIRC_Y] - y
+            dot = d_x * v_x + d_y * v_y
+            if dot < 0 or (d_x == 0 and d_y == 0):
+                continue
+
+            # Closest distance between the centers along the path, squared
+            cross = d_x * v_y - d_y * v_x
+            r_sum = circles[i, CIRC_R] + r
+            disc = r_sum * r_sum - cross * cross / speed_sq
+            if disc <= 0:
+                continue
+
+            coll_time = (dot / speed - math.sqrt(disc)) / speed
+            index = circles[i, CIRC_INDEX]
+            if coll_time < best or (coll_time == best and index < best_index):
+                (best, best_index, kind, row) = (coll_time, index, 1, i)
+
+    return (best, kind, row)
+
+# Velocity of a puck at (x, y) with velocity (v_x, v_y) after hitting the
+# circle in row i, see Circle.collide_velocity()
+def circle_velocity(circles, i, x, y, v_x, v_y, max_velocity):
+
+    n_x = circles[i, CIRC_X] - x
+    n_y = circles[i, CIRC_Y] - y
+    mag = math.sqrt(n_x * n_x + n_y * n_y)
+    n_x /= mag
+    n_y /= mag
+
+    circle_dot = circles[i, CIRC_V_X] * n_x + circles[i, CIRC_V_Y] * n_y
+    puck_dot = v_x * n_x + v_y * n_y
+    scale = 1 + circles[i, CIRC_CONST]
+    v_x = v_x + (n_x * circle_dot - n_x * puck_dot) * scale
+    v_y = v_y + (n_y * circle_dot - n_y * puck_dot) * scale
+
+    speed = math.sqrt(v_x * v_x + v_y * v_y)
+    if speed > max_velocity:
+        v_x = v_x / speed * max_velocity
+        v_y = v_y / speed * max_velocity
+
+    return (v_x, v_y)
+
+# Puck.move on plain floats: move the puck for time_left seconds, bouncing
+# off the walls and circles
+#
+# Circles the puck turns out to be inside of are ghosted in the circles
+# array, as Puck.move does. A wall the puck is inside of is skipped for the
+# rest of the move, where Puck.move would keep asking it.
+# Returns (x, y, v_x, v_y, bounces)
+def move(walls, circles, skip, x, y, v_x, v_y, r, time_left, wall_coll_const,
+         max_velocity, max_bounces):
+
+    bounces = 0
+    while time_left > 0:
+
+        (coll_time, kind, row) = first_collision(walls, circles, skip,
+                                                 x, y, v_x, v_y, r)
+
+        if row < 0 or coll_time > time_left or bounces == max_bounces:
+            x += v_x * time_left
+            y += v_y * time_left
+            time_left = 0
+
+        elif coll_time < 0:
+            # Weird paddle movement happened
+            if kind == 0:
+                skip[row] = 1
+            else:
+                circles[row, CIRC_GHOST] = 1
+
+        else:
+            c_x = x + v_x * coll_time
+            c_y = y + v_y * coll_time
+            if kind == 0:
+                if walls[row, WALL_AXIS] == 0:
+                    v_x = -wall_coll_const * v_x
+                else:
+                    v_y = -wall_coll_const * v_y
+            else:
+                # From where the puck was, like Puck.move
+                (v_x, v_y) = circle_velocity(circles, row, x, y, v_x, v_y,
+                                             max_velocity)
+            (x, y) = (c_x, c_y)
+            time_left -= coll_time
+            bounces += 1
+
+    return (x, y, v_x, v_y, bounces)
+
+# Compile the kernels with the numba module, in place
+# The kernels call each other through the module, so they're all replaced
+def compile_kernels(numba):
+
+    global first_collision, circle_velocity, move
+
+    if hasattr(move, 'py_func'):
+        return
+    first_collision = numba.njit(cache=True)(first_collision)
+    circle_velocity = numba.njit(cache=True)(circle_velocity)
+    move = numba.njit(cache=True)(move)
+
+# The objects of a CollisionTable packed for the kernels
+#
+# The static walls and circles are packed once. Circles that move, the
+# paddles, are copied into their rows before every move, and ghost flags
+# the move set are copied back.
+class Packed_Table:
+
+    def __init__(self, table, np):
+
+        walls = []
+        circles = []
+        for ((axis, facing), group) in table.walls.items():
+            for (pos, low, high, gate, index) in group:
+                walls.append((axis, facing, pos, low, high, gate, index))
+        self.circles = [circle for (c_x, c_y, c_r, circle, index) in table.circles]
+        for (c_x, c_y, c_r, circle, index) in table.circles:
+            circles.append((c_x, c_y, c_r, 0, 0, circle.coll_const, 0, index))
+        for (obj, index) in table.dynamic:
+            self.circles.append(obj)
+            circles.append((0, 0, obj.radius, 0, 0, obj.coll_const, 0, index))
+
+        self.first_dynamic = len(table.circles)
+        self.walls = np.array(walls, dtype=np.float64).reshape(-1, 7)
+        self.circle_rows = np.array(circles, dtype=np.float64).reshape(-1, 8)
+        self.skip = np.zeros(len(walls), dtype=np.int8)
+
+    # Copy the state of the circles in before a move
+    def load(self):
+        rows = self.circle_rows
+        for (i, circle) in enumerate(self.circles):
+            if i >= self.first_dynamic:
+                rows[i, CIRC_X] = circle.location.x
+                rows[i, CIRC_Y] = circle.location.y
+                rows[i, CIRC_V_X] = circle.velocity.x
+                rows[i, CIRC_V_Y] = circle.velocity.y
+            rows[i, CIRC_GHOST] = circle.ghost
+        self.skip[:] = 0
+
+    # Copy ghost flags set by a move back out
+    def store(self):
+        rows = self.circle_rows
+        for (i, circle) in enumerate(self.circles):
+            if rows[i, CIRC_GHOST] and not circle.ghost:
+                circle.ghost = True
@@ -0,0 +1,287 @@
+# Arena layouts as data, compiled into flat geometry cached on disk
+#
+# A layout is a JSON object, every key optional, defaulting to the standard
+# table:
+#
+#   x_len, y_len     playing surface in millimeters
+#   border_width     border around it, which the goals go through
+#   goal_width       opening of both goals, centered on the short walls
+#   mid_line_width   the paddles have to stay on their side of it
+#   corner_radius    circles rounding the corners of the goal mouths
+#   puck_radius, paddle_radius
+#   obstacles        anything else on the table, each one of
+#                      {"circle": [x, y, radius]}
+#                      {"wall": "vert_left", "at": x, "span": [y_1, y_2]}
+#                      {"wall": "horz_up_inf", "at": y}
+#                    with walls named after the classes in collidables.py
+#
+# Compiling a layout builds the walls and circles Simulation used to build
+# by hand, then the obstacles, and flattens every object into a row of
+# record_size doubles with the constants CollisionTable works out for it:
+#
+#   walls    kind, axis, facing, gate, position, span low, span high
+#   circles  kind, x, y, radius
+#
+# (kind indexes kinds, the others are as in coll_table.py; infinite walls
+# span -inf to inf). The rows, the table sizes and the number of obstacles
+# make up one buffer of doubles, saved under the SHA-256 of the layout file
+# (of the layout as canonical JSON when it's given as a dict), so loading a
+# layout compiled before is a hash of the file and a single read, without
+# parsing it. Objects are built anew from the rows for every Simulation, as
+# ghost flags belong to a game.
+
+import array
+import hashlib
+import json
+import math
+import os
+import struct
+import sys
+
+from collidables import *
+from coll_table import wall_kinds, wall_row
+from vector import Vector
+
+# Where compiled layouts are kept
+cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                         os.path.join(os.path.expanduser('~'), '.cache'),
+                         'air-hockey', 'layouts')
+
+magic = b'AHLY'
+# Changes whenever the rows change meaning, which also changes every key
+version = 1
+header = struct.Struct('<4sHI')
+record_size = 7
+
+# The standard table
+default = {
+    'x_len': 3000,
+    'y_len': 1000,
+    'border_width': 100,
+    'goal_width': 300,
+    'mid_line_width': 50,
+    'corner_radius': 10,
+    'puck_radius': 50,
+    'paddle_radius': 70,
+    'obstacles': [],
+}
+# Table sizes in the order they're saved in
+sizes = [key for key in default if key != 'obstacles']
+
+kinds = (Circle, Wall_Vert_Left, Wall_Vert_Right, Wall_Horz_Up, Wall_Horz_Down,
+         Wall_Vert_Left_Inf, Wall_Vert_Right_Inf, Wall_Horz_Up_Inf,
+         Wall_Horz_Down_Inf)
+kind_index = {kind: i for (i, kind) in enumerate(kinds)}
+# Wall names in layouts -> class
+wall_names = {kind.__name__[len('Wall_'):].lower(): kind for kind in kinds[1:]}
+
+# A layout compiled into rows, ready to build the objects of a table from
+class Compiled_Layout:
+
+    def __init__(self, key, table, rows, n_obstacles):
+        self.key = key
+        # Table sizes, see default
+        self.table = table
+        # One tuple of record_size numbers per object
+        self.rows = rows
+        self.n_obstacles = n_obstacles
+
+    # New objects for the obstacles, which come after the border of the
+    # table
+    def obstacles(self):
+        return [build(row) for row in self.rows[len(self.rows) - self.n_obstacles:]]
+
+    # New objects for every row, in order
+    def objects(self):
+        return [build(row) for row in self.rows]
+
+    # The whole layout as one buffer, see load()
+    def to_bytes(self):
+        values = array.array('d', [self.table[key] for key in sizes])
+        for row in self.rows:
+            values.extend(row)
+        return header.pack(magic, version, self.n_obstacles) + values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, key, data):
+        (file_magic, file_version, n_obstacles) = header.unpack_from(data)
+        if file_magic != magic or file_version != version:
+            raise ValueError("not a compiled layout of version %d" % version)
+        values = array.array('d')
+        values.frombytes(data[header.size:])
+        if len(values) < len(sizes) or (len(values) - len(sizes)) % record_size:
+            raise ValueError("compiled layout cut short")
+        table = dict(zip(sizes, values))
+        rows = [tuple(values[i:i + record_size])
+                for i in range(len(sizes), len(values), record_size)]
+        return cls(key, table, rows, n_obstacles)
+
+# The row of an object
+def record(obj):
+
+    kind = type(obj)
+    if kind is Circle:
+        return (kind_index[kind], obj.location.x, obj.location.y, obj.radius,
+                0, 0, 0)
+    (axis, facing, gate) = wall_kinds[kind]
+    (pos, low, high) = wall_row(obj, axis)
+    return (kind_index[kind], axis, facing, gate, pos, low, high)
+
+# The object of a row
+def build(row):
+
+    kind = kinds[int(row[0])]
+    if kind is Circle:
+        return Circle(Vector(row[1], row[2]), row[3])
+    (pos, low, high) = row[4:]
+    if math.isinf(low):
+        return kind(pos)
+    if row[1] == 0:
+        # Blocks x, spans y
+        return kind(pos, low, high)
+    return kind(low, high, pos)
+
+# The layout with every key filled in, checked
+def complete(layout):
+
+    unknown = set(layout) - set(default)
+    if unknown:
+        raise ValueError("unknown layout keys: %s" % ", ".join(sorted(unknown)))
+    layout = dict(default, **layout)
+    for key in sizes:
+        if not isinstance(layout[key], (int, float)) or layout[key] < 0:
+            raise ValueError("layout %s should be a size in mm, got %r"
+                             % (key, layout[key]))
+    if layout['goal_width'] > layout['y_len']:
+        raise ValueError("goals are wider than the table")
+    return layout
+
+# Cache key of the text of a layout file or of a completed layout
+# Compiled layouts hold native doubles, so the byte order is part of it
+def layout_key(text=None, layout=None):
+    if text is None:
+        text = json.dumps(layout, sort_keys=True, separators=(',', ':')).encode()
+    prefix = ("%d:%s:" % (version, sys.byteorder)).encode()
+    return hashlib.sha256(prefix + text).hexdigest()
+
+# The obstacle an entry of the obstacles list describes
+def obstacle(entry):
+
+    if 'circle' in entry:
+        (x, y, radius) = entry['circle']
+        return Circle(Vector(x, y), radius)
+
+    kind = wall_names.get(entry.get('wall'))
+    if kind is None:
+        raise ValueError("unknown obstacle %r, walls are %s"
+                         % (entry, ", ".join(sorted(wall_names))))
+    if kind in (Wall_Vert_Left_Inf, Wall_Vert_Right_Inf, Wall_Horz_Up_Inf,
+                Wall_Horz_Down_Inf):
+        return kind(entry['at'])
+    (low, high) = entry['span']
+    if wall_kinds[kind][0] == 0:
+        return kind(entry['at'], low, high)
+    return kind(low, high, entry['at'])
+
+# Compile a layout, without looking at the cache
+def compile_layout(layout, key=None):
+
+    layout = complete(layout)
+    x_len = layout['x_len']
+    y_len = layout['y_len']
+    goal_y_low = (y_len - layout['goal_width']) / 2
+    goal_y_high = (y_len + layout['goal_width']) / 2
+    # How far back the goals go
+    depth = 2*layout['puck_radius'] + layout['border_width']
+    r = layout['corner_radius']
+
+    objects = [
+        # Upper right wall
+        Wall_Vert_Left(x_len, 0, goal_y_low),
+        # Lower right wall
+        Wall_Vert_Left(x_len, goal_y_high, y_len),
+        # Right goal top wall
+        Wall_Horz_Down(x_len, x_len + depth, goal_y_low),
+        # Right goal bottom wall
+        Wall_Horz_Up(x_len, x_len + depth, goal_y_high),
+        # Right goal top corner
+        Circle(Vector(x_len + r, goal_y_low - r), r),
+        # Right goal bottom corner
+        Circle(Vector(x_len + r, goal_y_high + r), r),
+        # Upper left wall
+        Wall_Vert_Right(0, 0, goal_y_low),
+        # Lower left wall
+        Wall_Vert_Right(0, goal_y_high, y_len),
+        # Left goal top wall
+        Wall_Horz_Down(- depth, 0, goal_y_low),
+        # Left goal bottom wall
+        Wall_Horz_Up(- depth, 0, goal_y_high),
+        # Left goal top corner
+        Circle(Vector(-r, goal_y_low - r), r),
+        # Left goal bottom corner
+        Circle(Vector(-r, goal_y_high + r), r),
+        # Top wall
+        Wall_Horz_Down_Inf(0),
+        # Bottom wall
+        Wall_Horz_Up_Inf(y_len)]
+    if r == 0:
+        objects = [obj for obj in objects if type(obj) is not Circle]
+
+    obstacles = [obstacle(entry) for entry in layout['obstacles']]
+    rows = [record(obj) for obj in objects + obstacles]
+    table = {key: float(layout[key]) for key in sizes}
+    if key is None:
+        key = layout_key(layout=layout)
+    return Compiled_Layout(key, table, rows, len(obstacles))
+
+# Compiled layouts by key, so a process compiles or reads each one once
+loaded = {}
+
+# A compiled layout, from memory, from the cache on disk or compiled anew
+# and saved there. layout is a dict or the path of a JSON file.
+def load(layout=None):
+
+    if layout is None:
+        # The standard table is also kept under None, to skip hashing it
+        if None in loaded:
+            return loaded[None]
+        loaded[None] = load(default)
+        return loaded[None]
+    if isinstance(layout, dict):
+        layout = complete(layout)
+        key = layout_key(layout=layout)
+    else:
+        with open(layout, 'rb') as f:
+            text = f.read()
+        key = layout_key(text)
+        layout = None
+
+    compiled = loaded.get(key)
+    if compiled is not None:
+        return compiled
+
+    path = os.path.join(cache_dir, key + '.bin')
+    try:
+        with open(path, 'rb') as f:
+            compiled = Compiled_Layout.from_bytes(key, f.read())
+    except (OSError, ValueError, struct.error):
+        if layout is None:
+            layout = json.loads(text)
+        compiled = compile_layout(layout, key)
+        save(compiled, path)
+
+    loaded[key] = compiled
+    return compiled
+
+# Write a compiled layout to path, through a temporary file so that a
+# reader never sees half of it
+# A cache that can't be written to is only slower, so errors are ignored
+def save(compiled, path):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp, 'wb') as f:
+            f.write(compiled.to_bytes())
+        os.replace(temp, path)
+    except OSError:
+        pass
@@ -0,0 +1,204 @@
+# Per frame timings and counters of the game loop
+#
+# Each frame records how long the loop spent in every phase and a few
+# counters, into a ring buffer holding the last frames_kept frames. The
+# buffer can be written out as CSV or JSON, or served over HTTP on
+# localhost while the game runs:
+#
+#   curl localhost:8765/metrics.json
+#   curl localhost:8765/metrics.csv
+#   curl localhost:8765/summary.json
+#
+# The game uses Null_Metrics when instrumentation is off, which does
+# nothing, so the loop only pays for a few empty method calls.
+
+import array
+import io
+import json
+import threading
+import time
+
+# Frames kept, about 34 s at 120 frames per second
+frames_kept = 4096
+
+# Phases of a frame, in milliseconds
+phases = ('events', 'input', 'ai', 'physics', 'draw', 'display', 'tick')
+# Counts per frame: physics steps, collisions the pucks resolved, collidables
+# ghosted at the end of the frame, mouse events handled, and score glyphs
+# drawn from the game's Glyph_Cache and rendered anew
+counters = ('steps', 'bounces', 'ghosts', 'mouse_events', 'glyph_hits',
+            'glyph_misses')
+
+columns = ('frame', 'time') + phases + counters
+
+class Metrics:
+
+    enabled = True
+
+    def __init__(self, size=frames_kept):
+
+        self.size = size
+        # Frames recorded so far
+        self.frames = 0
+        # Column -> values, frame i in slot i % size
+        self.data = {name: array.array('d', bytes(8 * size)) for name in columns}
+        # Held while a frame is written and while the buffer is read
+        self.lock = threading.Lock()
+
+        self.current = dict.fromkeys(phases + counters, 0)
+        self.frame_start = time.perf_counter()
+        self.last = self.frame_start
+        self.start = self.frame_start
+        # Total bounces of the pucks and glyph cache lookups at the end of
+        # the last frame
+        self.bounces = 0
+        self.glyph_hits = 0
+        self.glyph_misses = 0
+
+    def start_frame(self):
+        self.frame_start = self.last = time.perf_counter()
+
+    # End the current phase, counting the time since the last mark
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.current[phase] += 1000 * (now - self.last)
+        self.last = now
+
+    def count(self, counter, n=1):
+        self.current[counter] += n
+
+    # Count what the simulation did in the frame
+    def observe(self, sim):
+        bounces = sum(puck.bounces for puck in sim.pucks)
+        self.current['bounces'] += bounces - self.bounces
+        self.bounces = bounces
+        self.current['ghosts'] = sum(getattr(obj, 'ghost', False)
+                                     for obj in sim.collidables)
+        # Only a game drawing on screen has glyphs
+        glyphs = getattr(getattr(sim, 'arena', None), 'glyphs', None)
+        if glyphs is not None:
+            self.current['glyph_hits'] += glyphs.hits - self.glyph_hits
+            self.current['glyph_misses'] += glyphs.misses - self.glyph_misses
+            (self.glyph_hits, self.glyph_misses) = (glyphs.hits, glyphs.misses)
+
+    def end_frame(self):
+
+        current = self.current
+        data = self.data
+        with self.lock:
+            i = self.frames % self.size
+            data['frame'][i] = self.frames
+            data['time'][i] = self.frame_start - self.start
+            for (name, value) in current.items():
+                data[name][i] = value
+            self.frames += 1
+
+        for name in current:
+            current[name] = 0
+
+    # The frames in the buffer, oldest first, as tuples in column order
+    def rows(self):
+        with self.lock:
+            first = max(0, self.frames - self.size)
+            slots = [i % self.size for i in range(first, self.frames)]
+            data = [self.data[name] for name in columns]
+            return [tuple(values[i] for values in data) for i in slots]
+
+    def write_csv(self, out):
+        # Imported here, so the game doesn't import csv when it only needs
+        # Null_Metrics
+        import csv
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        writer.writerows(self.rows())
+
+    def csv(self):
+        out = io.StringIO()
+        self.write_csv(out)
+        return out.getvalue()
+
+    def json(self):
+        return json.dumps({'columns': columns, 'rows': self.rows()})
+
+    # Mean, 99th percentile and maximum of every phase and counter
+    def summary(self):
+
+        rows = self.rows()
+        result = {'frames': self.frames, 'kept': len(rows)}
+        for (column, name) in enumerate(columns):
+            if name in ('frame', 'time'):
+                continue
+            values = sorted(row[column] for row in rows)
+            if not values:
+                continue
+            result[name] = {
+                'mean': sum(values) / len(values),
+                'p99': values[min(len(values) - 1, int(.99 * len(values)))],
+                'max': values[-1],
+            }
+        return result
+
+    # Write the buffer to a file, as JSON if its name ends in .json and as
+    # CSV otherwise
+    def save(self, path):
+        with open(path, 'w', newline='') as f:
+            if path.endswith('.json'):
+                f.write(self.json())
+            else:
+                self.write_csv(f)
+
+# Stands in for Metrics when instrumentation is off
+class Null_Metrics:
+
+    enabled = False
+
+    def start_frame(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+    def count(self, counter, n=1):
+        pass
+
+    def observe(self, sim):
+        pass
+
+    def end_frame(self):
+        pass
+
+# Serve the metrics over HTTP on localhost from a background thread
+# Returns the server, shut it down with server.shutdown()
+def serve(metrics, port):
+
+    # Imported here, as http.server takes longer to import than the game
+    # takes to draw its first frame
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path == '/metrics.csv':
+                (body, kind) = (metrics.csv(), 'text/csv')
+            elif self.path == '/metrics.json':
+                (body, kind) = (metrics.json(), 'application/json')
+            elif self.path in ('/', '/summary.json'):
+                (body, kind) = (json.dumps(metrics.summary()), 'application/json')
+            else:
+                self.send_error(404)
+                return
+            body = body.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', kind)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        # Keep the game's console quiet
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,445 @@
+# Two player games over UDP, with input delay and rollback
+#
+# Both sides run the whole simulation and only send each other their own
+# paddle's locations. A location is used input_delay frames after it's
+# taken, which gives it that long to reach the other side. When the other
+# side's location for a frame hasn't arrived in time, its last one is used
+# instead, and if the real one turns out different the simulation is rolled
+# back: the state saved at the start of that frame is restored and the
+# frames since are simulated again. The physics is deterministic, so both
+# sides end up in the same state once they have each other's inputs.
+#
+# The host also sends its state every state_every frames, for a frame both
+# sides have all the inputs of. The other side compares it with its own and
+# takes it over if they differ, e.g. after a constant was changed on one
+# side only. States go out as deltas from the last state the other side
+# acknowledged: a bitmask of the fields that changed and their new values,
+# so a puck gliding across the table costs a few doubles.
+#
+# Packets, little-endian, all starting with a header of kind, frame, the
+# last frame the sender has every input of the receiver for, and the last
+# state it received:
+#
+#   INPUT   count u8, then count locations as i32 x and y in tenths of a
+#           millimeter, for frame, frame + 1, ... Every input the receiver
+#           hasn't acknowledged is sent again, so lost packets don't matter.
+#           Until the receiver has acknowledged an input, the key of the
+#           sender's layout follows as 32 bytes, and a side that gets a key
+#           other than its own refuses to play.
+#   STATE   base frame i32, -1 for a full state, bitmask of the fields that
+#           differ from the base, their values as doubles
+#
+# Both sides have to run with the same physics step and table.
+#
+# Played over localhost, with latency and loss, to check both sides agree:
+#   python netplay.py [frames] [latency_frames] [loss]
+
+import math
+import random
+import socket
+import struct
+import sys
+import time
+
+import physics
+from replay import units_per_mm
+from vector import Vector
+
+(INPUT, STATE) = range(1, 3)
+
+header = struct.Struct('<Biii')
+count_format = struct.Struct('<B')
+location_format = struct.Struct('<ii')
+base_format = struct.Struct('<i')
+# Largest packet: header, 255 inputs and the layout key
+max_packet = header.size + count_format.size + 255 * location_format.size + 32
+
+# Frames between taking a location and using it
+input_delay = 2
+# Frames that can be rolled back, a side that gets this far ahead of the
+# inputs of the other waits
+max_rollback = 16
+# Frames between the host's state updates
+state_every = 4
+
+# Game state: Simulation.snapshot() and the frames left before serving
+# after a goal, as a tuple of numbers
+class State_Codec:
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.mask_bytes = (fields + 7) // 8
+
+    # Bitmask of the fields of state that differ from base, and their values
+    def encode(self, state, base=None):
+        if base is None:
+            changed = range(self.fields)
+        else:
+            changed = [i for i in range(self.fields) if state[i] != base[i]]
+        mask = 0
+        for i in changed:
+            mask |= 1 << i
+        return mask.to_bytes(self.mask_bytes, 'little') \
+               + struct.pack('<%dd' % len(changed), *[state[i] for i in changed])
+
+    def decode(self, data, base=None):
+        mask = int.from_bytes(data[:self.mask_bytes], 'little')
+        changed = [i for i in range(self.fields) if mask >> i & 1]
+        values = struct.unpack_from('<%dd' % len(changed), data, self.mask_bytes)
+        state = list(base) if base is not None else [0.0] * self.fields
+        if base is None and len(changed) != self.fields:
+            raise ValueError("full state with %d of %d fields"
+                             % (len(changed), self.fields))
+        for (i, value) in zip(changed, values):
+            state[i] = value
+        return tuple(state)
+
+class Session:
+
+    # The host plays paddle_1 and sends states, the other side plays
+    # paddle_2. peer is the address of the other side, which the host learns
+    # from the first packet it gets. pause is the time to wait before
+    # serving after a goal, in seconds.
+    def __init__(self, sim, sock, host, peer=None, dt=1/physics.clock_freq,
+                 delay=input_delay, pause=30/physics.clock_freq):
+
+        self.sim = sim
+        self.sock = sock
+        sock.setblocking(False)
+        self.host = host
+        self.peer = peer
+        self.dt = dt
+        self.delay = delay
+        self.pause_frames = round(pause / dt)
+        # Sent until the other side acknowledges an input, see the top of
+        # the file
+        self.layout_key = bytes.fromhex(sim.table.layout.key)
+
+        # In the order step_paddles() moves them, the same on both sides
+        self.paddles = [sim.paddle_1, sim.paddle_2]
+        (self.local, self.remote) = (sim.paddle_1, sim.paddle_2) if host \
+                                    else (sim.paddle_2, sim.paddle_1)
+        # Where the paddles are before any input arrives
+        self.initial = {paddle: self.units(paddle.location) for paddle in self.paddles}
+
+        # Next frame to simulate
+        self.frame = 0
+        # Frames left before serving
+        self.pause = 0
+        # Frame -> location, in location units
+        self.local_inputs = {}
+        self.remote_inputs = {}
+        # Remote inputs received for every frame up to this one
+        self.remote_last = -1
+        # Local inputs the other side received for every frame up to this one
+        self.remote_ack = -1
+        # Frame -> state at its start, and remote input it was simulated with
+        self.states = {}
+        self.used = {}
+        # Earliest frame simulated with the wrong remote input, or None
+        self.rollback_to = None
+
+        self.codec = State_Codec(len(self.state()))
+        # Host: states sent by frame, and the last one the other side has
+        self.sent_states = {}
+        self.state_ack = -1
+        # Other side: states received by frame, and the last one
+        self.received_states = {}
+        self.state_last = -1
+
+        # Rollbacks, frames simulated again, states taken over from the host
+        self.rollbacks = 0
+        self.resimulated = 0
+        self.corrections = 0
+        # Seconds the longest rollback took
+        self.max_rollback_time = 0
+        self.packets_sent = 0
+        self.bytes_sent = 0
+
+    # Location rounded to location units, as sent
+    def units(self, location):
+        return (round(location.x * units_per_mm), round(location.y * units_per_mm))
+
+    def state(self):
+        return self.sim.snapshot() + (self.pause,)
+
+    def restore(self, state):
+        self.sim.restore(state[:-1])
+        self.pause = int(state[-1])
+
+    # Simulate a frame with the local paddle moved to location
+    # Returns the goals scored, see Simulation.step(), or None if the other
+    # side is too far behind and the frame has to wait
+    def advance(self, location):
+
+        self.receive()
+        if self.peer is None or self.frame > self.remote_last + max_rollback:
+            self.send_inputs()
+            return None
+
+        self.local_inputs[self.frame + self.delay] = self.units(location)
+        self.rollback()
+        self.send_inputs()
+
+        goals = self.simulate(self.frame)
+        self.frame += 1
+
+        if self.host and self.frame % state_every == 0:
+            self.send_state()
+        self.prune()
+
+        return goals
+
+    # Catch up with what arrived without simulating a new frame
+    def sync(self):
+        self.receive()
+        self.rollback()
+        self.send_inputs()
+
+    def simulate(self, frame):
+
+        self.states[frame] = self.state()
+        remote = self.remote_input(frame)
+        self.used[frame] = remote
+        inputs = {self.local: self.local_inputs.get(frame, self.initial[self.local]),
+                  self.remote: remote}
+        locations = {paddle: Vector(inputs[paddle][0] / units_per_mm,
+                                    inputs[paddle][1] / units_per_mm)
+                     for paddle in self.paddles}
+
+        if self.pause:
+            self.sim.place_paddles(locations)
+            self.pause -= 1
+            if not self.pause:
+                self.sim.serve()
+            return []
+
+        goals = self.sim.step_paddles(locations, self.dt)
+        if goals:
+            self.pause = self.pause_frames
+        return goals
+
+    # The remote input of a frame, or the last one known if it hasn't
+    # arrived
+    def remote_input(self, frame):
+        if frame in self.remote_inputs:
+            return self.remote_inputs[frame]
+        return self.remote_inputs.get(self.remote_last, self.initial[self.remote])
+
+    # Simulate again from the first frame that used a wrong remote input
+    def rollback(self):
+
+        if self.rollback_to is None:
+            return
+        start = time.perf_counter()
+
+        first = self.rollback_to
+        self.rollback_to = None
+        self.restore(self.states[first])
+        for frame in range(first, self.frame):
+            self.simulate(frame)
+
+        self.rollbacks += 1
+        self.resimulated += self.frame - first
+        self.max_rollback_time = max(self.max_rollback_time,
+                                     time.perf_counter() - start)
+
+    def mark_wrong(self, frame):
+        if frame < self.frame and frame in self.states:
+            if self.rollback_to is None or frame < self.rollback_to:
+                self.rollback_to = frame
+
+    def send(self, kind, frame, payload):
+        packet = header.pack(kind, frame, self.remote_last, self.state_last) + payload
+        self.sock.sendto(packet, self.peer)
+        self.packets_sent += 1
+        self.bytes_sent += len(packet)
+
+    # Every local input the other side hasn't acknowledged
+    def send_inputs(self):
+        if self.peer is None:
+            return
+        last = max(self.local_inputs, default=-1)
+        first = max(self.remote_ack + 1, last - 254)
+        inputs = [self.local_inputs.get(frame, self.initial[self.local])
+                  for frame in range(first, last + 1)]
+        payload = count_format.pack(len(inputs)) \
+                  + b''.join(location_format.pack(*location) for location in inputs)
+        if self.remote_ack < 0:
+            payload += self.layout_key
+        self.send(INPUT, first, payload)
+
+    # The state of the last frame both sides have every input of, as a delta
+    # from the last state the other side acknowledged
+    def send_state(self):
+        frame = min(self.remote_last + 1, self.frame - 1)
+        if frame not in self.states:
+            return
+        state = self.states[frame]
+        base = self.state_ack if self.state_ack in self.sent_states else -1
+        self.sent_states[frame] = state
+        payload = base_format.pack(base) \
+                  + self.codec.encode(state, self.sent_states.get(base))
+        self.send(STATE, frame, payload)
+
+    def receive(self):
+
+        while True:
+            try:
+                (packet, address) = self.sock.recvfrom(max_packet)
+            except BlockingIOError:
+                return
+            if self.peer is None and self.host:
+                self.peer = address
+            elif address != self.peer:
+                continue
+
+            (kind, frame, ack, state_ack) = header.unpack_from(packet)
+            self.remote_ack = max(self.remote_ack, ack)
+            self.state_ack = max(self.state_ack, state_ack)
+            if kind == INPUT:
+                self.receive_inputs(frame, packet[header.size:])
+            elif kind == STATE:
+                self.receive_state(frame, packet[header.size:])
+
+    def receive_inputs(self, first, payload):
+
+        (count,) = count_format.unpack_from(payload)
+        key = payload[count_format.size + count * location_format.size:]
+        if key and key != self.layout_key:
+            raise ValueError("the other side plays on another table, layout %s "
+                             "against %s" % (key.hex(), self.layout_key.hex()))
+        for i in range(count):
+            frame = first + i
+            if frame <= self.remote_last or frame in self.remote_inputs:
+                continue
+            location = location_format.unpack_from(payload, count_format.size
+                                                   + i * location_format.size)
+            self.remote_inputs[frame] = location
+            if frame in self.used and self.used[frame] != location:
+                self.mark_wrong(frame)
+
+        while self.remote_last + 1 in self.remote_inputs:
+            self.remote_last += 1
+
+    def receive_state(self, frame, payload):
+
+        (base,) = base_format.unpack_from(payload)
+        if base != -1 and base not in self.received_states:
+            return
+        state = self.codec.decode(payload[base_format.size:],
+                                  self.received_states.get(base))
+        self.received_states[frame] = state
+        self.state_last = max(self.state_last, frame)
+
+        # Only comparable once this side has every input before frame too
+        if frame <= self.remote_last + 1 and frame in self.states \
+                and self.rollback_to is None and self.states[frame] != state:
+            self.corrections += 1
+            self.states[frame] = state
+            self.rollback_to = frame
+
+    # Forget what can't be needed anymore
+    def prune(self):
+
+        keep = self.frame - max_rollback - 1
+        for (table, before) in [
+                (self.states, keep),
+                (self.used, keep),
+                (self.remote_inputs, min(keep, self.remote_last)),
+                (self.local_inputs, min(keep, self.remote_ack + 1)),
+                (self.sent_states, min(self.state_ack, self.frame - 2 * max_rollback)),
+                (self.received_states, self.state_last - max_rollback)]:
+            for frame in [frame for frame in table if frame < before]:
+                del table[frame]
+
+# A socket whose packets take latency frames to arrive and are lost with
+# probability loss, standing in for a network on localhost
+class Delay_Line:
+
+    def __init__(self, sock, latency, loss, seed=0):
+        self.sock = sock
+        self.latency = latency
+        self.loss = loss
+        self.random = random.Random(seed)
+        # (frame to send at, packet, address)
+        self.queue = []
+        self.now = 0
+
+    def setblocking(self, flag):
+        self.sock.setblocking(flag)
+
+    def sendto(self, packet, address):
+        if self.random.random() >= self.loss:
+            self.queue.append((self.now + self.latency, packet, address))
+
+    def recvfrom(self, size):
+        return self.sock.recvfrom(size)
+
+    # Move on a frame, sending what's due
+    def tick(self):
+        self.now += 1
+        due = [entry for entry in self.queue if entry[0] <= self.now]
+        self.queue = [entry for entry in self.queue if entry[0] > self.now]
+        for (ignored, packet, address) in due:
+            self.sock.sendto(packet, address)
+
+# Play frames on two sessions over localhost, with the paddles swept across
+# the table, and check both sides end in the same state
+def main():
+
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    loss = float(sys.argv[3]) if len(sys.argv) > 3 else .05
+
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for i in range(2)]
+    for sock in sockets:
+        sock.bind(('127.0.0.1', 0))
+    lines = [Delay_Line(sock, latency, loss, seed) for (seed, sock) in enumerate(sockets)]
+
+    sims = [physics.Simulation(), physics.Simulation()]
+    for sim in sims:
+        sim.puck.velocity = Vector(3000, 1700)
+    host = Session(sims[0], lines[0], True)
+    guest = Session(sims[1], lines[1], False, sockets[0].getsockname())
+    sessions = [host, guest]
+
+    table = sims[0].table
+    def location(frame, session):
+        side = 1 if session.host else -1
+        x = table.x_len / 2 + side * (table.x_len * .3 + 250 * math.sin(frame / 37))
+        y = table.y_len / 2 + 380 * math.sin(frame / (23 + 6 * session.host))
+        return Vector(x, y)
+
+    # Both sides play up to the same frame, then settle without losses
+    waits = 0
+    while any(session.frame < frames for session in sessions):
+        for session in sessions:
+            if session.frame < frames:
+                if session.advance(location(session.frame, session)) is None:
+                    waits += 1
+            else:
+                session.sync()
+        for line in lines:
+            line.tick()
+
+    for line in lines:
+        line.loss = 0
+    while any(session.remote_last < frames - 1 or session.rollback_to is not None
+              for session in sessions):
+        for session in sessions:
+            session.sync()
+        for line in lines:
+            line.tick()
+
+    same = sims[0].snapshot() == sims[1].snapshot()
+    for (name, session) in [("host", host), ("guest", guest)]:
+        print("%-5s %5d rollbacks, %6d frames again, longest %5.2f ms, "
+              "%d corrections, %6.0f bytes/s"
+              % (name, session.rollbacks, session.resimulated,
+                 1e3 * session.max_rollback_time, session.corrections,
+                 session.bytes_sent / (frames * host.dt)))
+    print("waited %d frames, score %s, same state: %s" % (waits, sims[0].score, same))
+
+if __name__ == "__main__":
+    main()
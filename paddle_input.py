@@ -0,0 +1,282 @@
+# Framed paddle positions read from a FIFO
+#
+# A tracker or controller writes fixed size little-endian frames:
+#
+#   magic      u32  frame_magic, to find frame boundaries again after garbage
+#   sequence   u32  incremented by one for every frame sent for the paddle
+#   timestamp  u64  nanoseconds, from the writer's monotonic clock
+#   paddle     u8   0 for paddle_1, 1 for paddle_2
+#   (padding)  3 bytes
+#   x, y       f32  paddle location on the table in millimeters
+#
+# The reader opens the FIFO non-blocking, drains everything available with
+# bulk reads and unpacks the complete frames in one go. It can be registered
+# with a selectors selector so that the game loop only reads when there is
+# something to read and never blocks on input.
+#
+# The samples of a frame, from the reader or from mouse events, are
+# gathered into a Paddle_Path per paddle and cut into the physics steps the
+# frame runs, so that a paddle follows what the input did between frames,
+# at the speed it did it, however many samples came in.
+
+import collections
+import os
+import selectors
+import struct
+
+from vector import Vector
+
+FIFO = "/tmp/fifo"
+
+frame_magic = 0x46504841
+frame = struct.Struct('<IIQB3xff')
+magic_bytes = struct.pack('<I', frame_magic)
+
+# Bytes asked for per read
+read_size = 1 << 16
+# Frames a sample can be behind the newest one and still count as out of
+# order; further behind and the writer is taken to have restarted
+reorder_window = 1024
+
+# Most points a paddle path keeps inside a physics step, so that each step
+# costs the same number of collision tests whatever the input rate
+max_step_points = 4
+# Most samples a paddle path holds, the seconds its playback starts behind
+# the newest one and the most it can fall behind, see Paddle_Path
+max_path_points = 16
+input_delay = .02
+max_input_lag = .05
+
+Sample = collections.namedtuple('Sample', 'sequence timestamp paddle x y')
+
+class Fifo_Reader:
+
+    def __init__(self, path=FIFO):
+
+        self.path = path
+        if not os.path.exists(path):
+            os.mkfifo(path, 0o666)
+        self.fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        # Hold the write end open too, so the FIFO never reads as closed
+        # between writers and the selector doesn't spin on it
+        self.keep_open = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        self.buffer = bytearray()
+
+        # Paddle id -> sequence number of the last frame accepted
+        self.last_sequence = {}
+
+        # Frames accepted, frames missing from the sequence, frames that came
+        # after a later one and were dropped, and bytes skipped looking for
+        # the next frame. A writer that restarts from a much lower sequence
+        # number is followed without counting anything.
+        self.frames = 0
+        self.dropped = 0
+        self.out_of_order = 0
+        self.skipped = 0
+
+    def fileno(self):
+        return self.fd
+
+    # Watch the FIFO for input on selector, with this reader as the key data
+    def register(self, selector):
+        selector.register(self.fd, selectors.EVENT_READ, self)
+
+    def close(self):
+        os.close(self.keep_open)
+        os.close(self.fd)
+
+    # Read everything the writer has sent so far
+    # Returns the new samples, oldest first
+    def poll(self):
+
+        while True:
+            try:
+                data = os.read(self.fd, read_size)
+            except BlockingIOError:
+                break
+            self.buffer += data
+            if len(data) < read_size:
+                break
+
+        return self.unpack()
+
+    # Unpack the complete frames in the buffer
+    def unpack(self):
+
+        samples = []
+        start = 0
+
+        while True:
+
+            # Skip to the next frame boundary
+            found = self.buffer.find(magic_bytes, start)
+            if found < 0:
+                # Keep the tail, it may hold the start of the magic
+                keep = max(start, len(self.buffer) - len(magic_bytes) + 1)
+                self.skipped += keep - start
+                start = keep
+                break
+            self.skipped += found - start
+            start = found
+
+            count = (len(self.buffer) - start) // frame.size
+            if count == 0:
+                break
+
+            end = start + count * frame.size
+            view = memoryview(self.buffer)[start:end]
+            for (magic, sequence, timestamp, paddle, x, y) in frame.iter_unpack(view):
+                if magic != frame_magic:
+                    # Lost the frame boundary, look for the magic again
+                    break
+                start += frame.size
+                if self.accept(paddle, sequence):
+                    samples.append(Sample(sequence, timestamp, paddle, x, y))
+            view.release()
+
+            if start == end:
+                break
+
+        del self.buffer[:start]
+        return samples
+
+    # Keep track of the sequence numbers of each paddle
+    # Returns whether a frame with this sequence number is new
+    def accept(self, paddle, sequence):
+
+        last = self.last_sequence.get(paddle)
+        if last is not None:
+            gap = (sequence - last) & 0xffffffff
+            behind = (last - sequence) & 0xffffffff
+            if behind <= reorder_window:
+                # Repeated or older than a frame already seen
+                self.out_of_order += 1
+                return False
+            if gap < 1 << 31:
+                self.dropped += gap - 1
+
+        self.last_sequence[paddle] = sequence
+        self.frames += 1
+        return True
+
+# The most recent sample for each paddle in samples
+def latest(samples):
+    last = {}
+    for sample in samples:
+        last[sample.paddle] = sample
+    return list(last.values())
+
+# The input for one paddle as a path through time
+#
+# Timestamped samples are played back at the speed they came in: each frame
+# plays the stretch of input after the one the last frame played, as long
+# as the frame, and samples past its end wait for the next frame. Playback
+# starts input_delay seconds behind the newest sample, so that input coming
+# in unevenly doesn't run out, and is kept between no and max_input_lag
+# seconds behind, so it skips ahead after a stall and waits when the input
+# is late. Samples without a timestamp are spread evenly over the frame.
+#
+# A path holds at most max_path_points samples, dropping every other one
+# when it fills up, so that a frame costs the same whatever the input rate.
+class Paddle_Path:
+
+    def __init__(self):
+        # [(location, timestamp or None)], oldest first
+        self.samples = []
+        # Timestamp in nanoseconds playback has got to, None until a frame
+        # played timestamped samples
+        self.clock = None
+
+    def add(self, location, timestamp=None):
+        self.samples.append((location, timestamp))
+        if len(self.samples) == 2 * max_path_points:
+            # Every other one, keeping the newest
+            self.samples = self.samples[1::2]
+
+    # Add the samples in arrays of x, y and timestamps, e.g. the fields of
+    # Shm_Ring.backlog_array(), at most max_path_points of them spread
+    # evenly over the arrays, so that the cost doesn't grow with their length
+    def extend(self, x, y, timestamps):
+        n = len(x)
+        m = min(n, max_path_points)
+        for k in range(m):
+            i = (k + 1) * n // m - 1
+            self.add(Vector(float(x[i]), float(y[i])), int(timestamps[i]))
+
+    # Where the input last put the paddle, or start if it hasn't moved
+    def end(self, start):
+        return self.samples[-1][0] if self.samples else start
+
+    # Use up the samples without stepping, e.g. while waiting to serve
+    # Returns where the paddle ends up
+    def take(self, start):
+        end = self.end(start)
+        self.samples = []
+        self.clock = None
+        return end
+
+    # Times of the samples in seconds from the start of a frame of length
+    # seconds, moving playback on by the frame
+    def times(self, length):
+
+        n = len(self.samples)
+        stamps = [timestamp for (location, timestamp) in self.samples]
+        if None in stamps or any(b <= a for (a, b) in zip(stamps, stamps[1:])):
+            self.clock = None
+            return [length * (i + 1) / n for i in range(n)]
+
+        span = round(length * 1e9)
+        newest = stamps[-1]
+        if self.clock is None:
+            self.clock = newest - span - round(input_delay * 1e9)
+        self.clock = min(max(self.clock, newest - span - round(max_input_lag * 1e9)),
+                         newest - span)
+        times = [(stamp - self.clock) / 1e9 for stamp in stamps]
+        self.clock += span
+        return times
+
+    # Cut the path from start into steps physics steps of dt seconds
+    # Returns [(location, [(time, location), ...])] for each step: where
+    # the paddle is at the end of the step and the points it goes through
+    # on the way, in seconds into the step, at most max_step_points of them
+    def steps(self, start, steps, dt):
+
+        if steps == 0:
+            return []
+        if not self.samples:
+            return [(start, [])] * steps
+
+        length = steps * dt
+        times = self.times(length)
+        points = list(zip(times, (location for (location, timestamp) in self.samples)))
+        # The samples past the end of the frame are for the next one
+        self.samples = [sample for (time, sample) in zip(times, self.samples)
+                        if time > length + 1e-9]
+
+        result = []
+        (prev_time, prev) = (0, start)
+        i = 0
+        for step in range(steps):
+
+            (step_start, step_end) = (step * dt, (step + 1) * dt)
+            inside = []
+            while i < len(points) and points[i][0] < step_end:
+                (prev_time, prev) = points[i]
+                if prev_time > step_start:
+                    inside.append((prev_time - step_start, prev))
+                i += 1
+
+            # Where the path crosses the end of the step
+            if i < len(points):
+                (next_time, next_loc) = points[i]
+                alpha = (step_end - prev_time) / (next_time - prev_time)
+                end = prev + alpha * (next_loc - prev)
+            else:
+                end = prev
+
+            if len(inside) > max_step_points:
+                inside = [inside[(k + 1) * len(inside) // (max_step_points + 1)]
+                          for k in range(max_step_points)]
+            result.append((end, inside))
+
+        return result
@@ -0,0 +1,686 @@
+# Headless physics core of the game
+#
+# Nothing in this file touches pygame, so it can be imported and stepped
+# without a display, a font or a clock. The pygame front end in game.py is
+# a renderer on top of the classes defined here.
+
+# Source: https://math.stackexchange.com/questions/913350/how-to-find-the-intersection-point-of-two-moving-circles
+
+import heapq
+import itertools
+import math
+
+import collidables
+import util
+from vector import Vector
+from collidables import *
+from coll_table import CollisionTable
+from grid import Grid
+from layout import Compiled_Layout, load as load_layout
+
+# Clock frequency in hertz
+clock_freq = 120
+
+# Collidables above which a Grid is used instead of a CollisionTable
+grid_min = 64
+
+# Fraction of their closing speed two pucks keep after hitting each other
+puck_coll_const = 1.0
+
+# Upper bound on collisions resolved in one move, so a puck grazing or
+# pinched against an object can't stall the game
+max_bounces = 64
+
+# Backend Puck.move runs on: 'python' for the code in this file, 'numba' for
+# the same math in kernels.py, compiled. Set with select_backend().
+backend = 'python'
+# kernels.move() compiled, while the numba backend is selected
+compiled_move = None
+
+# Select the backend of Puck.move, 'python' or 'numba'
+# Without Numba installed the pure Python backend stays selected.
+# Returns the backend selected
+def select_backend(name):
+
+    global backend, compiled_move
+
+    if name not in ('python', 'numba'):
+        raise ValueError("unknown backend %r, expected 'python' or 'numba'" % name)
+
+    backend = 'python'
+    compiled_move = None
+    if name == 'numba':
+        try:
+            import numba
+        except ImportError:
+            # Keep the pure Python path
+            return backend
+        import kernels
+        kernels.compile_kernels(numba)
+        compiled_move = kernels.move
+        backend = name
+
+    return backend
+
+# Time until the puck hits the first of the collidables and that object
+# collidables is either a list of objects, a CollisionTable or a Grid. A
+# Grid only looks for collisions the puck can reach within time_left.
+# Returns (None, None) if the puck won't hit anything
+def first_collision(puck, collidables, time_left):
+
+    if not isinstance(collidables, list):
+        return collidables.first_collision(puck, time_left)
+
+    coll_times = [obj.coll_time(puck) for obj in collidables]
+    min_pos = util.min_pos(coll_times)
+
+    if min_pos is None:
+        return (None, None)
+    return (coll_times[min_pos], collidables[min_pos])
+
+# Collidables compiled for fast collision queries: a Grid broad phase for
+# large arenas and a flat CollisionTable otherwise
+# rows are the rows of the first objects, from a compiled layout
+def compile_collidables(objects, rows=None):
+
+    if len(objects) > grid_min:
+        return Grid(objects)
+    return CollisionTable(objects, rows)
+
+# Time until two moving pucks touch, or None if they won't
+# Pucks that already overlap and are closing in touch straight away
+def puck_coll_time(puck_1, puck_2):
+
+    d_x = puck_2.location.x - puck_1.location.x
+    d_y = puck_2.location.y - puck_1.location.y
+    w_x = puck_2.velocity.x - puck_1.velocity.x
+    w_y = puck_2.velocity.y - puck_1.velocity.y
+
+    # Solve |d + w t| = r for the earliest t
+    b = d_x * w_x + d_y * w_y
+    if b >= 0:
+        # Not closing in
+        return None
+
+    r = puck_1.radius + puck_2.radius
+    c = d_x * d_x + d_y * d_y - r * r
+    if c <= 0:
+        return 0
+
+    a = w_x * w_x + w_y * w_y
+    disc = b * b - a * c
+    if disc < 0:
+        # Passing by each other
+        return None
+
+    return (-b - math.sqrt(disc)) / a
+
+# Update the velocities of two touching pucks of equal mass
+def collide_pucks(puck_1, puck_2):
+
+    n_x = puck_2.location.x - puck_1.location.x
+    n_y = puck_2.location.y - puck_1.location.y
+    mag = math.sqrt(n_x * n_x + n_y * n_y)
+    if mag == 0:
+        return
+    n_x /= mag
+    n_y /= mag
+
+    # Closing speed along the line between the centers
+    closing = (puck_2.velocity.x - puck_1.velocity.x) * n_x \
+              + (puck_2.velocity.y - puck_1.velocity.y) * n_y
+    impulse = (1 + puck_coll_const) / 2 * closing
+
+    puck_1.velocity = Vector(puck_1.velocity.x + impulse * n_x,
+                             puck_1.velocity.y + impulse * n_y)
+    puck_2.velocity = Vector(puck_2.velocity.x - impulse * n_x,
+                             puck_2.velocity.y - impulse * n_y)
+
+# x range a puck sweeps through between times now and end, when its
+# location is valid at time start
+def x_span(puck, start, now, end):
+    x_now = puck.location.x + puck.velocity.x * (now - start)
+    x_end = x_now + puck.velocity.x * (end - now)
+    return (min(x_now, x_end) - puck.radius, max(x_now, x_end) + puck.radius)
+
+# Pairs of pucks that may hit each other within time, by sweep and prune:
+# the x ranges the pucks sweep through are sorted by their low end and only
+# pucks whose ranges overlap are paired
+def sweep_pairs(pucks, time):
+
+    spans = sorted((x_span(puck, 0, 0, time) + (i,))
+                   for (i, puck) in enumerate(pucks))
+
+    pairs = []
+    # (high end, puck index) of the ranges the sweep is inside of
+    active = []
+    for (low, high, i) in spans:
+        active = [(a_high, a) for (a_high, a) in active if a_high >= low]
+        for (a_high, a) in active:
+            pairs.append((pucks[a], pucks[i]))
+        active.append((high, i))
+
+    return pairs
+
+# Update the location of several pucks by time, with the pucks bouncing off
+# the collidables and off each other
+#
+# Each puck keeps its own clock and only glides up to the time it's needed
+# at, and the next collisions are kept in a priority queue. When pucks
+# change velocity only their own collisions are worked out again, against
+# the collidables and against the pucks whose x ranges overlap theirs, so a
+# clock cycle costs about the number of pucks plus the number of bounces.
+# As in Puck.move(), a puck glides for the rest of the cycle once it has
+# bounced max_bounces times, e.g. when it's pinned against a paddle.
+def move_pucks(pucks, collidables, time):
+
+    # Time each puck's location is valid at
+    clock = dict.fromkeys(pucks, 0)
+    versions = dict.fromkeys(pucks, 0)
+    # Collisions resolved this cycle
+    bounces = dict.fromkeys(pucks, 0)
+    # (time, sequence, puck, object or other puck, puck version, other version)
+    queue = []
+    sequence = itertools.count()
+
+    def advance(puck, t):
+        puck.location.iadd_scaled(puck.velocity, t - clock[puck])
+        clock[puck] = t
+
+    def schedule_static(puck, now):
+        if bounces[puck] >= max_bounces:
+            return
+        while True:
+            (coll_time, obj) = first_collision(puck, collidables, time - now)
+            if obj is None or now + coll_time > time:
+                return
+            if coll_time < 0:
+                # Weird paddle movement happened
+                # Pretend that the paddle doesn't exist
+                obj.ghost = True
+                continue
+            heapq.heappush(queue, (now + coll_time, next(sequence), puck, obj,
+                                   versions[puck], None))
+            return
+
+    def schedule_pair(puck_1, puck_2, now):
+        if bounces[puck_1] >= max_bounces or bounces[puck_2] >= max_bounces:
+            return
+        advance(puck_1, now)
+        advance(puck_2, now)
+        coll_time = puck_coll_time(puck_1, puck_2)
+        if coll_time is not None and now + coll_time <= time:
+            heapq.heappush(queue, (now + coll_time, next(sequence), puck_1,
+                                   puck_2, versions[puck_1], versions[puck_2]))
+
+    for puck in pucks:
+        schedule_static(puck, 0)
+    for (puck_1, puck_2) in sweep_pairs(pucks, time):
+        schedule_pair(puck_1, puck_2, 0)
+
+    while queue:
+
+        (now, seq, puck, other, version, other_version) = heapq.heappop(queue)
+        if versions[puck] != version:
+            continue
+
+        if other in versions:
+            if versions[other] != other_version:
+                continue
+            advance(puck, now)
+            advance(other, now)
+            collide_pucks(puck, other)
+            puck.bounces += 1
+            other.bounces += 1
+            bounces[puck] += 1
+            bounces[other] += 1
+            changed = [puck, other]
+
+        elif getattr(other, 'ghost', False):
+            # Ghosted by another puck since this was queued
+            # Its collisions are worked out again from where it is now
+            advance(puck, now)
+            changed = [puck]
+
+        else:
+            advance(puck, now)
+            puck.velocity = other.collide_velocity(puck, puck.location)
+            puck.bounces += 1
+            bounces[puck] += 1
+            changed = [puck]
+
+        for puck in changed:
+            versions[puck] += 1
+        for puck in changed:
+            schedule_static(puck, now)
+            (low, high) = x_span(puck, clock[puck], now, time)
+            for other in pucks:
+                if other is not puck:
+                    (o_low, o_high) = x_span(other, clock[other], now, time)
+                    if o_low <= high and low <= o_high:
+                        schedule_pair(puck, other, now)
+
+    for puck in pucks:
+        advance(puck, time)
+
+class Puck(Circle):
+
+    def __init__(self, location, velocity, radius):
+        self.base_location = location
+        self.base_velocity = velocity
+        # Copies, as move() updates the location in place
+        self.location = self.base_location.copy()
+        self.velocity = self.base_velocity.copy()
+        self.radius = radius
+        self.ghost = False
+        self.max_velocity = 10000
+        # Where the puck touches the object it hits, see move()
+        self.coll_point = Vector(0, 0)
+        # Collisions resolved so far, for instrumentation
+        self.bounces = 0
+
+    # Update location by dt seconds, one clock cycle by default
+    #
+    # The location is updated in place, so gliding across the table doesn't
+    # allocate any vectors
+    def move(self, collidables, dt=None):
+
+        # Time left in move
+        time_left = 1/clock_freq if dt is None else dt
+        bounces = 0
+
+        if compiled_move is not None and type(collidables) is CollisionTable:
+            packed = collidables.packed()
+            if packed is not None:
+                self.move_packed(packed, time_left)
+                return
+
+        while time_left > 0:
+
+            (coll_time, obj) = first_collision(self, collidables, time_left)
+
+            if obj is None or coll_time > time_left or bounces == max_bounces:
+
+                # There are no more collisions this cycle, or no more that
+                # will be resolved
+                self.location.iadd_scaled(self.velocity, time_left)
+                time_left = 0
+
+            else:
+                # There is a collision
+                if coll_time < 0:
+                    # Weird paddle movement happened
+                    # Pretend that the paddle doesn't exist
+                    obj.ghost = True
+                    continue
+
+                else:
+                    coll_point = self.coll_point.set(self.location.x, self.location.y)
+                    coll_point.iadd_scaled(self.velocity, coll_time)
+                    new_vel = obj.collide_velocity(self, coll_point)
+                    self.location.set(coll_point.x, coll_point.y)
+                    self.velocity = new_vel
+                    time_left = time_left - coll_time
+                    bounces += 1
+                    self.bounces += 1
+
+    # move() through the compiled kernels, see kernels.py
+    def move_packed(self, packed, time_left):
+
+        packed.load()
+        (x, y, v_x, v_y, bounces) = compiled_move(
+            packed.walls, packed.circle_rows, packed.skip,
+            self.location.x, self.location.y, self.velocity.x, self.velocity.y,
+            self.radius, time_left, collidables.wall_coll_const,
+            self.max_velocity, max_bounces)
+        packed.store()
+
+        self.location.set(x, y)
+        if bounces:
+            self.velocity = Vector(v_x, v_y)
+            self.bounces += bounces
+
+    # Has a goal just been scored?
+    # Returns false if no goal, -1 if left goal, 1  if right goal
+    def goal(self, table):
+
+        if self.location.x > table.x_len + table.border_width:
+            # Left scores
+            return -1
+        if self.location.x < -table.border_width:
+            # Right scores
+            return 1
+        return False
+
+    # Reset position
+    def reset(self):
+        self.location = self.base_location.copy()
+        self.velocity = self.base_velocity.copy()
+
+class Paddle(Circle):
+
+    def __init__(self, location, radius, color, left):
+        self.location = location
+        self.new_location = Vector(0, 0)
+        self.radius = radius
+        self.color = color
+        self.ghost = False
+        self.velocity = Vector(0, 0)
+        self.coll_const = .8
+        # Is left paddle
+        self.left = left
+
+    # Update the location from a position on the table (in millimeters)
+    # reached dt seconds after the last one, one clock cycle by default
+    # path is the (time, location) points the paddle went through on the
+    # way, times in seconds into the step, see sweep()
+    def start_move(self, new_location, table, puck, dt=None, path=()):
+        if dt is None:
+            dt = 1/clock_freq
+        self.new_location = new_location
+        self.velocity = (1/dt) * (self.new_location - self.location)
+
+        if path and not self.ghost:
+            self.sweep(path, dt, table, puck)
+
+        elif not self.ghost:
+            # The paddle can't collide with the puck while its ghost, in order
+            # to let the puck move away
+
+            # See if the paddle crashes into the puck
+            puck_coll_time = puck.coll_time(self)
+
+            if puck_coll_time != None and puck_coll_time < dt:
+
+                # The paddle will collide with the puck
+                self.location = self.location + puck_coll_time * self.velocity
+
+                if self.invalid_loc(table):
+                    self.ghost = True
+                else:
+                    puck.velocity = self.collide_velocity(puck, puck.location)
+
+            else:
+                self.location = self.new_location
+        else:
+            self.location = self.new_location
+
+        if self.invalid_loc(table):
+            self.ghost = True
+
+    # Follow the path to new_location one segment at a time, each with its
+    # own velocity, and stop where the paddle first hits the puck
+    # A segment is only tested with coll_time() if the puck is within reach
+    # of it, so most of a path costs a distance check per segment. The
+    # paddle is left with the velocity of the segment it's on.
+    def sweep(self, path, dt, table, puck):
+
+        reach = self.radius + puck.radius
+        (start, start_time) = (self.location, 0)
+
+        for (end_time, end) in list(path) + [(dt, self.new_location)]:
+
+            if end_time <= start_time:
+                continue
+            velocity = (1/(end_time - start_time)) * (end - start)
+
+            if segment_dist_sq(puck.location, start, end) < reach * reach:
+                self.location = start
+                self.velocity = velocity
+                puck_coll_time = puck.coll_time(self)
+                if puck_coll_time != None and puck_coll_time < end_time - start_time:
+                    # The paddle will collide with the puck
+                    self.location = start + puck_coll_time * self.velocity
+                    if self.invalid_loc(table):
+                        self.ghost = True
+                    else:
+                        puck.velocity = self.collide_velocity(puck, puck.location)
+                    return
+
+            (start, start_time) = (end, end_time)
+
+        self.location = self.new_location
+        self.velocity = velocity
+
+    def end_move(self, table, puck):
+        self.location = self.new_location
+        self.ghost = self.intersecting(puck) or self.invalid_loc(table)
+
+    # Paddle in a position where it shouldn't hit the puck
+    def invalid_loc(self, table):
+        return invalid_paddle_loc(self.location, self.radius, self.left, table)
+
+# Would a paddle of radius at location, on the left if left, be in a
+# position where it shouldn't hit the puck? See Paddle.invalid_loc()
+def invalid_paddle_loc(location, radius, left, table):
+
+    # Is the paddle over the center line
+    if left:
+        if (location.x + radius) > (table.x_len + table.mid_line_width)/2:
+            return True
+    else:
+        if (location.x - radius) < (table.x_len - table.mid_line_width)/2:
+            return True
+
+    # Paddle over borders
+    if location.x < radius:
+        return True
+    if location.x > table.x_len - radius:
+        return True
+    if location.y < radius:
+        return True
+    if location.y > table.y_len - radius:
+        return True
+
+    return False
+
+# Squared distance from point p to the segment from a to b
+def segment_dist_sq(p, a, b):
+
+    (d_x, d_y) = (b.x - a.x, b.y - a.y)
+    length_sq = d_x * d_x + d_y * d_y
+    t = 0
+    if length_sq > 0:
+        t = min(1, max(0, ((p.x - a.x) * d_x + (p.y - a.y) * d_y) / length_sq))
+    (e_x, e_y) = (a.x + t * d_x - p.x, a.y + t * d_y - p.y)
+    return e_x * e_x + e_y * e_y
+
+# Dimensions of the playing surface in millimeters and what's on it
+# layout is a compiled layout, a layout or the path of one, see layout.py;
+# the standard table by default
+class Table:
+
+    def __init__(self, layout=None):
+
+        if not isinstance(layout, Compiled_Layout):
+            layout = load_layout(layout)
+        self.layout = layout
+
+        for (key, value) in layout.table.items():
+            setattr(self, key, value)
+        self.goal_y_low = (self.y_len - self.goal_width) / 2
+        self.goal_y_high = (self.y_len + self.goal_width) / 2
+
+# The puck, both paddles, everything they can hit and the score
+class Simulation:
+
+    def __init__(self, table=None, n_pucks=1):
+
+        if table is None:
+            table = Table()
+
+        self.win_score = 7
+        self.table = table
+        puck_radius = table.puck_radius
+        self.pucks = [Puck(location, Vector(0,0), puck_radius)
+                      for location in self.serve_locations(n_pucks, puck_radius)]
+        self.puck = self.pucks[0]
+        # Pucks that scored since the last serve
+        self.scored = []
+        paddle_color = (196, 0, 0)
+        self.paddle_1 = Paddle(Vector(300, 300), table.paddle_radius, paddle_color, False)
+        self.paddle_2 = Paddle(Vector(200, self.table.y_len / 2), table.paddle_radius,
+                               paddle_color, True)
+
+        # (left score, right score)
+        self.score = (0,0)
+
+        # Objects that the puck can collide with: the walls, corners and
+        # obstacles of the layout, then the paddles
+        self.collidables = table.layout.objects() + [self.paddle_1, self.paddle_2]
+
+        # The collidables compiled for fast collision queries, with the rows
+        # the layout worked out
+        self.coll_table = compile_collidables(self.collidables, table.layout.rows)
+
+    # Where pucks start: in columns across the middle of the table, three
+    # radii apart
+    def serve_locations(self, n_pucks, radius):
+
+        per_column = max(1, int(self.table.y_len // (3 * radius)))
+        columns = -(-n_pucks // per_column)
+
+        locations = []
+        for i in range(n_pucks):
+            (column, row) = divmod(i, per_column)
+            in_column = min(per_column, n_pucks - column * per_column)
+            locations.append(Vector(
+                self.table.x_len/2 + (column - (columns - 1)/2) * 3 * radius,
+                self.table.y_len * (row + 1) / (in_column + 1)))
+        return locations
+
+    # The puck closest to a location, e.g. the one a paddle moving there
+    # can hit
+    def nearest_puck(self, location):
+        return min(self.pucks, key=lambda puck: (puck.location - location).mag_sq())
+
+    # Advance the pucks by dt seconds, one clock cycle by default, and count
+    # the goals they score
+    # Returns the goals scored this step, as given by Puck.goal()
+    def step(self, dt=None):
+
+        if dt is None:
+            dt = 1/clock_freq
+
+        for paddle in [self.paddle_1, self.paddle_2]:
+            self.coll_table.update(paddle)
+
+        if len(self.pucks) == 1:
+            self.puck.move(self.coll_table, dt)
+        else:
+            move_pucks(self.pucks, self.coll_table, dt)
+
+        goals = []
+        for puck in self.pucks:
+            if puck in self.scored:
+                continue
+            goal = puck.goal(self.table)
+            if goal:
+                self.scored.append(puck)
+                self.update_score(goal)
+                goals.append(goal)
+
+        return goals
+
+    # Move the paddles to new locations over dt seconds, one clock cycle by
+    # default, and advance the pucks with them, as the game does every step
+    # locations maps paddles to locations on the table in millimeters, and
+    # paths maps paddles to the points they went through on the way, see
+    # Paddle.sweep()
+    # Returns the goals scored, see step()
+    def step_paddles(self, locations, dt=None, paths=None):
+
+        for (paddle, location) in locations.items():
+            path = paths.get(paddle, ()) if paths else ()
+            paddle.start_move(location, self.table, self.nearest_puck(location),
+                              dt, path)
+
+        goals = self.step(dt)
+
+        for paddle in locations:
+            paddle.end_move(self.table, self.nearest_puck(paddle.new_location))
+
+        return goals
+
+    # Put the paddles at new locations without hitting anything, e.g. while
+    # waiting to serve
+    def place_paddles(self, locations):
+        for (paddle, location) in locations.items():
+            paddle.new_location = location
+            paddle.end_move(self.table, self.nearest_puck(location))
+
+    # Everything that changes as the game is played, as a flat tuple of
+    # numbers that restore() can put back
+    def snapshot(self):
+
+        state = list(self.score)
+        for puck in self.pucks:
+            state += [puck.location.x, puck.location.y,
+                      puck.velocity.x, puck.velocity.y,
+                      puck.ghost, puck in self.scored]
+        for paddle in [self.paddle_1, self.paddle_2]:
+            state += [paddle.location.x, paddle.location.y,
+                      paddle.new_location.x, paddle.new_location.y,
+                      paddle.velocity.x, paddle.velocity.y]
+        # Any circle can be ghosted, not only the paddles
+        state += [obj.ghost for obj in self.collidables if isinstance(obj, Circle)]
+
+        return tuple(state)
+
+    def restore(self, state):
+
+        state = iter(state)
+        self.score = (int(next(state)), int(next(state)))
+        self.scored = []
+        for puck in self.pucks:
+            puck.location = Vector(next(state), next(state))
+            puck.velocity = Vector(next(state), next(state))
+            puck.ghost = bool(next(state))
+            if next(state):
+                self.scored.append(puck)
+        for paddle in [self.paddle_1, self.paddle_2]:
+            paddle.location = Vector(next(state), next(state))
+            paddle.new_location = Vector(next(state), next(state))
+            paddle.velocity = Vector(next(state), next(state))
+        for obj in self.collidables:
+            if isinstance(obj, Circle):
+                obj.ghost = bool(next(state))
+
+        for paddle in [self.paddle_1, self.paddle_2]:
+            self.coll_table.update(paddle)
+
+    # Put the pucks that scored back, or start a new match if someone won
+    # Returns the winner as given by check_win()
+    def serve(self):
+
+        winner = self.check_win()
+        if winner:
+            self.reset()
+        else:
+            for puck in self.scored:
+                puck.reset()
+            self.scored = []
+
+        return winner
+
+    def update_score(self, goal):
+        (left_score, right_score) = self.score
+        if goal < 0:
+            left_score = left_score + 1
+        elif goal > 0:
+            right_score = right_score + 1
+        self.score = (left_score, right_score)
+
+    def check_win(self):
+        (left_score, right_score) = self.score
+        if left_score >= self.win_score:
+            return -1
+        if right_score >= self.win_score:
+            return 1
+        return None
+
+    def reset(self):
+        for puck in self.pucks:
+            puck.reset()
+        self.scored = []
+        self.score = (0,0)
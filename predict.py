@@ -0,0 +1,244 @@
+# Where a puck is going, worked out from the collision sequence
+#
+# Between collisions a puck moves in a straight line, so its path over the
+# next second or two is a list of segments, each starting at a bounce. The
+# Predictor finds them the way Puck.move does, one coll_time() query per
+# bounce, but over the whole horizon at once instead of clock cycle by clock
+# cycle, and against the static objects only: the paddles move as they
+# please and are left out.
+#
+# Paths are cached per puck. A cached path stays valid for as long as the
+# puck is on it, which is checked on every query: the puck has to have the
+# velocity of one of the segments and sit on its line. Wall bounces keep the
+# puck on the path, while a paddle contact or anything else that changes its
+# velocity makes it leave, and the path is worked out again. Paths are
+# worked out two horizons ahead and extended once less than one is left, so
+# a puck that only hits walls costs a walk every horizon.
+#
+#   predictor = Predictor(sim)
+#   path = predictor.predict(sim.puck)
+#   path.at(.5)             # Location in half a second
+#   path.crossing_x(300)    # (time, location) when it reaches x = 300
+#   path.bounces()          # Segments starting at a bounce
+#
+# Puck.move works out the bounce off a circle from where the puck was at the
+# start of the clock cycle, or at its last bounce in the cycle, rather than
+# from where it touches the circle. Corner bounces are predicted the same way
+# for paths that match the game exactly, which takes knowing the clock cycle
+# and querying on its boundaries, as the game loop does.
+
+import bisect
+import collections
+import math
+
+import physics
+from events import Goal_Lines
+from vector import Vector
+
+# Seconds predicted ahead, at least
+horizon = 2.0
+
+# Distance in millimeters a puck can be off a cached path and still be on it
+on_path_tol = 1e-3
+
+# A straight stretch of a path: the puck is at (x, y) with velocity (v_x, v_y)
+# at time, having just hit obj, or obj is None for the first segment. goal is
+# set on the last segment if the puck scores at its end, as given by
+# Puck.goal().
+Segment = collections.namedtuple('Segment', 'time x y v_x v_y obj goal')
+
+class Path:
+
+    def __init__(self, segments, end, radius, start=0, times=None):
+        self.segments = segments
+        # Start times of the segments, for bisect
+        if times is None:
+            times = [segment.time for segment in segments]
+        self.times = times
+        # Time the path ends at, the horizon or when the puck scores
+        self.end = end
+        self.radius = radius
+        # Time on the segments that is now, times passed to and returned by
+        # the queries are relative to it
+        self.start = start
+
+    # Segment the puck is on at time t of the path
+    def segment_at(self, t):
+        return self.segments[max(0, bisect.bisect_right(self.times, t) - 1)]
+
+    # Location of the puck t seconds from now
+    # Returns None past the end of the path
+    def at(self, t):
+        t += self.start
+        if t > self.end:
+            return None
+        segment = self.segment_at(t)
+        return Vector(segment.x + segment.v_x * (t - segment.time),
+                      segment.y + segment.v_y * (t - segment.time))
+
+    # First time the center of the puck reaches x, and where it is then
+    # Returns None if it doesn't before the end of the path
+    def crossing_x(self, x):
+
+        first = max(0, bisect.bisect_right(self.times, self.start) - 1)
+        for (i, segment) in enumerate(self.segments[first:], first):
+
+            seg_start = max(segment.time, self.start)
+            seg_end = self.times[i + 1] if i + 1 < len(self.times) else self.end
+            x_start = segment.x + segment.v_x * (seg_start - segment.time)
+
+            if x_start == x:
+                t = seg_start
+            elif segment.v_x == 0 or (x - x_start) * segment.v_x < 0:
+                continue
+            else:
+                t = seg_start + (x - x_start) / segment.v_x
+                if t > seg_end:
+                    continue
+
+            return (t - self.start,
+                    Vector(x, segment.y + segment.v_y * (t - segment.time)))
+
+        return None
+
+    # Segments starting at a bounce from now on, with their times relative
+    # to now
+    def bounces(self):
+        return [segment._replace(time=segment.time - self.start)
+                for segment in self.segments
+                if segment.obj is not None and segment.time >= self.start]
+
+    # Where the path ends, and the goal scored there if any
+    def goal(self):
+        return self.segments[-1].goal
+
+class Predictor:
+
+    # dt is the clock cycle the simulation is stepped by, one clock cycle by
+    # default. Pass None for simulations with several pucks, move_pucks()
+    # bounces them off circles from where they touch.
+    def __init__(self, sim, horizon=horizon, dt=1/physics.clock_freq):
+
+        self.goal_lines = Goal_Lines(sim.table)
+        self.horizon = horizon
+        self.dt = dt
+        self.statics = physics.compile_collidables(
+            [obj for obj in sim.collidables
+             if not isinstance(obj, physics.Paddle)])
+        # Puck -> Path
+        self.cache = {}
+        # Queries answered from the cache and paths worked out
+        self.hits = 0
+        self.misses = 0
+
+    # Path of the puck over the horizon
+    def predict(self, puck):
+
+        path = self.cache.get(puck)
+        if path is not None:
+            start = self.locate(path, puck)
+            if start is not None:
+                self.hits += 1
+                if start + self.horizon > path.end and path.goal() is None:
+                    # Running out of path, go on from here
+                    segment = path.segment_at(start)
+                    path = self.walk(Vector(segment.x, segment.y),
+                                     Vector(segment.v_x, segment.v_y),
+                                     path.radius, segment.time, segment.obj)
+                path = Path(path.segments, path.end, path.radius, start,
+                            path.times)
+                self.cache[puck] = path
+                return path
+
+        self.misses += 1
+        path = self.walk(puck.location, puck.velocity, puck.radius, 0)
+        self.cache[puck] = path
+        return path
+
+    # Forget the cached paths, e.g. after moving pucks by hand
+    def invalidate(self, puck=None):
+        if puck is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(puck, None)
+
+    # Time of the path the puck is at, or None if it's left it
+    def locate(self, path, puck):
+
+        (x, y) = (puck.location.x, puck.location.y)
+        (v_x, v_y) = (puck.velocity.x, puck.velocity.y)
+        speed_sq = v_x * v_x + v_y * v_y
+        v_tol = 1e-9 * (1 + speed_sq)
+
+        # Pucks only go forward along their path
+        first = max(0, bisect.bisect_right(path.times, path.start) - 1)
+        for (i, segment) in enumerate(path.segments[first:], first):
+
+            d_v_x = segment.v_x - v_x
+            d_v_y = segment.v_y - v_y
+            if d_v_x * d_v_x + d_v_y * d_v_y > v_tol:
+                continue
+
+            # Closest time on the line of the segment
+            (d_x, d_y) = (x - segment.x, y - segment.y)
+            if speed_sq == 0:
+                t = path.start
+            else:
+                t = segment.time + (d_x * v_x + d_y * v_y) / speed_sq
+            seg_end = path.times[i + 1] if i + 1 < len(path.times) else path.end
+            if not max(segment.time, path.start) - 1e-9 <= t <= seg_end + 1e-9:
+                continue
+
+            off_x = d_x - v_x * (t - segment.time)
+            off_y = d_y - v_y * (t - segment.time)
+            if off_x * off_x + off_y * off_y <= on_path_tol * on_path_tol:
+                return max(t, path.start)
+
+        return None
+
+    # Bounce a puck at location with velocity off the static objects, from
+    # time start until two horizons later, after it's just hit obj
+    def walk(self, location, velocity, radius, start, obj=None):
+
+        end = start + 2 * self.horizon
+        probe = physics.Puck(location.copy(), velocity.copy(), radius)
+
+        segments = []
+        now = start
+        goal = None
+        for bounces in range(physics.max_bounces + 1):
+
+            segment = Segment(now, probe.location.x, probe.location.y,
+                              probe.velocity.x, probe.velocity.y, obj, None)
+            (coll_time, obj) = physics.first_collision(probe, self.statics, end - now)
+            if bounces == physics.max_bounces or coll_time is None \
+                    or coll_time < 0 or now + coll_time > end:
+                coll_time = end - now
+
+            # Stop at the goal line if the puck crosses it
+            goal_time = self.goal_lines.coll_time(probe)
+            if goal_time is not None and goal_time <= coll_time:
+                coll_time = goal_time
+                goal = self.goal_lines.goal(probe)
+
+            if goal is not None:
+                segments.append(segment._replace(goal=goal))
+                return Path(segments, now + coll_time, radius)
+            segments.append(segment)
+            if now + coll_time >= end or obj is None:
+                return Path(segments, end, radius)
+
+            if self.dt is not None and isinstance(obj, physics.Circle):
+                # From the start of the clock cycle, see above
+                cycle_start = math.floor((now + coll_time) / self.dt) * self.dt
+                probe.location.iadd_scaled(probe.velocity,
+                                           max(0, cycle_start - now))
+                probe.velocity = obj.collide_velocity(probe, probe.location)
+                probe.location.set(segment.x + segment.v_x * coll_time,
+                                   segment.y + segment.v_y * coll_time)
+            else:
+                probe.location.iadd_scaled(probe.velocity, coll_time)
+                probe.velocity = obj.collide_velocity(probe, probe.location)
+            now += coll_time
+
+        return Path(segments, end, radius)
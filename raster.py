@@ -0,0 +1,280 @@
+# Offscreen rendering of a Simulation into NumPy frame buffers
+#
+# No pygame and no display: the table is drawn once into a background
+# array, and each frame is that background with the pucks and paddles
+# stamped on top from disc masks worked out once per radius. Frames are
+# rendered in batches, one array pass per circle for the whole batch, into
+# any (frames, height, width, 3) uint8 buffer, e.g. a Frame_File:
+#
+#   raw file  frames back to back, height x width x RGB, no header
+#   index     path + '.json': width, height, frames, fps, scale and marks,
+#             frame numbers of goals etc., for cutting highlights
+#
+# The raw file is written through memory maps of chunk_frames frames, so a
+# frame is rendered straight into the page cache without another copy, and
+# can be read back the same way with open_frames().
+#
+# The score and the triangles of the game window are left out.
+#
+#   python raster.py out.raw [--seconds 60] [--scale .2] [--levels hard medium]
+
+import argparse
+import json
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+import ai
+import physics
+from vector import Vector
+
+# Default pixels per millimeter, a quarter of the game window's
+scale = .1125
+# Frames mapped at a time while writing
+chunk_frames = 1024
+
+border_color = (10, 15, 176)
+space_color = (255, 255, 255)
+line_color = (0, 0, 0)
+puck_color = (255, 4, 4)
+
+# Offsets (rows, columns) of the pixels of a disc of radius pixels
+def disc(radius):
+    (dy, dx) = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    inside = dy * dy + dx * dx <= radius * radius
+    return (dy[inside], dx[inside])
+
+# Draws the table of a Simulation and the circles on it
+class Raster:
+
+    def __init__(self, sim, scale=scale):
+
+        table = sim.table
+        self.scale = scale
+        self.border = table.border_width
+        self.width = self.pix(table.x_len + 2 * table.border_width)
+        self.height = self.pix(table.y_len + 2 * table.border_width)
+
+        # Drawn in this order: the pucks, then the paddles over them
+        circles = [(puck, puck_color) for puck in sim.pucks] \
+                  + [(paddle, paddle.color) for paddle in [sim.paddle_1, sim.paddle_2]]
+        self.circles = [circle for (circle, color) in circles]
+        self.colors = [np.array(color, dtype=np.uint8) for (circle, color) in circles]
+        # Radius in pixels -> disc offsets
+        self.discs = {}
+        self.offsets = [self.disc(self.pix(circle.radius)) for circle in self.circles]
+
+        self.background = self.render_background(table)
+
+    def pix(self, mm):
+        return int(mm * self.scale)
+
+    def disc(self, radius):
+        if radius not in self.discs:
+            self.discs[radius] = disc(radius)
+        return self.discs[radius]
+
+    # Everything that never changes, as in Arena.render_background()
+    def render_background(self, table):
+
+        image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        image[:] = border_color
+
+        def rect(x, y, w, h, color):
+            (x, y) = (self.pix(x), self.pix(y))
+            image[y:y + self.pix(h), x:x + self.pix(w)] = color
+
+        b = table.border_width
+        rect(b, b, table.x_len, table.y_len, space_color)
+        rect(b + table.x_len, b + table.goal_y_low, b, table.goal_width, space_color)
+        rect(0, b + table.goal_y_low, b, table.goal_width, space_color)
+        rect(b + (table.x_len - table.mid_line_width) / 2, b, table.mid_line_width,
+             table.y_len, line_color)
+
+        # Obstacles, circles as discs and walls as bars half the mid line wide
+        for obj in table.layout.obstacles():
+            if isinstance(obj, physics.Circle):
+                self.stamp(image[None], obj.location.x, obj.location.y,
+                           self.disc(self.pix(obj.radius)), border_color)
+                continue
+            if hasattr(obj, 'y_low'):
+                (x_0, x_1) = (obj.x, obj.x)
+                (y_0, y_1) = (obj.y_low, obj.y_high)
+            elif hasattr(obj, 'x_low'):
+                (x_0, x_1) = (obj.x_low, obj.x_high)
+                (y_0, y_1) = (obj.y, obj.y)
+            elif hasattr(obj, 'x'):
+                (x_0, x_1, y_0, y_1) = (obj.x, obj.x, 0, table.y_len)
+            else:
+                (x_0, x_1, y_0, y_1) = (0, table.x_len, obj.y, obj.y)
+            half = table.mid_line_width / 4
+            rect(b + x_0 - half, b + y_0 - half, x_1 - x_0 + 2 * half,
+                 y_1 - y_0 + 2 * half, border_color)
+
+        return image
+
+    # Stamp a disc at (x, y) in mm on every frame of frames
+    # x and y are scalars or one value per frame
+    def stamp(self, frames, x, y, offsets, color):
+
+        (dy, dx) = offsets
+        n = len(frames)
+        rows = np.asarray((np.asarray(y) + self.border) * self.scale, dtype=np.int64)
+        cols = np.asarray((np.asarray(x) + self.border) * self.scale, dtype=np.int64)
+        rows = np.broadcast_to(rows, (n,))[:, None] + dy
+        cols = np.broadcast_to(cols, (n,))[:, None] + dx
+        index = np.broadcast_to(np.arange(n)[:, None], rows.shape)
+
+        inside = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+        if inside.all():
+            frames[index, rows, cols] = color
+        else:
+            frames[index[inside], rows[inside], cols[inside]] = color
+
+    # Where the circles are now, as a (circles, 2) array, for render()
+    def locations(self):
+        return np.array([(circle.location.x, circle.location.y)
+                         for circle in self.circles])
+
+    # Draw frames with the circles at locations, (frames, circles, 2) in mm,
+    # into out, (frames, height, width, 3)
+    def render(self, locations, out):
+
+        out[:] = self.background
+        for (i, (offsets, color)) in enumerate(zip(self.offsets, self.colors)):
+            self.stamp(out, locations[:, i, 0], locations[:, i, 1], offsets, color)
+        return out
+
+    # A new frame buffer with the circles where they are now
+    def frame(self):
+        out = np.empty((1, self.height, self.width, 3), dtype=np.uint8)
+        return self.render(self.locations()[None], out)[0]
+
+# Frames streamed into a raw file through memory maps, see the top of the
+# file
+class Frame_File:
+
+    def __init__(self, path, width, height, fps=physics.clock_freq, scale=None):
+
+        self.path = path
+        self.shape = (height, width, 3)
+        self.frame_size = height * width * 3
+        self.fps = fps
+        self.scale = scale
+        # (frame, name) of things worth finding again
+        self.marks = []
+        self.frames = 0
+        # Mapped chunk and the frame it starts at
+        self.map = None
+        self.map_start = 0
+        open(path, 'wb').close()
+
+    # Map the next chunk, growing the file to fit it
+    def remap(self):
+        if self.map is not None:
+            self.map.flush()
+        self.map_start = self.frames
+        os.truncate(self.path, (self.map_start + chunk_frames) * self.frame_size)
+        self.map = np.memmap(self.path, dtype=np.uint8, mode='r+',
+                             offset=self.map_start * self.frame_size,
+                             shape=(chunk_frames,) + self.shape)
+
+    # Buffers for the next n frames, or fewer if the chunk ends first
+    def reserve(self, n):
+        if self.map is None or self.frames == self.map_start + chunk_frames:
+            self.remap()
+        start = self.frames - self.map_start
+        block = self.map[start:start + n]
+        self.frames += len(block)
+        return block
+
+    # Render frames with the circles at locations, see Raster.render()
+    def append(self, raster, locations):
+        done = 0
+        while done < len(locations):
+            block = self.reserve(len(locations) - done)
+            raster.render(locations[done:done + len(block)], block)
+            done += len(block)
+
+    # Mark a frame, e.g. a goal, in the index
+    def mark(self, frame, name):
+        self.marks.append((frame, name))
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map = None
+        os.truncate(self.path, self.frames * self.frame_size)
+        (height, width, channels) = self.shape
+        with open(self.path + '.json', 'w') as f:
+            json.dump({'width': width, 'height': height, 'frames': self.frames,
+                       'fps': self.fps, 'scale': self.scale, 'marks': self.marks}, f)
+
+# The frames of a raw file, memory mapped read only, and its index
+def open_frames(path):
+    with open(path + '.json') as f:
+        index = json.load(f)
+    frames = np.memmap(path, dtype=np.uint8, mode='r',
+                       shape=(index['frames'], index['height'], index['width'], 3))
+    return (frames, index)
+
+# Play a match between two computer players and render every step of it
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('out', help="raw frame file, indexed in OUT.json")
+    parser.add_argument('--seconds', type=float, default=60, help="of game time")
+    parser.add_argument('--scale', type=float, default=scale, help="pixels per mm")
+    parser.add_argument('--levels', nargs=2, default=['hard', 'medium'],
+                        choices=ai.levels, metavar='LEVEL')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch', type=int, default=256,
+                        help="steps simulated between renders")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    dt = 1/physics.clock_freq
+    sim = physics.Simulation()
+    players = {sim.paddle_2: ai.Opponent(sim, args.levels[0], sim.paddle_2, dt, budget=None),
+               sim.paddle_1: ai.Opponent(sim, args.levels[1], sim.paddle_1, dt, budget=None)}
+    raster = Raster(sim, args.scale)
+    out = Frame_File(args.out, raster.width, raster.height, physics.clock_freq, args.scale)
+
+    def serve():
+        angle = rng.uniform(-math.pi / 3, math.pi / 3) + rng.choice([0, math.pi])
+        sim.puck.velocity = Vector(3000 * math.cos(angle), 3000 * math.sin(angle))
+
+    serve()
+    steps = round(args.seconds / dt)
+    (sim_time, render_time) = (0, 0)
+    locations = np.empty((args.batch, len(raster.circles), 2))
+    goals = 0
+    for start in range(0, steps, args.batch):
+
+        t = time.perf_counter()
+        n = min(args.batch, steps - start)
+        for i in range(n):
+            if sim.step_paddles({paddle: player.target(dt)
+                                 for (paddle, player) in players.items()}, dt):
+                out.mark(out.frames + i, 'goal')
+                goals += 1
+                sim.serve()
+                serve()
+            locations[i] = raster.locations()
+        sim_time += time.perf_counter() - t
+
+        t = time.perf_counter()
+        out.append(raster, locations[:n])
+        render_time += time.perf_counter() - t
+
+    out.close()
+    print("%d frames of %dx%d, %d goals, score %s" % (out.frames, raster.width,
+          raster.height, goals, sim.score))
+    print("simulated at %.0f steps/s, rendered at %.0f frames/s"
+          % (steps / sim_time, steps / render_time))
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,17 @@
-import os
+# Prints the paddle frames arriving on the FIFO, see paddle_input.py
 
+import selectors
 
+from paddle_input import Fifo_Reader, FIFO
 
-FIFO = "/tmp/fifo"
+reader = Fifo_Reader(FIFO)
+selector = selectors.DefaultSelector()
+reader.register(selector)
+print("FIFO opened!")
 
-with open(FIFO, mode='rb') as fifo:
-    print("FIFO opened!")
-    while True:
-        data = fifo.read(4)
-       # bts = bytes(data, "utf-8")
-        print(data)
-        print(type(data))
-        num = int.from_bytes(data, byteorder="little")
-        n = len(data);
-        print("data length is " + str(n));
-        print("Received: " + str(num));
+while True:
+    for (key, events) in selector.select():
+        for sample in key.data.poll():
+            print(sample)
+        print("frames %d, dropped %d, out of order %d, skipped %d bytes"
+              % (reader.frames, reader.dropped, reader.out_of_order, reader.skipped))
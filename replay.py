@@ -0,0 +1,507 @@
+# Recording games and playing them back through the physics
+#
+# A Recorder stands in for the Simulation in the game loop and logs the
+# inputs that drive it: where the paddles are put every physics step, serves
+# and resets, plus the goals that come out, so that playback can check it
+# scores the same goals on the same steps.
+#
+# File layout, little-endian:
+#
+#   header  magic, version, pucks, physics step in seconds, location units
+#           per millimeter, physics steps between keyframes
+#   layout  key length u8, compiled buffer length u32, the key of the table's
+#           layout and the layout as Compiled_Layout.to_bytes(), so a game
+#           plays back on its own table without the layout file
+#   chunks  compressed length u32, first step u64, zlib compressed records
+#
+# Chunks are only ever appended. Each one starts with a keyframe holding the
+# full state from Simulation.snapshot(), so playback can start from any
+# chunk. A record is a byte with the opcode in the low four bits and, for
+# paddle records, the mask of the paddles it moves in the high four, followed
+# by varints:
+#
+#   STEP    per paddle, how much its move in x and y differs from its move
+#           in the last step, in location units, zigzag encoded
+#   REPEAT  count, more steps where the paddles move as in the last step
+#   PLACE   per paddle, its move in x and y; paddles put down without
+#           stepping, see Simulation.place_paddles()
+#   SERVE, RESET
+#   GOAL    goal + 1, as given by Puck.goal(), scored in the last step
+#   KEYFRAME, END
+#           state length, then the state as doubles; END closes the log
+#           with the final state
+#   PATH    per paddle, the number of points it went through on the way to
+#           its location in the next STEP, then per point its time into the
+#           step in time_units of the step, and how far it is in x and y
+#           from the point before, the first from where the paddle was,
+#           zigzag encoded; see Simulation.step_paddles()
+#
+# Paddle locations and path points are rounded to location units and time
+# units before they reach the physics, so that playback feeds it exactly
+# the same numbers.
+
+import struct
+import sys
+import time
+import zlib
+
+import physics
+from layout import Compiled_Layout
+from vector import Vector
+
+magic = b'AHRP'
+version = 3
+header = struct.Struct('<4sBHdHI')
+layout_header = struct.Struct('<BI')
+chunk_header = struct.Struct('<IQ')
+
+# Locations are logged in tenths of a millimeter
+units_per_mm = 10
+# Times of path points are logged in 1/65536 of a physics step
+time_units = 1 << 16
+# Simulated time between keyframes, in seconds
+keyframe_time = 10
+
+(STEP, REPEAT, PLACE, SERVE, RESET, GOAL, KEYFRAME, END, PATH) = range(9)
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def zigzag(value):
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+# Raised when playback doesn't do what the log says the game did
+class Replay_Mismatch(Exception):
+    pass
+
+# Where the paddles were last put and how far they moved in the last step,
+# in location units, kept the same way by the recorder and the player
+class Paddle_Track:
+
+    def __init__(self, paddles, units):
+        self.paddles = paddles
+        self.units = units
+        self.restart()
+
+    # Start again from where the paddles are, after a keyframe
+    def restart(self):
+        self.bases = [self.quantize(paddle.new_location) for paddle in self.paddles]
+        self.moves = [(0, 0) for paddle in self.paddles]
+
+    def quantize(self, location):
+        return (round(location.x * self.units), round(location.y * self.units))
+
+    # Put paddle i at (x, y) in location units
+    # Returns the location on the table and the move there
+    def move(self, i, x, y):
+        (base_x, base_y) = self.bases[i]
+        self.bases[i] = (x, y)
+        return (Vector(x / self.units, y / self.units), (x - base_x, y - base_y))
+
+class Recorder:
+
+    # Log the game played on sim to path, stepped dt seconds at a time
+    def __init__(self, sim, path, dt=None):
+
+        if dt is None:
+            dt = 1/physics.clock_freq
+
+        self.sim = sim
+        self.dt = dt
+        self.track = Paddle_Track([sim.paddle_1, sim.paddle_2], units_per_mm)
+        self.keyframe_steps = max(1, round(keyframe_time / dt))
+
+        self.file = open(path, 'wb')
+        self.file.write(header.pack(magic, version, len(sim.pucks), dt,
+                                    units_per_mm, self.keyframe_steps))
+        layout = sim.table.layout
+        key = layout.key.encode()
+        compiled = layout.to_bytes()
+        self.file.write(layout_header.pack(len(key), len(compiled)) + key + compiled)
+
+        # Physics steps so far
+        self.steps = 0
+        self.records = bytearray()
+        self.chunk_step = 0
+        # Mask of the last STEP and the steps repeating it not logged yet
+        self.last_mask = None
+        self.repeats = 0
+
+        self.keyframe(KEYFRAME)
+
+    def keyframe(self, opcode):
+        self.flush_repeats()
+        state = self.sim.snapshot()
+        self.records.append(opcode)
+        write_varint(self.records, len(state))
+        self.records += struct.pack('<%dd' % len(state), *state)
+        self.track.restart()
+
+    def flush_repeats(self):
+        if self.repeats:
+            self.records.append(REPEAT)
+            write_varint(self.records, self.repeats)
+            self.repeats = 0
+        self.last_mask = None
+
+    # Log paddle locations
+    # Returns the locations as the physics gets them
+    def log_paddles(self, opcode, locations):
+
+        track = self.track
+        mask = 0
+        values = []
+        rounded = {}
+        for (i, paddle) in enumerate(track.paddles):
+            if paddle not in locations:
+                continue
+            mask |= 1 << i
+            (rounded[paddle], (m_x, m_y)) = track.move(
+                i, *track.quantize(locations[paddle]))
+            if opcode == STEP:
+                (last_x, last_y) = track.moves[i]
+                track.moves[i] = (m_x, m_y)
+                values += [m_x - last_x, m_y - last_y]
+            else:
+                values += [m_x, m_y]
+
+        if opcode == STEP and mask == self.last_mask and not any(values):
+            self.repeats += 1
+            return rounded
+
+        self.flush_repeats()
+        self.records.append(opcode | mask << 4)
+        for value in values:
+            write_varint(self.records, zigzag(value))
+        if opcode == STEP:
+            self.last_mask = mask
+        return rounded
+
+    # Log the points paddles go through in the next step
+    # Returns the paths as the physics gets them
+    def log_paths(self, paths):
+
+        track = self.track
+        mask = 0
+        values = []
+        rounded = {}
+        for (i, paddle) in enumerate(track.paddles):
+            if not paths.get(paddle):
+                continue
+            mask |= 1 << i
+            values.append(len(paths[paddle]))
+            (last_x, last_y) = track.bases[i]
+            rounded[paddle] = []
+            for (t, location) in paths[paddle]:
+                ticks = min(time_units, max(0, round(t / self.dt * time_units)))
+                (x, y) = track.quantize(location)
+                values += [ticks, zigzag(x - last_x), zigzag(y - last_y)]
+                (last_x, last_y) = (x, y)
+                rounded[paddle].append((ticks * self.dt / time_units,
+                                        Vector(x / track.units, y / track.units)))
+
+        if mask:
+            self.flush_repeats()
+            self.records.append(PATH | mask << 4)
+            for value in values:
+                write_varint(self.records, value)
+        return rounded
+
+    # See Simulation.step_paddles()
+    def step_paddles(self, locations, dt=None, paths=None):
+
+        if dt is not None and dt != self.dt:
+            raise ValueError("recording at %g s steps, got %g" % (self.dt, dt))
+
+        paths = self.log_paths(paths) if paths else None
+        goals = self.sim.step_paddles(self.log_paddles(STEP, locations), self.dt,
+                                      paths)
+        self.steps += 1
+
+        if goals:
+            self.flush_repeats()
+            for goal in goals:
+                self.records.append(GOAL)
+                write_varint(self.records, goal + 1)
+
+        if self.steps - self.chunk_step >= self.keyframe_steps:
+            self.write_chunk()
+            self.chunk_step = self.steps
+            self.keyframe(KEYFRAME)
+
+        return goals
+
+    # See Simulation.place_paddles()
+    def place_paddles(self, locations):
+        self.sim.place_paddles(self.log_paddles(PLACE, locations))
+
+    def serve(self):
+        self.flush_repeats()
+        self.records.append(SERVE)
+        return self.sim.serve()
+
+    def reset(self):
+        self.flush_repeats()
+        self.records.append(RESET)
+        self.sim.reset()
+
+    def write_chunk(self):
+        self.flush_repeats()
+        data = zlib.compress(bytes(self.records), 9)
+        self.file.write(chunk_header.pack(len(data), self.chunk_step))
+        self.file.write(data)
+        self.file.flush()
+        self.records = bytearray()
+
+    # Log the final state and close the file
+    def close(self):
+        self.keyframe(END)
+        self.write_chunk()
+        self.file.close()
+
+# Reads records out of a chunk
+class Record_Reader:
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def done(self):
+        return self.pos >= len(self.data)
+
+    def byte(self):
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def varint(self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.byte()
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def state(self):
+        length = self.varint()
+        state = struct.unpack_from('<%dd' % length, self.data, self.pos)
+        self.pos += 8 * length
+        return state
+
+class Player:
+
+    def __init__(self, path):
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        (file_magic, file_version, n_pucks, self.dt, units,
+         self.keyframe_steps) = header.unpack_from(data, 0)
+        if file_magic != magic or file_version != version:
+            raise ValueError("%s isn't a version %d replay" % (path, version))
+
+        pos = header.size
+        (key_length, layout_length) = layout_header.unpack_from(data, pos)
+        pos += layout_header.size
+        key = data[pos:pos + key_length].decode()
+        pos += key_length
+        layout = Compiled_Layout.from_bytes(key, data[pos:pos + layout_length])
+        pos += layout_length
+
+        self.sim = physics.Simulation(physics.Table(layout), n_pucks)
+        self.track = Paddle_Track([self.sim.paddle_1, self.sim.paddle_2], units)
+
+        # (first step, offset, length) of every chunk
+        self.chunks = []
+        while pos + chunk_header.size <= len(data):
+            (length, step) = chunk_header.unpack_from(data, pos)
+            pos += chunk_header.size
+            if pos + length > len(data):
+                # Cut short while being written
+                break
+            self.chunks.append((step, pos, length))
+            pos += length
+        self.data = data
+
+        # Chunk playback starts from and the steps played
+        self.chunk = 0
+        self.steps = 0
+        # Goals the playback scored that the log hasn't confirmed yet
+        self.pending = []
+        # Paths of a PATH record, for the next step
+        self.paths = None
+        # State at the end of the log, once played to it
+        self.final_state = None
+
+        self.seek(0)
+
+    # Steps of the keyframes that playback can start from
+    def keyframes(self):
+        return [step for (step, pos, length) in self.chunks]
+
+    def records(self, chunk):
+        (step, pos, length) = self.chunks[chunk]
+        return Record_Reader(zlib.decompress(self.data[pos:pos + length]))
+
+    # Start playback from the keyframe of a chunk
+    def seek(self, chunk):
+        reader = self.records(chunk)
+        if reader.byte() not in (KEYFRAME, END):
+            raise ValueError("chunk %d doesn't start with a keyframe" % chunk)
+        self.sim.restore(reader.state())
+        self.chunk = chunk
+        self.steps = self.chunks[chunk][0]
+        self.pending = []
+        self.paths = None
+
+    # Paddle locations of a STEP or PLACE record
+    def read_paddles(self, reader, opcode, mask):
+
+        track = self.track
+        locations = {}
+        for (i, paddle) in enumerate(track.paddles):
+            if not mask & (1 << i):
+                continue
+            m_x = unzigzag(reader.varint())
+            m_y = unzigzag(reader.varint())
+            if opcode == STEP:
+                (last_x, last_y) = track.moves[i]
+                (m_x, m_y) = (last_x + m_x, last_y + m_y)
+                track.moves[i] = (m_x, m_y)
+            (base_x, base_y) = track.bases[i]
+            (locations[paddle], move) = track.move(i, base_x + m_x, base_y + m_y)
+        return locations
+
+    # Paths of a PATH record, as Recorder.log_paths() gave the physics
+    def read_paths(self, reader, mask):
+
+        track = self.track
+        paths = {}
+        for (i, paddle) in enumerate(track.paddles):
+            if not mask & (1 << i):
+                continue
+            (last_x, last_y) = track.bases[i]
+            paths[paddle] = []
+            for j in range(reader.varint()):
+                ticks = reader.varint()
+                last_x += unzigzag(reader.varint())
+                last_y += unzigzag(reader.varint())
+                paths[paddle].append((ticks * self.dt / time_units,
+                                      Vector(last_x / track.units, last_y / track.units)))
+        return paths
+
+    # Paddle locations of a step repeating the moves of the last one
+    def repeat_paddles(self, mask):
+        track = self.track
+        locations = {}
+        for (i, paddle) in enumerate(track.paddles):
+            if mask & (1 << i):
+                (m_x, m_y) = track.moves[i]
+                (base_x, base_y) = track.bases[i]
+                (locations[paddle], move) = track.move(i, base_x + m_x, base_y + m_y)
+        return locations
+
+    def step(self, locations):
+        self.check_pending()
+        self.pending = self.sim.step_paddles(locations, self.dt, self.paths)
+        self.paths = None
+        self.steps += 1
+
+    def check_pending(self):
+        if self.pending:
+            raise Replay_Mismatch("goal %d at step %d not in the log"
+                                  % (self.pending[0], self.steps))
+
+    # Play a chunk from its keyframe
+    def play_chunk(self, chunk):
+
+        reader = self.records(chunk)
+        mask = 0
+
+        while not reader.done():
+
+            byte = reader.byte()
+            opcode = byte & 0xf
+
+            if opcode == KEYFRAME or opcode == END:
+                # Where the game was, which playback must match
+                state = reader.state()
+                self.check_pending()
+                if self.sim.snapshot() != state:
+                    raise Replay_Mismatch("state differs from the log at step %d"
+                                          % self.steps)
+                if opcode == END:
+                    self.final_state = state
+                self.track.restart()
+
+            elif opcode == STEP:
+                mask = byte >> 4
+                self.step(self.read_paddles(reader, STEP, mask))
+
+            elif opcode == REPEAT:
+                for i in range(reader.varint()):
+                    self.step(self.repeat_paddles(mask))
+
+            elif opcode == PATH:
+                self.paths = self.read_paths(reader, byte >> 4)
+
+            elif opcode == PLACE:
+                self.check_pending()
+                self.sim.place_paddles(self.read_paddles(reader, PLACE, byte >> 4))
+
+            elif opcode == SERVE:
+                self.check_pending()
+                self.sim.serve()
+
+            elif opcode == RESET:
+                self.check_pending()
+                self.sim.reset()
+
+            elif opcode == GOAL:
+                goal = reader.varint() - 1
+                if not self.pending or self.pending.pop(0) != goal:
+                    raise Replay_Mismatch("goal %d at step %d not scored in "
+                                          "playback" % (goal, self.steps))
+
+            else:
+                raise ValueError("bad opcode %d in chunk %d" % (opcode, chunk))
+
+    # Play from the current keyframe to the end of the log, checking the
+    # goals, the keyframes and the final state against it
+    # Returns the final state
+    def run(self):
+        for chunk in range(self.chunk, len(self.chunks)):
+            self.play_chunk(chunk)
+        return self.final_state
+
+# Play a log back as fast as possible and check it
+def main():
+
+    if len(sys.argv) < 2:
+        sys.exit("usage: python replay.py log [keyframe]")
+
+    player = Player(sys.argv[1])
+    if len(sys.argv) > 2:
+        player.seek(int(sys.argv[2]))
+    start_step = player.steps
+
+    start = time.perf_counter()
+    player.run()
+    elapsed = time.perf_counter() - start
+
+    steps = player.steps - start_step
+    print("%d keyframes, played %d steps (%.0f s of game) in %.2f s, %.0f steps/s"
+          % (len(player.chunks), steps, steps * player.dt, elapsed,
+             steps / elapsed if elapsed else 0))
+    print("score %s, final state matches" % (player.sim.score,))
+
+if __name__ == "__main__":
+    main()
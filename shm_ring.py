@@ -0,0 +1,167 @@
+# Paddle positions through a ring buffer in shared memory
+#
+# Reading the FIFO costs a system call and a copy every time. Here the
+# writer puts the same frames as paddle_input.py into the slots of a memory
+# mapped file and the game reads them straight out of the mapping, so a poll
+# with nothing new is a single load of the head counter.
+#
+# Layout, little-endian, with the counters on cache lines of their own:
+#
+#   0     magic u32, slots u32, slot size u32
+#   64    head u64   frames written so far, only moved by the writer
+#   72    full u64   frames the writer dropped because the ring was full
+#   128   tail u64   frames read so far, only moved by the reader
+#   192   the slots, frame number i in slot i % slots
+#
+# There is one writer and one reader. The writer fills slot head % slots and
+# then publishes it by storing head + 1; it never writes a slot the reader
+# hasn't given back by moving tail past it. Python has no memory fences, so
+# the reader relies on loads not being reordered with each other, as on x86.
+# Either side can be started first, whoever comes first creates the ring.
+
+import mmap
+import os
+import struct
+
+from paddle_input import Sample, frame
+
+RING = "/dev/shm/paddle_ring"
+
+ring_magic = 0x474e4952
+# Default number of slots, about 4 s of samples from a 1 kHz tracker
+ring_slots = 4096
+
+header = struct.Struct('<III')
+counter = struct.Struct('<Q')
+head_offset = 64
+full_offset = 72
+tail_offset = 128
+slots_offset = 192
+
+# A frame padded to 32 bytes, so the timestamps stay aligned
+slot = struct.Struct(frame.format + '4x')
+
+def ring_size(slots):
+    return slots_offset + slots * slot.size
+
+class Shm_Ring:
+
+    def __init__(self, path=RING, slots=ring_slots):
+
+        self.path = path
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            (magic, n_slots, slot_size) = header.unpack(
+                os.pread(fd, header.size, 0).ljust(header.size, b'\0'))
+            fresh = magic != ring_magic
+            if fresh:
+                n_slots = slots
+                os.ftruncate(fd, ring_size(slots))
+            elif slot_size != slot.size:
+                raise ValueError("%s has %d byte slots, expected %d"
+                                 % (path, slot_size, slot.size))
+            self.map = mmap.mmap(fd, ring_size(n_slots))
+        finally:
+            os.close(fd)
+
+        self.view = memoryview(self.map)
+        if fresh:
+            self.view[:slots_offset] = bytes(slots_offset)
+            header.pack_into(self.view, 0, ring_magic, n_slots, slot.size)
+
+        self.slots = n_slots
+        self.slot_view = self.view[slots_offset:]
+        self.tail = counter.unpack_from(self.view, tail_offset)[0]
+        # NumPy view of the slots, made by backlog_array()
+        self.array = None
+
+        # Frames taken out of the ring, including the ones latest() skipped
+        self.frames = 0
+
+    def head(self):
+        return counter.unpack_from(self.view, head_offset)[0]
+
+    # Frames the writer couldn't put in because the ring was full
+    @property
+    def dropped(self):
+        return counter.unpack_from(self.view, full_offset)[0]
+
+    # Frames waiting to be read
+    def available(self):
+        return self.head() - self.tail
+
+    def close(self):
+        self.array = None
+        self.slot_view.release()
+        self.view.release()
+        self.map.close()
+
+    # Give the slots up to head back to the writer
+    def release(self, head):
+        self.frames += head - self.tail
+        self.tail = head
+        counter.pack_into(self.view, tail_offset, head)
+
+    # Slot ranges holding the frames from tail to head, split at the wrap
+    def spans(self, head):
+        start = self.tail % self.slots
+        end = start + (head - self.tail)
+        if end <= self.slots:
+            return [(start, end)]
+        return [(start, self.slots), (0, end - self.slots)]
+
+    # Every frame written since the last read, oldest first
+    def backlog(self):
+
+        head = self.head()
+        samples = []
+        for (start, end) in self.spans(head):
+            view = self.slot_view[start * slot.size:end * slot.size]
+            for (magic, sequence, timestamp, paddle, x, y) in slot.iter_unpack(view):
+                samples.append(Sample(sequence, timestamp, paddle, x, y))
+            view.release()
+        self.release(head)
+        return samples
+
+    # Every frame written since the last read as a NumPy record array, with
+    # the fields of the frame
+    def backlog_array(self):
+
+        # Imported here so that readers that don't ask for arrays never pay
+        # for NumPy
+        import numpy as np
+
+        if self.array is None:
+            dtype = np.dtype({
+                'names': ['magic', 'sequence', 'timestamp', 'paddle', 'x', 'y'],
+                'formats': ['<u4', '<u4', '<u8', 'u1', '<f4', '<f4'],
+                'offsets': [0, 4, 8, 16, 20, 24],
+                'itemsize': slot.size})
+            self.array = np.frombuffer(self.slot_view, dtype=dtype,
+                                       count=self.slots)
+
+        head = self.head()
+        # Copied out, as the writer reuses the slots once they are released
+        samples = np.concatenate([self.array[start:end]
+                                  for (start, end) in self.spans(head)])
+        self.release(head)
+        return samples
+
+    # The newest frame of each of up to paddles paddles, skipping the rest
+    # The ring is scanned back from the head and the scan stops once every
+    # paddle has been seen, so with both paddles writing this costs about
+    # the same however far behind the reader is
+    def latest(self, paddles=2):
+
+        head = self.head()
+        found = {}
+        index = head
+        while index > self.tail and len(found) < paddles:
+            index -= 1
+            (magic, sequence, timestamp, paddle, x, y) = slot.unpack_from(
+                self.slot_view, (index % self.slots) * slot.size)
+            if paddle not in found:
+                found[paddle] = Sample(sequence, timestamp, paddle, x, y)
+        self.release(head)
+        return list(found.values())
@@ -0,0 +1,63 @@
+# The batched simulator against Puck.move, see batch.py
+#
+# Run from the repository root:
+#   python -m pytest tests
+
+import math
+
+import numpy as np
+
+import physics
+from batch import Batch
+from vector import Vector
+
+# A simulation with the puck going at velocity from the middle
+def served(velocity):
+    sim = physics.Simulation()
+    sim.puck.velocity = Vector(*velocity)
+    return sim
+
+def assert_same(location, puck):
+    assert math.hypot(location[0] - puck.location.x, location[1] - puck.location.y) < 1e-6
+
+# Pucks gliding between bounces, their next collisions kept from one step
+# to the next, end where stepping each with Puck.move puts them
+def test_matches_move():
+
+    velocities = [(3000 * math.cos(a), 3000 * math.sin(a))
+                  for a in np.linspace(-math.pi, math.pi, 24, endpoint=False)]
+    sim = physics.Simulation()
+    tables = Batch(len(velocities), sim.collidables, sim.puck)
+    tables.velocity[:] = velocities
+    for cycle in range(240):
+        tables.step()
+
+    for (i, velocity) in enumerate(velocities):
+        sim = served(velocity)
+        for cycle in range(240):
+            sim.puck.move(sim.collidables)
+        assert_same(tables.location[i], sim.puck)
+
+# A paddle put in the way of a gliding puck between steps is hit, as it
+# would be by Puck.move
+def test_paddle_moved_in_the_way():
+
+    velocity = (1000, 0)
+    sim = served(velocity)
+    tables = Batch(1, sim.collidables, sim.puck)
+    tables.velocity[:] = velocity
+    paddle = tables.paddles.index(sim.paddle_1)
+    for cycle in range(10):
+        tables.step()
+        sim.puck.move(sim.collidables)
+
+    in_the_way = Vector(sim.puck.location.x + 200, sim.puck.location.y)
+    tables.pad_location[0, paddle] = (in_the_way.x, in_the_way.y)
+    sim.paddle_1.location = in_the_way
+    for cycle in range(60):
+        tables.step()
+        sim.puck.move(sim.collidables)
+
+    assert sim.puck.velocity.x < 0
+    assert_same(tables.location[0], sim.puck)
+    assert math.isclose(tables.velocity[0, 0], sim.puck.velocity.x)
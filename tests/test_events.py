@@ -0,0 +1,58 @@
+# Events against the stepped Simulation, see events.py
+#
+# Run from the repository root:
+#   python -m pytest tests
+
+import math
+
+import events
+import physics
+from vector import Vector
+
+# A simulation with the paddles out of the way and the puck going at
+# velocity from the middle
+def served(velocity):
+    sim = physics.Simulation()
+    for paddle in [sim.paddle_1, sim.paddle_2]:
+        paddle.ghost = True
+    sim.puck.velocity = Vector(*velocity)
+    return sim
+
+def stepped(velocity, seconds):
+    sim = served(velocity)
+    for i in range(round(seconds * physics.clock_freq)):
+        sim.step()
+    return sim.puck
+
+def event_driven(velocity, seconds):
+    sim = served(velocity)
+    events.Events(sim).advance_to(seconds)
+    return sim.puck
+
+def assert_same(puck_1, puck_2):
+    assert (puck_1.location - puck_2.location).mag() < 1e-6
+    assert (puck_1.velocity - puck_2.velocity).mag() < 1e-6
+
+# Thousands of wall bounces in one call stay on the table, as in steps
+def test_long_advance_matches_steps():
+    (velocity, seconds) = ((1, 10000), 1500)
+    puck = event_driven(velocity, seconds)
+    assert_same(puck, stepped(velocity, seconds))
+    assert 0 < puck.location.y < physics.Table().y_len
+
+# Cycles with more bounces than max_bounces end the same way
+def test_bounce_cap_per_cycle(monkeypatch):
+    monkeypatch.setattr(physics, 'max_bounces', 2)
+    (velocity, seconds) = ((3, 300000), 12 / physics.clock_freq)
+    assert_same(event_driven(velocity, seconds), stepped(velocity, seconds))
+
+# A goal is scored once, where Puck.goal() sees it, until the serve
+def test_goal_once():
+    sim = served((-3000, 0))
+    ev = events.Events(sim)
+    assert ev.advance_to(10) == 1
+    assert sim.puck.goal(sim.table) == 1
+    assert math.isclose(ev.time, (1500 + sim.table.border_width) / 3000)
+    assert not ev.advance_to(20)
+    assert not ev.fast_forward()
+    assert sim.score == (0, 1)
@@ -0,0 +1,157 @@
+# The collision kernels against the original physics, see kernels.py
+#
+# The reference is the code the kernels were written from: coll_time() and
+# collide_velocity() of every collidable, and Puck.move over the plain list
+# of collidables, not the CollisionTable that reformulates them too.
+#
+# Run from the repository root:
+#   python -m pytest tests
+
+import math
+import random
+
+import numpy as np
+import pytest
+
+import kernels
+import physics
+from vector import Vector
+
+cases = 2000
+
+# Relative and absolute tolerance on times, locations and velocities
+tolerance = 1e-9
+
+def close(a, b):
+    return abs(a - b) <= tolerance * max(1, abs(a), abs(b))
+
+# Collision times in s below which the puck is taken to be in contact,
+# where rounding decides between another bounce and ghosting a paddle
+contact_time = 1e-12
+
+# The kernels as plain Python, and compiled when Numba is installed
+@pytest.fixture(params=['python', 'numba'])
+def backend(request):
+    if request.param == 'numba':
+        pytest.importorskip('numba')
+        assert physics.select_backend('numba') == 'numba'
+    yield request.param
+    physics.select_backend('python')
+
+# A table with the paddles somewhere random, moving or ghosted, and a puck
+# anywhere the game can put it, heading anywhere
+def random_sim(rng):
+
+    sim = physics.Simulation()
+    table = sim.table
+    for paddle in [sim.paddle_1, sim.paddle_2]:
+        paddle.location = Vector(rng.uniform(0, table.x_len), rng.uniform(0, table.y_len))
+        paddle.velocity = Vector(rng.uniform(-3000, 3000), rng.uniform(-3000, 3000))
+        paddle.ghost = rng.random() < .2
+
+    puck = sim.puck
+    if rng.random() < .2:
+        # In a goal mouth
+        puck.location = Vector(rng.choice([-80, table.x_len + 80]),
+                               rng.uniform(table.goal_y_low, table.goal_y_high))
+    else:
+        puck.location = Vector(rng.uniform(50, table.x_len - 50),
+                               rng.uniform(50, table.y_len - 50))
+    speed = rng.choice([0, rng.uniform(0, 10000)])
+    angle = rng.uniform(0, 2 * math.pi)
+    puck.velocity = Vector(speed * math.cos(angle), speed * math.sin(angle))
+    return sim
+
+# The first collision of every collidable's coll_time()
+def test_first_collision(backend):
+
+    rng = random.Random(1)
+    for i in range(cases):
+        sim = random_sim(rng)
+        puck = sim.puck
+        (ref_time, ref_obj) = physics.first_collision(puck, sim.collidables, None)
+
+        packed = sim.coll_table.packed()
+        packed.load()
+        (time_, kind, row) = kernels.first_collision(
+            packed.walls, packed.circle_rows, packed.skip,
+            puck.location.x, puck.location.y, puck.velocity.x, puck.velocity.y,
+            puck.radius)
+
+        assert (row < 0) == (ref_obj is None), i
+        if ref_obj is not None:
+            # Near ties may go to either object, at the same time
+            assert close(time_, ref_time), i
+
+# Circle.collide_velocity() of pucks hitting moving circles
+def test_circle_velocity(backend):
+
+    rng = random.Random(2)
+    for i in range(cases):
+        circle = physics.Circle(Vector(rng.uniform(0, 1000), rng.uniform(0, 1000)),
+                                rng.uniform(10, 100))
+        circle.velocity = Vector(rng.uniform(-3000, 3000), rng.uniform(-3000, 3000))
+        circle.coll_const = rng.uniform(0, 1)
+        puck = physics.Puck(Vector(rng.uniform(0, 1000), rng.uniform(0, 1000)),
+                            Vector(rng.uniform(-10000, 10000), rng.uniform(-10000, 10000)),
+                            30)
+        if circle.location == puck.location:
+            continue
+
+        row = np.array([[circle.location.x, circle.location.y, circle.radius,
+                         circle.velocity.x, circle.velocity.y, circle.coll_const,
+                         0, 0]])
+        (v_x, v_y) = kernels.circle_velocity(row, 0, puck.location.x, puck.location.y,
+                                             puck.velocity.x, puck.velocity.y,
+                                             puck.max_velocity)
+        expected = circle.collide_velocity(puck, puck.location)
+        assert close(v_x, expected.x) and close(v_y, expected.y), i
+
+# Puck.move from random states for up to half a second, many of them with
+# bounces, the kernel run through Puck.move_packed() so the packing and the
+# ghost flags are checked as well
+def test_move(backend, monkeypatch):
+
+    monkeypatch.setattr(physics, 'compiled_move', kernels.move)
+    rng = random.Random(3)
+    contacts = 0
+    bounced = 0
+    for i in range(cases):
+        seed = rng.random()
+        dt = rng.uniform(0, .5)
+        (ref, kernel) = (random_sim(random.Random(seed)), random_sim(random.Random(seed)))
+
+        # Collision times the reference move sees
+        times = []
+        collidables = ref.collidables
+        def coll_times(obj):
+            query = obj.coll_time
+            def coll_time(puck):
+                result = query(puck)
+                times.append(result)
+                return result
+            return coll_time
+        for obj in collidables:
+            obj.coll_time = coll_times(obj)
+
+        # A list of collidables never goes through the kernels
+        ref.puck.move(collidables, dt)
+        kernel.puck.move(kernel.coll_table, dt)
+
+        same = (close(ref.puck.location.x, kernel.puck.location.x)
+                and close(ref.puck.location.y, kernel.puck.location.y)
+                and close(ref.puck.velocity.x, kernel.puck.velocity.x)
+                and close(ref.puck.velocity.y, kernel.puck.velocity.y)
+                and ref.puck.bounces == kernel.puck.bounces
+                and all(a.ghost == b.ghost for (a, b) in
+                        zip(ref.collidables, kernel.collidables)
+                        if isinstance(a, physics.Circle)))
+        if not same and any(t is not None and abs(t) < contact_time for t in times):
+            contacts += 1
+            continue
+        assert same, i
+        bounced += ref.puck.bounces > 0
+
+    assert bounced > cases / 4
+    # Splits at a contact are rare
+    assert contacts < cases / 100
@@ -0,0 +1,43 @@
+# Paddle_Path playback, see paddle_input.py
+
+import numpy as np
+
+import physics
+from paddle_input import Paddle_Path, max_path_points
+from vector import Vector
+
+speed = 2000
+
+# Where a paddle moving along x at speed is t seconds in
+def line(t):
+    return Vector(500 + speed * t, 500)
+
+# Steps of 60 frames/s of input sampled at rate, fed the way the game does
+def play(rate, arrays):
+    path = Paddle_Path()
+    dt = 1/physics.clock_freq
+    location = line(0)
+    moves = []
+    for i in range(60):
+        ks = range(-(-i * rate // 60), -(-(i + 1) * rate // 60))
+        if arrays:
+            path.extend(np.array([line(k / rate).x for k in ks]),
+                        np.full(len(ks), 500.0),
+                        np.array([k * 10**9 // rate for k in ks]))
+        else:
+            for k in ks:
+                path.add(line(k / rate), k * 10**9 // rate)
+        assert len(path.samples) < 2 * max_path_points
+        for (end, points) in path.steps(location, 2, dt):
+            moves.append((end - location).mag() / dt)
+            location = end
+    return moves
+
+# Timestamped input plays back at the speed it was made, whatever its rate
+def test_speed_kept():
+    for rate in [60, 125, 500, 8000]:
+        for arrays in [False, True]:
+            moves = play(rate, arrays)
+            assert max(moves) < speed * 1.001
+            # Once playback has settled, a quarter of a second in
+            assert min(moves[30:]) > speed * .999
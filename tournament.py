@@ -0,0 +1,378 @@
+# Self-play tournaments between computer opponents, on a process pool
+#
+#   python tournament.py hard medium -n 10000 -o results.jsonl [-j jobs]
+#                        [--seed S] [--set collidables.wall_coll_const=.85]
+#                        [--layout arena.json]
+#   python tournament.py hard medium --match N      # Play one match again
+#
+# Two players, a and b, each an ai.py level, play full matches to win_score
+# with the headless physics, switching sides every match. Matches are split
+# into shards that worker processes play, and every finished match is
+# appended to the results file as one JSON line as soon as its shard comes
+# back. Matches already in the file are skipped, so an interrupted
+# tournament picks up where it stopped. Each shard also comes back with the
+# aggregates of its matches, which are merged into the report at the end:
+# win rates, rally lengths and shot speeds.
+#
+# Every match is seeded from the tournament seed and its number, which set
+# the serves, and the players don't adapt to their time budget, so a match
+# plays out the same every time and on every worker.
+#
+# Serves go at one of the paddles, so that a point starts with a hit. A
+# point is a stall, served again without a point, when it lasts point_time,
+# when no paddle touches the puck for idle_time, or when the puck crawls
+# across the table slower than slow_speed for slow_time, e.g. along the
+# middle line where neither paddle reaches, or in a half whose player only
+# follows it.
+#
+# --set changes a module level constant in every worker before it plays,
+# e.g. the fraction of its speed the puck keeps off the walls; the settings
+# are kept with every match, and resuming with others is refused. --layout
+# plays on another table, see layout.py; each worker compiles it once, or
+# reads it from the cache.
+
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import ai
+import physics
+from vector import Vector
+
+# Most matches a worker plays per task
+shard_size = 8
+
+# Speed of a serve in mm/s, and the most its direction is off the line to
+# the paddle it goes at
+serve_speeds = (1000, 3000)
+serve_angle = math.pi / 12
+
+# Seconds of game time a point can last, and can go without a paddle
+# touching the puck, before the puck is served again
+point_time = 6
+idle_time = 3
+# Speed across the table in mm/s a puck is stuck below, and the seconds it
+# can stay stuck before it's served again
+slow_speed = 300
+slow_time = 2
+# Serves a match can take before it's given up as unfinished
+max_serves = 250
+
+# Width in mm/s of the shot speed histogram bins
+speed_bin = 250
+
+# Set module level constants from ["module.name=value", ...]
+def apply_constants(constants):
+    for setting in constants:
+        (name, value) = setting.split('=', 1)
+        (module, attr) = name.rsplit('.', 1)
+        module = importlib.import_module(module)
+        if not hasattr(module, attr):
+            raise ValueError("%s has no constant %s" % (module.__name__, attr))
+        setattr(module, attr, type(getattr(module, attr))(value))
+
+# Send the pucks off from where they are, each at one of the paddles
+def serve_pucks(sim, rng):
+    for puck in sim.pucks:
+        paddle = rng.choice([sim.paddle_1, sim.paddle_2])
+        to = paddle.location - puck.location
+        angle = math.atan2(to.y, to.x) + rng.uniform(-serve_angle, serve_angle)
+        speed = rng.uniform(*serve_speeds)
+        puck.velocity = Vector(speed * math.cos(angle), speed * math.sin(angle))
+
+# The paddle that just hit the puck, if one did
+# A puck that changed velocity in a step is taken to have been hit by a
+# paddle if it's close enough to have touched it during the step
+def hitter(sim, puck, old_velocity, dt):
+
+    if puck.velocity.x == old_velocity.x and puck.velocity.y == old_velocity.y:
+        return None
+    for paddle in [sim.paddle_1, sim.paddle_2]:
+        reach = puck.radius + paddle.radius \
+                + (puck.velocity.mag() + paddle.velocity.mag()) * dt
+        if (puck.location - paddle.location).mag_sq() <= reach * reach:
+            return paddle
+    return None
+
+# Play match number match between levels a and b
+# Returns the match as a dict of plain values, see the results file
+def play_match(levels, seed, match, layout=None, constants=()):
+
+    rng = random.Random("%d:%d" % (seed, match))
+    dt = 1/physics.clock_freq
+    sim = physics.Simulation(physics.Table(layout))
+    table = sim.table
+
+    # a plays on the left in even matches
+    sides = ('a', 'b') if match % 2 == 0 else ('b', 'a')
+    left_level = levels[0] if sides[0] == 'a' else levels[1]
+    right_level = levels[1] if sides[0] == 'a' else levels[0]
+    players = {
+        sim.paddle_2: ai.Opponent(sim, left_level, sim.paddle_2, dt, budget=None),
+        sim.paddle_1: ai.Opponent(sim, right_level, sim.paddle_1, dt, budget=None),
+    }
+    side_of = {sim.paddle_2: sides[0], sim.paddle_1: sides[1]}
+    sim.place_paddles({sim.paddle_2: Vector(200, table.y_len / 2),
+                       sim.paddle_1: Vector(table.x_len - 200, table.y_len / 2)})
+
+    rallies = []
+    speeds = []
+    shots = {'a': 0, 'b': 0}
+    serves = 1
+    stalls = 0
+    steps = 0
+    point_steps = 0
+    # Steps since a paddle last touched a puck, and since a puck last went
+    # across the table at slow_speed
+    idle_steps = 0
+    slow_steps = 0
+    serve_pucks(sim, rng)
+    winner = None
+    score = sim.score
+
+    while serves <= max_serves:
+
+        velocities = [puck.velocity for puck in sim.pucks]
+        goals = sim.step_paddles({paddle: player.target(dt)
+                                  for (paddle, player) in players.items()}, dt)
+        steps += 1
+        point_steps += 1
+        idle_steps += 1
+
+        for (puck, old_velocity) in zip(sim.pucks, velocities):
+            paddle = hitter(sim, puck, old_velocity, dt)
+            if paddle is not None:
+                shots[side_of[paddle]] += 1
+                speeds.append(round(puck.velocity.mag()))
+                idle_steps = 0
+        if any(abs(puck.velocity.x) < slow_speed for puck in sim.pucks):
+            slow_steps += 1
+        else:
+            slow_steps = 0
+
+        if (goals or point_steps * dt > point_time or idle_steps * dt > idle_time
+                or slow_steps * dt > slow_time):
+            if goals:
+                rallies.append(shots['a'] + shots['b'])
+                # Before a win resets it
+                score = sim.score
+                result = sim.serve()
+                if result:
+                    winner = sides[0] if result < 0 else sides[1]
+                    break
+            else:
+                # Stuck, e.g. pinned by a paddle, serve again without a point
+                stalls += 1
+                for puck in sim.pucks:
+                    puck.reset()
+            shots = {'a': 0, 'b': 0}
+            point_steps = 0
+            idle_steps = 0
+            slow_steps = 0
+            serves += 1
+            serve_pucks(sim, rng)
+
+    score = dict(zip(sides, score))
+    return {
+        'match': match,
+        'seed': seed,
+        'levels': list(levels),
+        'layout': sim.table.layout.key,
+        # --set constants, as applied by the worker
+        'constants': list(constants),
+        'a_side': 'left' if sides[0] == 'a' else 'right',
+        'winner': winner,
+        'score': [score['a'], score['b']],
+        'rallies': rallies,
+        'shot_speeds': speeds,
+        'stalls': stalls,
+        'game_time': steps * dt,
+    }
+
+# Totals over many matches, that can be merged with other totals
+class Aggregate:
+
+    def __init__(self):
+        self.matches = 0
+        # Winner -> matches, with None for unfinished matches
+        self.wins = {'a': 0, 'b': 0, None: 0}
+        # a's wins when playing on the left and on the right
+        self.side_wins = {'left': 0, 'right': 0}
+        self.points = 0
+        self.stalls = 0
+        self.game_time = 0
+        # Rally length -> points
+        self.rallies = {}
+        # Bin of speed_bin mm/s -> shots
+        self.speeds = {}
+
+    def add(self, record):
+        self.matches += 1
+        self.wins[record['winner']] += 1
+        if record['winner'] == 'a':
+            self.side_wins[record['a_side']] += 1
+        self.points += len(record['rallies'])
+        self.stalls += record['stalls']
+        self.game_time += record['game_time']
+        for length in record['rallies']:
+            self.rallies[length] = self.rallies.get(length, 0) + 1
+        for speed in record['shot_speeds']:
+            key = speed // speed_bin
+            self.speeds[key] = self.speeds.get(key, 0) + 1
+
+    def merge(self, other):
+        self.matches += other.matches
+        for (key, count) in other.wins.items():
+            self.wins[key] += count
+        for (key, count) in other.side_wins.items():
+            self.side_wins[key] += count
+        self.points += other.points
+        self.stalls += other.stalls
+        self.game_time += other.game_time
+        for (key, count) in other.rallies.items():
+            self.rallies[key] = self.rallies.get(key, 0) + count
+        for (key, count) in other.speeds.items():
+            self.speeds[key] = self.speeds.get(key, 0) + count
+
+    def report(self):
+
+        finished = self.wins['a'] + self.wins['b']
+        shots = sum(self.speeds.values())
+        return {
+            'matches': self.matches,
+            'unfinished': self.wins[None],
+            'win_rate_a': self.wins['a'] / finished if finished else None,
+            'a_wins_left': self.side_wins['left'],
+            'a_wins_right': self.side_wins['right'],
+            'points': self.points,
+            'stalls': self.stalls,
+            'game_hours': self.game_time / 3600,
+            'rally_mean': sum(length * count for (length, count)
+                              in self.rallies.items()) / max(self.points, 1),
+            'rally_p50': histogram_percentile(self.rallies, .5),
+            'rally_p90': histogram_percentile(self.rallies, .9),
+            'shots': shots,
+            'shot_speed_p50': bin_speed(histogram_percentile(self.speeds, .5)),
+            'shot_speed_p90': bin_speed(histogram_percentile(self.speeds, .9)),
+            'shot_speed_p99': bin_speed(histogram_percentile(self.speeds, .99)),
+            'shot_speed_histogram': {bin_speed(key): count for (key, count)
+                                     in sorted(self.speeds.items())},
+        }
+
+# Value at fraction of the counts of a {value: count} histogram
+def histogram_percentile(histogram, fraction):
+    total = sum(histogram.values())
+    if total == 0:
+        return None
+    seen = 0
+    for (value, count) in sorted(histogram.items()):
+        seen += count
+        if seen > fraction * total:
+            return value
+    return max(histogram)
+
+# Lower end of a shot speed bin in mm/s
+def bin_speed(key):
+    return None if key is None else key * speed_bin
+
+# Play a shard of matches in a worker
+# Returns (records, aggregate)
+def play_shard(levels, seed, matches, layout=None, constants=()):
+    records = [play_match(levels, seed, match, layout, constants) for match in matches]
+    aggregate = Aggregate()
+    for record in records:
+        aggregate.add(record)
+    return (records, aggregate)
+
+# Play matches 0 to n - 1 of a tournament, appending them to out
+# Returns the merged aggregate of every match in out
+def run(levels, n, out, seed=0, jobs=None, constants=(), layout=None):
+
+    layout_key = physics.Table(layout).layout.key
+    aggregate = Aggregate()
+    done = set()
+    if os.path.exists(out):
+        with open(out) as f:
+            for line in f:
+                record = json.loads(line)
+                if record['seed'] != seed or record['levels'] != list(levels) \
+                        or record.get('layout', layout_key) != layout_key \
+                        or record.get('constants', []) != list(constants):
+                    raise ValueError("%s holds matches of another tournament: "
+                                     "seed %d, levels %s, layout %s, constants %s"
+                                     % (out, record['seed'], record['levels'],
+                                        record.get('layout'), record.get('constants')))
+                if record['match'] not in done:
+                    done.add(record['match'])
+                    aggregate.add(record)
+
+    todo = [match for match in range(n) if match not in done]
+    # Smaller shards when there are too few matches to give every worker
+    # one, the pool starts one worker per core by default
+    size = max(1, min(shard_size, -(-len(todo) // (jobs or os.cpu_count() or 1))))
+    shards = [todo[i:i + size] for i in range(0, len(todo), size)]
+    if done:
+        print("%d matches already in %s" % (len(done), out))
+
+    workers = min(jobs or os.cpu_count() or 1, len(shards))
+    start = time.perf_counter()
+    played = 0
+    with open(out, 'a') as f, \
+            ProcessPoolExecutor(jobs, initializer=apply_constants,
+                                initargs=(list(constants),)) as pool:
+        futures = [pool.submit(play_shard, levels, seed, shard, layout, constants)
+                   for shard in shards]
+        for future in as_completed(futures):
+            (records, shard_aggregate) = future.result()
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            aggregate.merge(shard_aggregate)
+            played += len(records)
+            elapsed = time.perf_counter() - start
+            print("\r%d/%d matches, %.3f matches/s on %d workers"
+                  % (played, len(todo), played / elapsed, workers), end='',
+                  file=sys.stderr)
+    if todo:
+        print(file=sys.stderr)
+
+    return aggregate
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('a', choices=ai.levels, help="level of player a")
+    parser.add_argument('b', choices=ai.levels, help="level of player b")
+    parser.add_argument('-n', '--matches', type=int, default=100)
+    parser.add_argument('-o', '--out', default='tournament.jsonl',
+                        help="file the matches are appended to")
+    parser.add_argument('-j', '--jobs', type=int,
+                        help="worker processes (default one per core)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--set', action='append', default=[], metavar='MODULE.NAME=VALUE',
+                        help="change a constant, e.g. collidables.wall_coll_const=.85")
+    parser.add_argument('--layout', metavar='FILE',
+                        help="play on the table described in a JSON file")
+    parser.add_argument('--match', type=int, metavar='N',
+                        help="play match N again and print it")
+    args = parser.parse_args()
+
+    levels = (args.a, args.b)
+    if args.match is not None:
+        apply_constants(args.set)
+        print(json.dumps(play_match(levels, args.seed, args.match, args.layout,
+                                    args.set)))
+        return
+
+    aggregate = run(levels, args.matches, args.out, args.seed, args.jobs, args.set,
+                    args.layout)
+    print(json.dumps(aggregate.report(), indent=2))
+
+if __name__ == "__main__":
+    main()
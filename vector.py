@@ -2,7 +2,10 @@
 
 import math
 
-class Vector:                                                                                    
+class Vector:
+
+    # No instance __dict__, a vector is just its two components
+    __slots__ = ('x', 'y')
 
     def __init__(self, x, y):
         self.x = x
@@ -92,3 +95,84 @@ class Vector:
         normal = flip_axis.normalize()
         return self - 2 * (self * normal) * normal
 
+    # In place operations
+    #
+    # These overwrite the vector (or the given out vector) instead of
+    # allocating a new one, and return it so calls can be chained. Only use
+    # them on vectors nothing else holds on to.
+
+    def set(self, x, y):
+        self.x = x
+        self.y = y
+        return self
+
+    def copy(self):
+        return Vector(self.x, self.y)
+
+    def iadd(self, v2):
+        self.x += v2.x
+        self.y += v2.y
+        return self
+
+    def isub(self, v2):
+        self.x -= v2.x
+        self.y -= v2.y
+        return self
+
+    def iscale(self, scaler):
+        self.x *= scaler
+        self.y *= scaler
+        return self
+
+    # Add scaler * v2, e.g. location.iadd_scaled(velocity, time)
+    def iadd_scaled(self, v2, scaler):
+        self.x += v2.x * scaler
+        self.y += v2.y * scaler
+        return self
+
+    def normalize_into(self, out):
+
+        mag = self.mag()
+
+        if mag == 0:
+            # Zero length vectors have no normal
+            return None
+
+        return out.set(self.x / mag, self.y / mag)
+
+    def projection_into(self, proj_axis, out):
+        mag = proj_axis.mag()
+        n_x = proj_axis.x / mag
+        n_y = proj_axis.y / mag
+        dot = self.x * n_x + self.y * n_y
+        return out.set(n_x * dot, n_y * dot)
+
+    def flip_into(self, flip_axis, out):
+        mag = flip_axis.mag()
+        n_x = flip_axis.x / mag
+        n_y = flip_axis.y / mag
+        dot2 = 2 * (self.x * n_x + self.y * n_y)
+        return out.set(self.x - dot2 * n_x, self.y - dot2 * n_y)
+
+# Vectors preallocated for temporaries in a hot loop
+#
+# get() hands out the next free vector and reset() makes all of them free
+# again, so a function that resets on entry can use as many temporaries as
+# it likes without allocating after the first call.
+class Scratch:
+
+    __slots__ = ('vectors', 'used')
+
+    def __init__(self, size=4):
+        self.vectors = [Vector(0, 0) for i in range(size)]
+        self.used = 0
+
+    def get(self, x=0, y=0):
+        if self.used == len(self.vectors):
+            self.vectors.append(Vector(0, 0))
+        v = self.vectors[self.used]
+        self.used += 1
+        return v.set(x, y)
+
+    def reset(self):
+        self.used = 0
@@ -1,27 +1,222 @@
+// Writes framed paddle positions to /tmp/fifo, see paddle_input.py
+//
+// Usage: write_fifo [--ring] [rate_hz] [paddle] [count] [burst]
+//
+//   --ring   write into the shared memory ring /dev/shm/paddle_ring instead,
+//            see shm_ring.py
+//
+//   rate_hz  frames per second, 1000 by default
+//   paddle   paddle id written in the frames, 0 by default
+//   count    frames to send before exiting, 0 (the default) sends forever
+//   burst    frames packed into every write, 1 by default
+//
+// The paddle moves around a circle on its half of the table. With a high
+// rate and a large burst it doubles as a load generator for the reader.
+//
+// Build with: g++ -O2 -o write_fifo write_fifo.cpp
+
+#include <math.h>
+#include <stdint.h>
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
+#include <time.h>
 #include <fcntl.h>
+#include <sys/mman.h>
 #include <sys/stat.h>
 #include <sys/types.h>
 #include <unistd.h>
+#include <vector>
+
+static const uint32_t frame_magic = 0x46504841;
+
+// Matches struct '<IIQB3xff' in paddle_input.py
+#pragma pack(push, 1)
+struct Frame {
+    uint32_t magic;
+    uint32_t sequence;
+    uint64_t timestamp;
+    uint8_t paddle;
+    uint8_t padding[3];
+    float x;
+    float y;
+};
+#pragma pack(pop)
+
+static_assert(sizeof(Frame) == 28, "frame layout must match the reader");
+
+// Layout of the ring in shm_ring.py
+static const uint32_t ring_magic = 0x474e4952;
+static const uint32_t ring_slots = 4096;
+
+struct Ring_Header {
+    uint32_t magic;
+    uint32_t slots;
+    uint32_t slot_size;
+    uint8_t padding_1[52];
+    uint64_t head;
+    uint64_t full;
+    uint8_t padding_2[48];
+    uint64_t tail;
+    uint8_t padding_3[56];
+};
+
+struct Slot {
+    Frame frame;
+    uint8_t padding[4];
+};
+
+static_assert(sizeof(Ring_Header) == 192, "ring header must match the reader");
+static_assert(sizeof(Slot) == 32, "ring slots must match the reader");
+
+struct Ring {
+    Ring_Header *header;
+    Slot *slots;
+};
+
+// Map the ring, creating it if the reader hasn't yet
+static bool open_ring(const char *path, Ring &ring) {
+    int fd = open(path, O_RDWR | O_CREAT, 0666);
+    if (fd < 0) {
+        perror("open");
+        return false;
+    }
+    Ring_Header header;
+    memset(&header, 0, sizeof(header));
+    bool fresh = pread(fd, &header, sizeof(header), 0) != sizeof(header)
+                 || header.magic != ring_magic;
+    uint32_t slots = fresh ? ring_slots : header.slots;
+    if (!fresh && header.slot_size != sizeof(Slot)) {
+        fprintf(stderr, "%s has %u byte slots\n", path, header.slot_size);
+        return false;
+    }
+    size_t size = sizeof(Ring_Header) + (size_t)slots * sizeof(Slot);
+    if (fresh && ftruncate(fd, size) < 0) {
+        perror("ftruncate");
+        return false;
+    }
+    void *map = mmap(NULL, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if (map == MAP_FAILED) {
+        perror("mmap");
+        return false;
+    }
+    ring.header = (Ring_Header *)map;
+    ring.slots = (Slot *)((char *)map + sizeof(Ring_Header));
+    if (fresh) {
+        memset(ring.header, 0, sizeof(Ring_Header));
+        ring.header->slots = slots;
+        ring.header->slot_size = sizeof(Slot);
+        __atomic_store_n(&ring.header->magic, ring_magic, __ATOMIC_RELEASE);
+    }
+    return true;
+}
 
+// Copy frames into the ring, dropping those that don't fit
+static void ring_write(Ring &ring, const Frame *frames, int n) {
+    Ring_Header *h = ring.header;
+    uint64_t head = h->head;
+    uint64_t tail = __atomic_load_n(&h->tail, __ATOMIC_ACQUIRE);
+    uint64_t space = h->slots - (head - tail);
+    uint64_t fit = (uint64_t)n < space ? n : space;
+    for (uint64_t i = 0; i < fit; i++) {
+        ring.slots[(head + i) % h->slots].frame = frames[i];
+    }
+    // Publish the slots only once they are written
+    __atomic_store_n(&h->head, head + fit, __ATOMIC_RELEASE);
+    if (fit < (uint64_t)n) {
+        __atomic_store_n(&h->full, h->full + (n - fit), __ATOMIC_RELAXED);
+    }
+}
+
+static uint64_t now_ns() {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint64_t)ts.tv_sec * 1000000000ull + ts.tv_nsec;
+}
+
+int main(int argc, char **argv) {
+    const char *fifo = "/tmp/fifo";
+    const char *ring_path = "/dev/shm/paddle_ring";
+    bool use_ring = argc > 1 && strcmp(argv[1], "--ring") == 0;
+    if (use_ring) {
+        argc--;
+        argv++;
+    }
+    double rate = argc > 1 ? atof(argv[1]) : 1000;
+    int paddle = argc > 2 ? atoi(argv[2]) : 0;
+    long count = argc > 3 ? atol(argv[3]) : 0;
+    int burst = argc > 4 ? atoi(argv[4]) : 1;
+    if (rate <= 0 || burst <= 0) {
+        fprintf(stderr, "usage: write_fifo [--ring] [rate_hz] [paddle] [count] [burst]\n");
+        return 1;
+    }
+
+    Ring ring = {NULL, NULL};
+    int fd = -1;
+    if (use_ring) {
+        if (!open_ring(ring_path, ring)) {
+            return 1;
+        }
+    } else {
+        mkfifo(fifo, 0666);
+        fd = open(fifo, O_WRONLY);
+        if (fd < 0) {
+            perror("open");
+            return 1;
+        }
+    }
+
+    std::vector<Frame> frames(burst);
+    uint64_t period = (uint64_t)(1e9 * burst / rate);
+    uint64_t start = now_ns();
+    uint64_t next = start;
+    uint32_t sequence = 0;
+    long sent = 0;
+
+    // Circle on the paddle's half of the 3000 x 1000 mm table
+    double cx = paddle == 0 ? 2250 : 750;
+
+    while (count == 0 || sent < count) {
+        int n = burst;
+        if (count != 0 && count - sent < n) {
+            n = count - sent;
+        }
+        for (int i = 0; i < n; i++) {
+            uint64_t t = now_ns();
+            double ang = 2 * M_PI * (t - start) / 2e9;
+            Frame &f = frames[i];
+            memset(&f, 0, sizeof(f));
+            f.magic = frame_magic;
+            f.sequence = sequence++;
+            f.timestamp = t;
+            f.paddle = paddle;
+            f.x = cx + 400 * cos(ang);
+            f.y = 500 + 300 * sin(ang);
+        }
+        if (use_ring) {
+            ring_write(ring, frames.data(), n);
+        } else if (write(fd, frames.data(), n * sizeof(Frame)) < 0) {
+            perror("write");
+            return 1;
+        }
+        sent += n;
+
+        next += period;
+        struct timespec ts;
+        ts.tv_sec = next / 1000000000ull;
+        ts.tv_nsec = next % 1000000000ull;
+        clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, &ts, NULL);
+    }
 
-int main() {
-    int fd;
-    char *fifo = "/tmp/fifo";
-    mkfifo(fifo, 0666);
-
-    int a = 1;
-    int b = 1;
-    int c = a+b;
-    fd = open(fifo, O_WRONLY);
-    while (1) {
-        write(fd, &c, 4);
-        printf("just wrote %d to pipe\n", c);
-        a = b;
-        b = c;
-        c = a+b;
-        sleep(1);
+    double secs = (now_ns() - start) / 1e9;
+    fprintf(stderr, "sent %ld frames in %.3f s (%.0f frames/s)\n",
+            sent, secs, sent / secs);
+    if (use_ring) {
+        fprintf(stderr, "%llu frames dropped with the ring full\n",
+                (unsigned long long)ring.header->full);
+    } else {
+        close(fd);
     }
     return 0;
 }